@@ -22,14 +22,22 @@
 # IN THE SOFTWARE.
 
 import argparse
+import collections
 from datetime import datetime, timezone
 import queue
 import serial
+import sys
 import threading
 import time
 
 
 class SerialBuffer:
+    # How much of the serial output file to read at once
+    FILE_READ_SIZE = 64 * 1024
+
+    # How many chunks of bytes the lines thread handles at once at most
+    MAX_BATCH_CHUNKS = 256
+
     def __init__(self, dev, filename, prefix, timeout=None, line_queue=None):
         self.filename = filename
         self.dev = dev
@@ -49,6 +57,8 @@ class SerialBuffer:
             self.line_queue = line_queue
         else:
             self.line_queue = queue.Queue()
+        # Lines taken from the line queue but not yet returned by lines()
+        self.pending_lines = collections.deque()
         self.prefix = prefix
         self.timeout = timeout
         self.sentinel = object()
@@ -83,7 +93,8 @@ class SerialBuffer:
 
         while not self.closing:
             try:
-                b = self.serial.read()
+                # Take everything the device has buffered, or wait for a byte
+                b = self.serial.read(self.serial.in_waiting or 1)
                 if len(b) == 0:
                     break
                 self.byte_queue.put(b)
@@ -99,9 +110,9 @@ class SerialBuffer:
         self.byte_queue.put(greet.encode())
 
         while not self.closing:
-            line = self.f.readline()
-            if line:
-                self.byte_queue.put(line)
+            data = self.f.read(self.FILE_READ_SIZE)
+            if data:
+                self.byte_queue.put(data)
             else:
                 time.sleep(0.1)
         self.byte_queue.put(self.sentinel)
@@ -110,32 +121,49 @@ class SerialBuffer:
     # file, 3) add to the queue of lines to be read by program logic
 
     def serial_lines_thread_loop(self):
-        line = bytearray()
-        while True:
-            bytes = self.byte_queue.get(block=True)
+        pending = bytearray()
+        done = False
+        while not done:
+            # Handle all the chunks read meanwhile at once
+            chunks = [self.byte_queue.get(block=True)]
+            while chunks[-1] is not self.sentinel and len(chunks) < self.MAX_BATCH_CHUNKS:
+                try:
+                    chunks.append(self.byte_queue.get_nowait())
+                except queue.Empty:
+                    break
+            if chunks[-1] is self.sentinel:
+                chunks.pop()
+                done = True
 
-            if bytes == self.sentinel:
-                self.read_thread.join()
-                self.line_queue.put(self.sentinel)
-                break
+            data = b"".join(chunks)
 
             # Write our data to the output file if we're the ones reading from
             # the serial device
-            if self.dev:
-                self.f.write(bytes)
+            if self.dev and data:
+                self.f.write(data)
                 self.f.flush()
 
-            for b in bytes:
-                line.append(b)
-                if b == b'\n'[0]:
-                    line = line.decode(errors="replace")
-
-                    time = datetime.now().strftime('%y-%m-%d %H:%M:%S')
-                    print("{endc}{time} {prefix}{line}".format(
-                        time=time, prefix=self.prefix, line=line, endc='\033[0m'), flush=True, end='')
+            # Only complete lines are handled, a partial one stays pending
+            # until the rest of it is read.
+            pending += data
+            end = pending.rfind(b'\n') + 1
+            if not end:
+                continue
+            with memoryview(pending)[:end] as view:
+                lines = str(view, errors="replace").split('\n')[:-1]
+            del pending[:end]
+
+            timestamp = datetime.now().strftime('%y-%m-%d %H:%M:%S')
+            sys.stdout.write("".join(
+                "{endc}{time} {prefix}{line}\n".format(
+                    time=timestamp, prefix=self.prefix, line=line, endc='\033[0m')
+                for line in lines))
+            sys.stdout.flush()
+
+            self.line_queue.put([line + '\n' for line in lines])
 
-                    self.line_queue.put(line)
-                    line = bytearray()
+        self.read_thread.join()
+        self.line_queue.put(self.sentinel)
 
     def lines(self, timeout=None, phase=None):
         start_time = time.monotonic()
@@ -148,19 +176,23 @@ class SerialBuffer:
                     self.close()
                     break
 
-            try:
-                line = self.line_queue.get(timeout=read_timeout)
-            except queue.Empty:
-                print("read timeout waiting for serial during {}".format(phase))
-                self.close()
-                break
+            if not self.pending_lines:
+                try:
+                    lines = self.line_queue.get(timeout=read_timeout)
+                except queue.Empty:
+                    print("read timeout waiting for serial during {}".format(phase))
+                    self.close()
+                    break
 
-            if line == self.sentinel:
-                print("End of serial output")
-                self.lines_thread.join()
-                break
+                if lines == self.sentinel:
+                    print("End of serial output")
+                    self.lines_thread.join()
+                    break
+
+                # The lines thread queues all the lines it handled at once
+                self.pending_lines.extend(lines)
 
-            yield line
+            yield self.pending_lines.popleft()
 
 
 def main():
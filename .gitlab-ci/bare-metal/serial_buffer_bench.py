@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+# SPDX-License-Identifier: MIT
+
+"""Measure how fast serial_buffer.py processes a recorded serial log.
+
+Replays the log through the file-read path of SerialBuffer, with its stdout
+output discarded, and reports the throughput and the CPU time used by all of
+its threads. Without a log, a synthetic kernel-like log is used. With -b, the
+serial_buffer.py of another git revision is measured too, e.g.
+
+  ./serial_buffer_bench.py serial.log -b HEAD~1
+"""
+
+import argparse
+import contextlib
+import importlib.util
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+BARE_METAL_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def load_serial_buffer(path, name):
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def write_synthetic_log(f, num_lines):
+    for i in range(num_lines):
+        f.write(b"[%5d.%06d] mmc0: new HS400 MMC card at address 0001, "
+                b"line %d of the synthetic log\r\n" % (i // 1000, i % 1000, i))
+
+
+def replay(module, log):
+    """Return the wall and CPU time SerialBuffer takes to read log."""
+    with open(log, "rb") as f:
+        # Every line, plus the greeting of the read thread
+        num_lines = f.read().count(b"\n") + 1
+
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        ser = module.SerialBuffer(None, log, "bench: ")
+        for n, line in enumerate(ser.lines(), 1):
+            if n == num_lines:
+                break
+        ser.close()
+    return time.perf_counter() - wall_start, time.process_time() - cpu_start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("log", nargs="?",
+                        help="recorded serial log (default: a synthetic log)")
+    parser.add_argument("-n", "--lines", type=int, default=200000,
+                        help="number of lines of the synthetic log "
+                             "(default: %(default)s)")
+    parser.add_argument("-b", "--baseline", metavar="REV",
+                        help="also measure serial_buffer.py at git revision REV")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="serial_buffer_bench") as tmp:
+        log = args.log
+        if log is None:
+            log = os.path.join(tmp, "serial.log")
+            with open(log, "wb") as f:
+                write_synthetic_log(f, args.lines)
+
+        implementations = [
+            ("current", os.path.join(BARE_METAL_DIR, "serial_buffer.py"))]
+        if args.baseline:
+            path = os.path.join(tmp, "serial_buffer_baseline.py")
+            with open(path, "wb") as f:
+                f.write(subprocess.check_output(
+                    ["git", "show", args.baseline + ":./serial_buffer.py"],
+                    cwd=BARE_METAL_DIR))
+            implementations.append((args.baseline, path))
+
+        size = os.path.getsize(log)
+        print(f"{'implementation':<16} {'wall (s)':>9} {'cpu (s)':>9} {'MB/s':>9}")
+        for i, (name, path) in enumerate(implementations):
+            module = load_serial_buffer(path, f"serial_buffer_{i}")
+            wall, cpu = replay(module, log)
+            print(f"{name:<16} {wall:>9.3f} {cpu:>9.3f} {size / wall / 1e6:>9.2f}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+# SPDX-License-Identifier: MIT
+
+"""Follow many LAVA jobs from a single process.
+
+This is an asyncio counterpart of follow_job_execution() and
+retriable_follow_job() from lava_job_submitter.py. Instead of sleeping a fixed
+time between XML-RPC calls, every job polls with an adaptive backoff: quickly
+while its log is flowing, and less and less often while it waits in the queue
+or stays silent. Log batches are parsed with the LibYAML loader when available,
+and a corrupted batch only costs refetching the lines after its last complete
+entry.
+
+The XML-RPC calls block, so they run in a thread pool. Every job is followed
+by a single task, so a job's proxy is never used by two threads at once.
+"""
+
+import argparse
+import asyncio
+import random
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from os import getenv
+from typing import Callable, Optional
+
+import yaml
+from lava.exceptions import MesaCIException, MesaCIParseException, MesaCIRetryError
+from lava.lava_job_submitter import (
+    DEVICE_HANGING_TIMEOUT_SEC,
+    NUMBER_OF_RETRIES_TIMEOUT_DETECTION,
+    LAVAJob,
+    _call_proxy,
+    check_job_alive,
+    find_lava_error,
+    parse_lava_lines,
+    print_log,
+    setup_lava_proxy,
+    show_job_data,
+)
+
+# Shortest and longest time in seconds to wait between two polls of a job.
+MIN_POLLING_TIME_SEC = float(getenv("LAVA_MIN_POLLING_TIME_SEC", 1))
+MAX_POLLING_TIME_SEC = float(getenv("LAVA_MAX_POLLING_TIME_SEC", 30))
+
+# How many log batches in a row may fail to parse before giving up.
+NUMBER_OF_PARSE_ATTEMPTS = 5
+
+# How many XML-RPC calls may be in flight at once.
+MAX_WORKERS = int(getenv("LAVA_FOLLOWER_MAX_WORKERS", 32))
+
+YAML_LOADER = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+
+class AdaptiveBackoff:
+    """Polling delay which grows while nothing happens and drops back to the
+    minimum as soon as something does.
+
+    Some jitter keeps the jobs submitted together from polling in lockstep.
+    """
+
+    def __init__(self, minimum, maximum, factor=1.5, jitter=0.1):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.factor = factor
+        self.jitter = jitter
+        self.delay = minimum
+
+    def reset(self) -> None:
+        self.delay = self.minimum
+
+    def next(self) -> float:
+        delay = self.delay
+        self.delay = min(self.delay * self.factor, self.maximum)
+        return delay * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+
+def load_log_batch(data: str) -> tuple[list[dict], bool]:
+    """Parse a batch of LAVA log lines.
+
+    LAVA sends the log as a YAML list with one entry per line. If the batch
+    does not parse as a whole, e.g. because the XML-RPC packet was truncated,
+    the entries before the first broken one are still returned.
+
+    Returns:
+        tuple[list[dict], bool]: the log lines, and whether that is the whole
+        batch
+    """
+    try:
+        lines = yaml.load(data, Loader=YAML_LOADER) or []
+        if isinstance(lines, list):
+            return lines, True
+    except yaml.YAMLError:
+        pass
+
+    entries = []
+    for line in data.splitlines(True):
+        if line.startswith("- "):
+            entries.append(line)
+        elif entries and line[:1].isspace():
+            entries[-1] += line
+        else:
+            break
+
+    # A truncated last entry may still be valid YAML, so always leave it to
+    # the next poll.
+    lines = []
+    for entry in entries[:-1]:
+        try:
+            lines += yaml.load(entry, Loader=YAML_LOADER)
+        except yaml.YAMLError:
+            break
+    return lines, False
+
+
+class LAVAJobFollower:
+    def __init__(
+        self,
+        max_workers: int = MAX_WORKERS,
+        min_polling_time: float = MIN_POLLING_TIME_SEC,
+        max_polling_time: float = MAX_POLLING_TIME_SEC,
+        max_idle_time: timedelta = timedelta(seconds=DEVICE_HANGING_TIMEOUT_SEC),
+        output: Optional[Callable[[LAVAJob, str], None]] = None,
+    ):
+        self.executor = ThreadPoolExecutor(max_workers)
+        self.min_polling_time = min_polling_time
+        self.max_polling_time = max_polling_time
+        self.max_idle_time = max_idle_time
+        self.output = output or (lambda job, line: print_log(f"[{job.job_id}] {line}"))
+
+    def close(self) -> None:
+        self.executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    async def _run(self, fn, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, fn, *args)
+
+    def _backoff(self) -> AdaptiveBackoff:
+        return AdaptiveBackoff(self.min_polling_time, self.max_polling_time)
+
+    async def _fetch_logs(self, job: LAVAJob, parse_failures: int) -> tuple[bool, int]:
+        """Fetch and print the new lines of the job log.
+
+        Returns:
+            tuple[bool, int]: whether there were new lines, and the number
+            of batches in a row which could not be parsed completely
+        """
+        finished, data = await self._run(
+            _call_proxy, job.proxy.scheduler.jobs.logs, job.job_id, job.last_log_line
+        )
+        lines, complete = load_log_batch(str(data))
+
+        if complete:
+            parse_failures = 0
+        else:
+            parse_failures += 1
+            if parse_failures >= NUMBER_OF_PARSE_ATTEMPTS:
+                raise MesaCIParseException(
+                    f"Could not parse the logs of LAVA job {job.job_id}."
+                )
+
+        # The lines after a broken entry are fetched again on the next poll
+        job.is_finished = finished and complete
+        if lines:
+            job.heartbeat()
+            job.last_log_line += len(lines)
+
+        for line in parse_lava_lines(lines):
+            self.output(job, line)
+        job.parse_job_result_from_log(lines)
+
+        return bool(lines), parse_failures
+
+    async def follow(self, job: LAVAJob) -> None:
+        """Submit the job and follow it until it finishes, like
+        follow_job_execution() does."""
+        try:
+            await self._run(job.submit)
+        except Exception as mesa_ci_err:
+            raise MesaCIException(
+                f"Could not submit LAVA job. Reason: {mesa_ci_err}"
+            ) from mesa_ci_err
+
+        print_log(f"Waiting for job {job.job_id} to start.")
+        backoff = self._backoff()
+        while not await self._run(job.is_started):
+            await asyncio.sleep(backoff.next())
+        print_log(f"Job {job.job_id} started.")
+
+        backoff.reset()
+        parse_failures = 0
+        job.heartbeat()
+        while not job.is_finished:
+            check_job_alive(job, self.max_idle_time)
+            new_lines, parse_failures = await self._fetch_logs(job, parse_failures)
+            if job.is_finished:
+                break
+            if new_lines:
+                backoff.reset()
+            await asyncio.sleep(backoff.next())
+
+        await self._run(show_job_data, job)
+
+        if job.status not in ["pass", "fail"]:
+            await self._run(find_lava_error, job)
+
+    async def retriable_follow(self, proxy, job_definition) -> LAVAJob:
+        """Follow a job, and resubmit it on failures, like
+        retriable_follow_job() does."""
+        retry_count = NUMBER_OF_RETRIES_TIMEOUT_DETECTION
+
+        for attempt_no in range(1, retry_count + 2):
+            job = LAVAJob(proxy, job_definition)
+            try:
+                await self.follow(job)
+                return job
+            except MesaCIException as mesa_exception:
+                print_log(mesa_exception)
+                await self._run(job.cancel)
+            except asyncio.CancelledError:
+                print_log(f"Following LAVA job {job.job_id} was cancelled. Cancelling the job.")
+                # Off the event loop like every other call, and shielded so
+                # that the job is cancelled even if the task is cancelled again
+                await asyncio.shield(self._run(job.cancel))
+                raise
+            finally:
+                print_log(f"Finished executing LAVA job in the attempt #{attempt_no}")
+
+        raise MesaCIRetryError(
+            "Job failed after it exceeded the number of " f"{retry_count} retries.",
+            retry_count=retry_count,
+        )
+
+    async def follow_many(self, jobs) -> list:
+        """Follow (proxy, job definition) pairs concurrently.
+
+        Returns:
+            list: the finished LAVAJob, or the exception raised while following
+            it, of every pair
+        """
+        return await asyncio.gather(
+            *(self.retriable_follow(proxy, definition) for proxy, definition in jobs),
+            return_exceptions=True,
+        )
+
+
+def main(args):
+    jobs = []
+    for path in args.definitions:
+        with open(path) as f:
+            jobs.append((setup_lava_proxy(), f.read()))
+
+    with LAVAJobFollower(max_workers=args.max_workers) as follower:
+        results = asyncio.run(follower.follow_many(jobs))
+
+    exit_code = 0
+    for path, result in zip(args.definitions, results):
+        if isinstance(result, LAVAJob):
+            status = result.status
+        else:
+            status = f"error: {result}"
+        print_log(f"{path}: {status}")
+        if status != "pass":
+            exit_code = 1
+    sys.exit(exit_code)
+
+
+def create_parser():
+    parser = argparse.ArgumentParser("LAVA job follower")
+
+    parser.add_argument("definitions", nargs="+", metavar="DEFINITION",
+                        help="LAVA job definition (YAML) to submit and follow")
+    parser.add_argument("--max-workers", type=int, default=MAX_WORKERS,
+                        help="maximum number of concurrent XML-RPC calls")
+
+    return parser
+
+
+if __name__ == "__main__":
+    sys.stdout.reconfigure(line_buffering=True)
+    sys.stderr.reconfigure(line_buffering=True)
+
+    parser = create_parser()
+    args = parser.parse_args()
+    main(args)
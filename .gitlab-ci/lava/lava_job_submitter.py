@@ -447,9 +447,9 @@ def parse_lava_lines(new_lines) -> list[str]:
     return parsed_lines
 
 
-def fetch_logs(job, max_idle_time) -> None:
-    # Poll to check for new logs, assuming that a prolonged period of
-    # silence means that the device has died and we should try it again
+def check_job_alive(job, max_idle_time) -> None:
+    # A prolonged period of silence means that the device has died and we
+    # should try it again
     if datetime.now() - job.last_log_time > max_idle_time:
         max_idle_time_min = max_idle_time.total_seconds() / 60
         print_log(
@@ -463,6 +463,11 @@ def fetch_logs(job, max_idle_time) -> None:
             timeout_duration=max_idle_time,
         )
 
+
+def fetch_logs(job, max_idle_time) -> None:
+    # Poll to check for new logs
+    check_job_alive(job, max_idle_time)
+
     time.sleep(LOG_POLLING_TIME_SEC)
 
     # The XMLRPC binary packet may be corrupted, causing a YAML scanner error.
@@ -0,0 +1,144 @@
+"""A local XML-RPC server which implements the parts of the LAVA scheduler API
+used by the LAVA job submitter and follower.
+
+The job definition submitted to it is a YAML dict which tells how the job
+behaves, e.g.:
+
+    queued_polls: 2       # job_state is "Submitted" for the first 2 polls
+    log: [a, b, c]        # messages the target prints
+    result: pass          # the hwci result printed after the log
+    lines_per_call: 10    # how many new log lines each logs() call produces
+    corrupt_calls: [2]    # logs() calls whose data is truncated
+    hang: false           # whether the job never prints anything
+"""
+
+import socketserver
+import threading
+import xmlrpc.client
+from itertools import count
+from xmlrpc.server import SimpleXMLRPCServer
+
+import yaml
+
+
+class FakeJob:
+    def __init__(self, definition):
+        spec = yaml.safe_load(definition) or {}
+        self.queued_polls = spec.get("queued_polls", 0)
+        self.lines_per_call = spec.get("lines_per_call", 10)
+        self.corrupt_calls = set(spec.get("corrupt_calls", []))
+        self.hang = spec.get("hang", False)
+        self.lines = [
+            {"dt": "2022-06-01 00:00:00", "lvl": "target", "msg": msg}
+            for msg in spec.get("log", [])
+        ]
+        self.lines.append(
+            {
+                "dt": "2022-06-01 00:00:01",
+                "lvl": "target",
+                "msg": f"hwci: mesa: {spec.get('result', 'pass')}",
+            }
+        )
+        self.produced = 0
+        self.log_calls = 0
+        self.state_polls = 0
+        self.cancelled = False
+
+    def logs(self, offset):
+        self.log_calls += 1
+        if self.hang:
+            return False, ""
+
+        self.produced = min(self.produced + self.lines_per_call, len(self.lines))
+        # One flow mapping per line, like LAVA does
+        data = "".join(
+            "- " + yaml.safe_dump(line, default_flow_style=True, width=10000)
+            for line in self.lines[offset:self.produced]
+        )
+        if self.log_calls in self.corrupt_calls:
+            data = data[: len(data) * 2 // 3]
+        return self.produced == len(self.lines), data
+
+    def state(self):
+        self.state_polls += 1
+        if self.state_polls <= self.queued_polls:
+            return "Submitted"
+        return "Running"
+
+
+class _Jobs:
+    def __init__(self, scheduler):
+        self._scheduler = scheduler
+
+    def validate(self, definition, strict):
+        return {}
+
+    def submit(self, definition):
+        with self._scheduler.lock:
+            job_id = str(next(self._scheduler.ids))
+            self._scheduler.jobs[job_id] = FakeJob(definition)
+        return job_id
+
+    def cancel(self, job_id):
+        with self._scheduler.lock:
+            self._scheduler.jobs[job_id].cancelled = True
+        return True
+
+    def logs(self, job_id, line):
+        with self._scheduler.lock:
+            return self._scheduler.jobs[job_id].logs(line)
+
+    def show(self, job_id):
+        with self._scheduler.lock:
+            return {"id": job_id, "state": self._scheduler.jobs[job_id].state()}
+
+
+class _Scheduler:
+    def __init__(self, scheduler):
+        self._scheduler = scheduler
+        self.jobs = _Jobs(scheduler)
+
+    def job_state(self, job_id):
+        with self._scheduler.lock:
+            return {"job_state": self._scheduler.jobs[job_id].state()}
+
+
+class _Results:
+    def get_testjob_results_yaml(self, job_id):
+        return yaml.safe_dump([{"metadata": {"result": "pass"}}])
+
+
+class _API:
+    def __init__(self, scheduler):
+        self.scheduler = _Scheduler(scheduler)
+        self.results = _Results()
+
+
+class _ThreadingXMLRPCServer(socketserver.ThreadingMixIn, SimpleXMLRPCServer):
+    daemon_threads = True
+
+
+class FakeScheduler:
+    """Serve the fake scheduler API on localhost while in the with block."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.ids = count(1000)
+        self.jobs: dict[str, FakeJob] = {}
+        self.server = _ThreadingXMLRPCServer(
+            ("127.0.0.1", 0), allow_none=True, logRequests=False
+        )
+        self.server.register_instance(_API(self), allow_dotted_names=True)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def proxy(self) -> xmlrpc.client.ServerProxy:
+        host, port = self.server.server_address
+        return xmlrpc.client.ServerProxy(f"http://{host}:{port}/RPC2", allow_none=True)
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+#
+# SPDX-License-Identifier: MIT
+
+import asyncio
+from collections import defaultdict
+from contextlib import nullcontext as does_not_raise
+from datetime import timedelta
+
+import pytest
+import yaml
+from lava.exceptions import MesaCIRetryError
+from lava.lava_job_follower import AdaptiveBackoff, LAVAJobFollower, load_log_batch
+from lava.lava_job_submitter import NUMBER_OF_RETRIES_TIMEOUT_DETECTION
+
+from tests.lava.fake_scheduler import FakeScheduler
+
+NUMBER_OF_MAX_ATTEMPTS = NUMBER_OF_RETRIES_TIMEOUT_DETECTION + 1
+
+
+@pytest.fixture
+def scheduler():
+    with FakeScheduler() as scheduler:
+        yield scheduler
+
+
+def follow(scheduler, definitions, **kwargs):
+    """Follow the jobs, and return their results and the log lines printed
+    for each job id."""
+    output = defaultdict(list)
+    with LAVAJobFollower(
+        min_polling_time=0.001,
+        max_polling_time=0.01,
+        output=lambda job, line: output[job.job_id].append(line),
+        **kwargs,
+    ) as follower:
+        jobs = [(scheduler.proxy(), yaml.safe_dump(d)) for d in definitions]
+        results = asyncio.run(follower.follow_many(jobs))
+    return results, output
+
+
+def test_follow_many_jobs(scheduler):
+    definitions = [
+        {
+            "queued_polls": i % 4,
+            "lines_per_call": 1 + i % 7,
+            "log": [f"job {i} line {n}" for n in range(30)],
+            "result": "pass" if i % 5 else "fail",
+        }
+        for i in range(20)
+    ]
+    results, output = follow(scheduler, definitions)
+
+    for definition, job in zip(definitions, results):
+        assert job.status == definition["result"]
+        assert output[job.job_id] == definition["log"] + [
+            f"hwci: mesa: {definition['result']}"
+        ]
+
+
+CORRUPTED_LOG_SCENARIOS = {
+    "a few corrupted batches": ([2, 3, 7], does_not_raise()),
+    "too many subsequent corrupted batches": (range(1, 100), pytest.raises(MesaCIRetryError)),
+}
+
+
+@pytest.mark.parametrize(
+    "corrupt_calls, expectation",
+    CORRUPTED_LOG_SCENARIOS.values(),
+    ids=CORRUPTED_LOG_SCENARIOS.keys(),
+)
+def test_corrupted_batches_are_refetched(scheduler, corrupt_calls, expectation):
+    log = [f"line {n}" for n in range(50)]
+    (result,), output = follow(
+        scheduler,
+        [{"log": log, "lines_per_call": 8, "corrupt_calls": list(corrupt_calls)}],
+    )
+
+    with expectation:
+        if isinstance(result, Exception):
+            raise result
+        assert result.status == "pass"
+        assert output[result.job_id] == log + ["hwci: mesa: pass"]
+
+
+def test_hanging_job_is_resubmitted(scheduler):
+    (result,), _ = follow(
+        scheduler, [{"hang": True}], max_idle_time=timedelta(seconds=0.05)
+    )
+
+    assert isinstance(result, MesaCIRetryError)
+    assert len(scheduler.jobs) == NUMBER_OF_MAX_ATTEMPTS
+    assert all(job.cancelled for job in scheduler.jobs.values())
+
+
+def test_cancelled_job_is_cancelled(scheduler):
+    async def follow_and_cancel(follower, jobs):
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(follower.follow_many(jobs), 0.2)
+
+    with LAVAJobFollower(
+        min_polling_time=0.001,
+        max_polling_time=0.01,
+        max_idle_time=timedelta(minutes=1),
+        output=lambda job, line: None,
+    ) as follower:
+        jobs = [(scheduler.proxy(), yaml.safe_dump({"hang": True}))]
+        asyncio.run(follow_and_cancel(follower, jobs))
+
+    assert len(scheduler.jobs) == 1
+    assert all(job.cancelled for job in scheduler.jobs.values())
+
+
+def test_adaptive_backoff():
+    backoff = AdaptiveBackoff(1, 10, factor=2, jitter=0)
+    assert [backoff.next() for _ in range(6)] == [1, 2, 4, 8, 10, 10]
+    backoff.reset()
+    assert backoff.next() == 1
+
+
+LOG_BATCH_SCENARIOS = {
+    "empty": ("", [], True),
+    "complete": ("- {lvl: target, msg: a}\n- {lvl: target, msg: b}\n",
+                 [{"lvl": "target", "msg": "a"}, {"lvl": "target", "msg": "b"}], True),
+    "truncated": ("- {lvl: target, msg: a}\n- {lvl: target, msg: b}\n- {lvl: tar",
+                  [{"lvl": "target", "msg": "a"}, {"lvl": "target", "msg": "b"}], False),
+    "truncated block style": ("- lvl: target\n  msg: a\n- lvl: target\n  msg: 'b",
+                              [{"lvl": "target", "msg": "a"}], False),
+    "not a list": ("{'msg': 'Incomplete}", [], False),
+}
+
+
+@pytest.mark.parametrize(
+    "data, lines, complete",
+    LOG_BATCH_SCENARIOS.values(),
+    ids=LOG_BATCH_SCENARIOS.keys(),
+)
+def test_load_log_batch(data, lines, complete):
+    assert load_log_batch(data) == (lines, complete)
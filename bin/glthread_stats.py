@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+# SPDX-License-Identifier: MIT
+
+"""Make a report out of the glthread command statistics.
+
+Mesa built with -Dglthread-stats=true dumps the statistics of every command
+when glthread is destroyed, appending them to the file named by
+MESA_GLTHREAD_STATS, or printing them to stderr. The dumps of all the given
+files are added up, and the commands are sorted by the bytes they wrote to
+batches, their calls or their syncs, e.g.
+
+  MESA_GLTHREAD_STATS=/tmp/stats.txt mesa_glthread=true ./game
+  bin/glthread_stats.py /tmp/stats.txt --sort syncs
+"""
+
+import argparse
+import dataclasses
+import sys
+import typing
+
+
+@dataclasses.dataclass
+class Stats:
+
+    count: int = 0
+    bytes: int = 0
+    syncs: int = 0
+
+    def add(self, other: 'Stats') -> None:
+        self.count += other.count
+        self.bytes += other.bytes
+        self.syncs += other.syncs
+
+
+def parse_dumps(lines: typing.Iterable[str]) -> typing.Tuple[typing.Dict[str, Stats], int]:
+    """Add up the statistics of the dumps in lines.
+
+    A dump is a header followed by a "command count bytes syncs" line for
+    every command, and ends at the first line that is not one. Any other
+    lines, like the messages of stderr, are skipped.
+
+    Return the statistics of every command and the number of dumps.
+    """
+    commands: typing.Dict[str, Stats] = {}
+    num_dumps = 0
+    in_dump = False
+    for line in lines:
+        if line.startswith('# glthread command statistics'):
+            num_dumps += 1
+            in_dump = True
+            continue
+        if not in_dump:
+            continue
+        fields = line.split()
+        if len(fields) != 4 or not all(v.isdigit() for v in fields[1:]):
+            in_dump = False
+            continue
+        name, *values = fields
+        commands.setdefault(name, Stats()).add(Stats(*(int(v) for v in values)))
+    return commands, num_dumps
+
+
+def percent(part: int, total: int) -> float:
+    return 100 * part / total if total else 0
+
+
+def format_report(commands: typing.Dict[str, Stats], sort: str = 'bytes',
+                  limit: typing.Optional[int] = None) -> typing.List[str]:
+    """Return the lines of a report of the commands, sorted by the sort field
+    of their statistics."""
+    total = Stats()
+    for stats in commands.values():
+        total.add(stats)
+
+    order = sorted(commands.items(),
+                   key=lambda item: (-getattr(item[1], sort), item[0]))
+    if limit is not None:
+        order = order[:limit]
+
+    lines = [f"{'command':<40} {'calls':>10} {'bytes':>12} {'%':>6} "
+             f"{'bytes/call':>10} {'syncs':>10} {'%':>6}"]
+    for name, stats in order + [('total', total)]:
+        lines.append(f'{name:<40} {stats.count:>10} {stats.bytes:>12} '
+                     f'{percent(stats.bytes, total.bytes):>6.2f} '
+                     f'{stats.bytes / stats.count if stats.count else 0:>10.1f} '
+                     f'{stats.syncs:>10} {percent(stats.syncs, total.syncs):>6.2f}')
+    return lines
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('files', nargs='*', type=argparse.FileType('r'),
+                        default=[sys.stdin],
+                        help='files with statistics dumps (default: stdin)')
+    parser.add_argument('-s', '--sort', choices=['bytes', 'count', 'syncs'],
+                        default='bytes',
+                        help='statistic to sort the commands by (default: %(default)s)')
+    parser.add_argument('-n', '--limit', type=int,
+                        help='only report the first LIMIT commands')
+    args = parser.parse_args()
+
+    commands: typing.Dict[str, Stats] = {}
+    num_dumps = 0
+    for f in args.files:
+        file_commands, file_dumps = parse_dumps(f)
+        for name, stats in file_commands.items():
+            commands.setdefault(name, Stats()).add(stats)
+        num_dumps += file_dumps
+
+    print(f'{num_dumps} dumps, {len(commands)} commands')
+    print('\n'.join(format_report(commands, args.sort, args.limit)))
+
+
+if __name__ == '__main__':
+    main()
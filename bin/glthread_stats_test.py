@@ -0,0 +1,68 @@
+# SPDX-License-Identifier: MIT
+
+from . import glthread_stats
+from .glthread_stats import Stats
+
+DUMPS = """\
+# glthread command statistics: command count bytes syncs
+DrawArrays 100 3200 0
+Uniform4fv 10 400 1
+GetIntegerv 5 0 5
+# glthread command statistics: command count bytes syncs
+DrawArrays 50 1600 0
+GetIntegerv 1 0 1
+""".splitlines(keepends=True)
+
+
+def test_parse_dumps():
+    commands, num_dumps = glthread_stats.parse_dumps(DUMPS)
+
+    assert num_dumps == 2
+    assert commands == {
+        'DrawArrays': Stats(150, 4800, 0),
+        'Uniform4fv': Stats(10, 400, 1),
+        'GetIntegerv': Stats(6, 0, 6),
+    }
+
+
+def test_parse_dumps_skips_messages():
+    # Dumps printed to stderr are mixed with the messages of the application
+    lines = ['MESA: warning: something happened\n',
+             'Loading level 1 2 3\n',
+             *DUMPS[:4],
+             'Saving level 1 2 3\n',
+             'Uniform4fv 10 400 1\n',
+             *DUMPS[4:]]
+    commands, num_dumps = glthread_stats.parse_dumps(lines)
+
+    assert num_dumps == 2
+    assert commands == {
+        'DrawArrays': Stats(150, 4800, 0),
+        'Uniform4fv': Stats(10, 400, 1),
+        'GetIntegerv': Stats(6, 0, 6),
+    }
+
+
+class TestFormatReport:
+
+    commands = glthread_stats.parse_dumps(DUMPS)[0]
+
+    @staticmethod
+    def names(lines):
+        return [line.split()[0] for line in lines[1:]]
+
+    def test_sort_by_bytes(self):
+        lines = glthread_stats.format_report(self.commands)
+
+        assert self.names(lines) == ['DrawArrays', 'Uniform4fv', 'GetIntegerv', 'total']
+        assert lines[-1].split() == ['total', '166', '5200', '100.00', '31.3', '7', '100.00']
+
+    def test_sort_by_syncs(self):
+        lines = glthread_stats.format_report(self.commands, 'syncs')
+
+        assert self.names(lines) == ['GetIntegerv', 'Uniform4fv', 'DrawArrays', 'total']
+
+    def test_limit(self):
+        lines = glthread_stats.format_report(self.commands, 'count', limit=1)
+
+        assert self.names(lines) == ['DrawArrays', 'total']
@@ -1,4 +1,4 @@
-#!/usr/bin/env python
+#!/usr/bin/env python3
 #
 # Copyright 2012 VMware Inc
 # Copyright 2008-2009 Jose Fonseca
@@ -26,222 +26,234 @@
 
 Linux `perf annotate` does not work with JIT code.  This script takes the data
 produced by `perf script` command, plus the diassemblies outputed by gallivm
-into /tmp/perf-XXXXX.map.asm and produces output similar to `perf annotate`.
+into /tmp/perf-XXXXX.map.asm and produces output similar to `perf annotate`,
+for all the JIT functions which got enough samples, or for the given ones.
 
-See docs/llvmpipe.rst for usage instructions.
+See docs/drivers/llvmpipe.rst for usage instructions.
 
 The `perf script` output parser was derived from the gprof2dot.py script.
 """
 
 
-import sys
+import argparse
+import bisect
+import collections
 import os.path
 import re
-import optparse
 import subprocess
+import sys
 
 
-class Parser:
-    """Parser interface."""
-
-    def __init__(self):
-        pass
-
-    def parse(self):
-        raise NotImplementedError
-
-
-class LineParser(Parser):
-    """Base class for parsers that read line-based formats."""
-
-    def __init__(self, file):
-        Parser.__init__(self)
-        self._file = file
-        self.__line = None
-        self.__eof = False
-        self.line_no = 0
-
-    def readline(self):
-        line = self._file.readline()
-        if not line:
-            self.__line = ''
-            self.__eof = True
-        else:
-            self.line_no += 1
-        self.__line = line.rstrip('\r\n')
-
-    def lookahead(self):
-        assert self.__line is not None
-        return self.__line
-
-    def consume(self):
-        assert self.__line is not None
-        line = self.__line
-        self.readline()
-        return line
-
-    def eof(self):
-        assert self.__line is not None
-        return self.__eof
-
-
-mapFile = None
-
-def lookupMap(filename, matchSymbol):
-    global mapFile
-    mapFile = filename
-    stream = open(filename, 'rt')
-    for line in stream:
-        start, length, symbol = line.split()
-
-        start = int(start, 16)
-        length = int(length,16)
-
-        if symbol == matchSymbol:
-            return start
-
-    return None
-
-def lookupAsm(filename, desiredFunction):
-    stream = open(filename + '.asm', 'rt')
-    while stream.readline() != desiredFunction + ':\n':
-        pass
+class SymbolMap:
+    """The functions of a /tmp/perf-XXXXX.map file, and their disassembly.
 
-    asm = []
-    line = stream.readline().strip()
-    while line:
-        addr, instr = line.split(':', 1)
-        addr = int(addr)
-        asm.append((addr, instr))
-        line = stream.readline().strip()
+    The map is read once into arrays sorted by start address, so that
+    addresses are resolved by bisection.
+    """
 
-    return asm
+    asm_re = re.compile(r'^(?P<addr>\d+):(?P<instr>.*)$')
 
+    def __init__(self, filename):
+        self.filename = filename
 
+        functions = []
+        with open(filename, 'rt') as stream:
+            for index, line in enumerate(stream):
+                start, length, symbol = line.split()
+                functions.append((int(start, 16), int(length, 16), index, symbol))
+        functions.sort()
 
-samples = {}
+        self.starts = [start for start, length, index, symbol in functions]
+        self.ends = [start + length for start, length, index, symbol in functions]
+        # Position of the function in the map, and so in the .asm file, as
+        # JIT functions need not have unique names
+        self.indices = [index for start, length, index, symbol in functions]
+        self.symbols = [symbol for start, length, index, symbol in functions]
 
+        self._asm = None
 
-class PerfParser(LineParser):
+    def lookup(self, address):
+        """Return (function, offset) for the address, where function is the
+        position of the function in the map, or None."""
+        i = bisect.bisect_right(self.starts, address) - 1
+        if i < 0 or address >= self.ends[i]:
+            return None
+        return i, address - self.starts[i]
+
+    def symbol(self, function):
+        return self.symbols[function]
+
+    def asm(self, function):
+        """Return the (offset, instruction) pairs of a function."""
+        if self._asm is None:
+            self._asm = self._read_asm()
+        index = self.indices[function]
+        if index < len(self._asm):
+            return self._asm[index]
+        return []
+
+    def _read_asm(self):
+        functions = []
+        try:
+            stream = open(self.filename + '.asm', 'rt')
+        except OSError:
+            return functions
+
+        with stream:
+            asm = None
+            for line in stream:
+                line = line.strip()
+                if not line:
+                    asm = None
+                elif asm is None:
+                    # "symbol:" line starting a function
+                    asm = []
+                    functions.append(asm)
+                else:
+                    # Skip the lines without an address, such as the one
+                    # gallivm writes when it gives up on a large function
+                    mo = self.asm_re.match(line)
+                    if mo is not None:
+                        asm.append((int(mo.group('addr')), mo.group('instr')))
+        return functions
+
+
+class PerfParser:
     """Parser for linux perf callgraph output.
 
     It expects output generated with
 
         perf record -g
         perf script
-    """
-
-    def __init__(self, infile, symbol):
-        LineParser.__init__(self, infile)
-        self.symbol = symbol
-
-    def readline(self):
-        # Override LineParser.readline to ignore comment lines
-        while True:
-            LineParser.readline(self)
-            if self.eof() or not self.lookahead().startswith('#'):
-                break
-
-    def parse(self):
-        # read lookahead
-        self.readline()
-
-        while not self.eof():
-            self.parse_event()
-
-        asm = lookupAsm(mapFile, self.symbol)
 
-        addresses = samples.keys()
-        addresses.sort()
-        total_samples = 0
-
-        sys.stdout.write('%s:\n' % self.symbol)
-        for address, instr in asm:
-            try:
-                sample = samples.pop(address)
-            except KeyError:
-                sys.stdout.write(6*' ')
-            else:
-                sys.stdout.write('%6u' % (sample))
-                total_samples += sample
-            sys.stdout.write('%6u: %s\n' % (address, instr))
-        print 'total:', total_samples
-        assert len(samples) == 0
-
-        sys.exit(0)
-
-    def parse_event(self):
-        if self.eof():
-            return
-
-        line = self.consume()
-        assert line
-
-        callchain = self.parse_callchain()
-        if not callchain:
-            return
-
-    def parse_callchain(self):
-        callchain = []
-        while self.lookahead():
-            function = self.parse_call(len(callchain) == 0)
-            if function is None:
-                break
-            callchain.append(function)
-        if self.lookahead() == '':
-            self.consume()
-        return callchain
+    and counts the samples of every JIT function by the offset of the sampled
+    instruction.
+    """
 
     call_re = re.compile(r'^\s+(?P<address>[0-9a-fA-F]+)\s+(?P<symbol>.*)\s+\((?P<module>[^)]*)\)$')
+    map_re = re.compile(r'/perf-\d+\.map$')
 
-    def parse_call(self, first):
-        line = self.consume()
+    def __init__(self):
+        self.maps = {}
+        self.total_samples = 0
+        # (map, function) -> Counter of offsets
+        self.samples = collections.defaultdict(collections.Counter)
+
+    def symbol_map(self, module):
+        try:
+            return self.maps[module]
+        except KeyError:
+            pass
+
+        symbol_map = None
+        if self.map_re.search(module) and os.path.exists(module):
+            symbol_map = SymbolMap(module)
+        self.maps[module] = symbol_map
+        return symbol_map
+
+    def parse(self, stream):
+        # Only the first call of the callchain of every event, which
+        # follows the event line, is of interest
+        first = False
+        for line in stream:
+            if line.startswith('#'):
+                continue
+            if not line.strip():
+                first = False
+            elif not line[0].isspace():
+                self.total_samples += 1
+                first = True
+            elif first:
+                first = False
+                self.parse_call(line.rstrip('\r\n'))
+
+    def parse_call(self, line):
         mo = self.call_re.match(line)
-        assert mo
         if not mo:
-            return None
-
-        if not first:
-            return None
-
-        function_name = mo.group('symbol')
-        if not function_name:
-            function_name = mo.group('address')
-
-        module = mo.group('module')
-
-        function_id = function_name + ':' + module
-
-        address = mo.group('address')
-        address = int(address, 16)
-
-        if function_name != self.symbol:
-            return None
+            return
 
-        start_address = lookupMap(module, function_name)
-        address -= start_address
+        symbol_map = self.symbol_map(mo.group('module'))
+        if symbol_map is None:
+            return
 
-        #print function_name, module, address
+        location = symbol_map.lookup(int(mo.group('address'), 16))
+        if location is None:
+            return
 
-        samples[address] = samples.get(address, 0) + 1
+        function, offset = location
+        self.samples[(symbol_map, function)][offset] += 1
+
+    def functions(self):
+        """Return (samples, map, function) for the sampled JIT functions,
+        the most sampled first."""
+        functions = [(sum(offsets.values()), symbol_map, function)
+                     for (symbol_map, function), offsets in self.samples.items()]
+        functions.sort(key=lambda f: -f[0])
+        return functions
+
+    def annotate(self, out, symbol_map, function):
+        offsets = self.samples[(symbol_map, function)]
+        function_samples = sum(offsets.values())
+
+        out.write('%s: %u samples (%.2f%% of all samples)\n' % (
+            symbol_map.symbol(function), function_samples,
+            100.0 * function_samples / self.total_samples))
+
+        unmatched = dict(offsets)
+        for address, instr in symbol_map.asm(function):
+            sample = unmatched.pop(address, 0)
+            if sample:
+                out.write('%6.2f%% %6u' % (100.0 * sample / function_samples, sample))
+            else:
+                out.write(14*' ')
+            out.write(' %6u: %s\n' % (address, instr))
 
-        return True
+        if unmatched:
+            # Samples outside of the disassembly, or in the middle of an
+            # instruction
+            out.write('unmatched: %u samples\n' % sum(unmatched.values()))
+        out.write('\n')
 
 
 def main():
     """Main program."""
 
-    optparser = optparse.OptionParser(
-        usage="\n\t%prog [options] symbol_name")
-    (options, args) = optparser.parse_args(sys.argv[1:])
-    if len(args) != 1:
-        optparser.error('wrong number of arguments')
-
-    symbol = args[0]
-
-    p = subprocess.Popen(['perf', 'script'], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-    parser = PerfParser(p.stdout, symbol)
-    parser.parse()
+    argparser = argparse.ArgumentParser(
+        description="Annotate the disassembly of llvmpipe JIT functions with perf samples")
+    argparser.add_argument('symbols', nargs='*', metavar='SYMBOL',
+        help='only annotate these functions')
+    argparser.add_argument('-i', '--input', metavar='FILE',
+        help='read `perf script` output from FILE, or - for stdin, instead of '
+             'running `perf script`')
+    argparser.add_argument('-t', '--threshold', type=float, default=1.0, metavar='PERCENT',
+        help='only annotate functions with at least PERCENT of all samples '
+             '(default: %(default)s)')
+    args = argparser.parse_args()
+
+    if args.input == '-':
+        parser = PerfParser()
+        parser.parse(sys.stdin)
+    elif args.input:
+        parser = PerfParser()
+        with open(args.input, 'rt') as stream:
+            parser.parse(stream)
+    else:
+        p = subprocess.Popen(['perf', 'script'], stdout=subprocess.PIPE,
+                             universal_newlines=True)
+        parser = PerfParser()
+        parser.parse(p.stdout)
+        p.wait()
+
+    symbols = set(args.symbols)
+    for function_samples, symbol_map, function in parser.functions():
+        if symbols:
+            if symbol_map.symbol(function) not in symbols:
+                continue
+        elif 100.0 * function_samples / parser.total_samples < args.threshold:
+            break
+        parser.annotate(sys.stdout, symbol_map, function)
+
+    print('total: %u samples' % parser.total_samples)
 
 
 if __name__ == '__main__':
@@ -21,6 +21,7 @@
 """Core data structures and routines for pick."""
 
 import asyncio
+import datetime
 import enum
 import json
 import pathlib
@@ -44,6 +45,7 @@ if typing.TYPE_CHECKING:
         resolution: typing.Optional[int]
         main_sha: typing.Optional[str]
         because_sha: typing.Optional[str]
+        commit_date: typing.Optional[str]
 
 IS_FIX = re.compile(r'^\s*fixes:\s*([a-f0-9]{6,40})', flags=re.MULTILINE | re.IGNORECASE)
 # FIXME: I dislike the duplication in this regex, but I couldn't get it to work otherwise
@@ -51,9 +53,6 @@ IS_CC = re.compile(r'^\s*cc:\s*["\']?([0-9]{2}\.[0-9])?["\']?\s*["\']?([0-9]{2}\
                    flags=re.MULTILINE | re.IGNORECASE)
 IS_REVERT = re.compile(r'This reverts commit ([0-9a-f]{40})')
 
-# XXX: hack
-SEM = asyncio.Semaphore(50)
-
 COMMIT_LOCK = asyncio.Lock()
 
 git_toplevel = subprocess.check_output(['git', 'rev-parse', '--show-toplevel'],
@@ -83,6 +82,163 @@ class Resolution(enum.Enum):
     NOTNEEDED = 4
 
 
+class CatFile:
+
+    """A long-lived ``git cat-file`` process answering batches of queries.
+
+    The process is restarted when used from another event loop, as asyncio
+    subprocesses are tied to the loop which created them.
+    """
+
+    def __init__(self, mode: str):
+        self.mode = mode
+        self._proc: typing.Optional[asyncio.subprocess.Process] = None
+        self._loop: typing.Optional[asyncio.AbstractEventLoop] = None
+        self._lock: typing.Optional[asyncio.Lock] = None
+
+    async def query(self, names: typing.List[str]
+                    ) -> typing.List[typing.Tuple[typing.List[str], typing.Optional[bytes]]]:
+        """Look up names, returning the header fields of each object, and
+        its contents in --batch mode."""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._lock = asyncio.Lock()
+            self._proc = None
+        assert self._lock is not None
+
+        async with self._lock:
+            if self._proc is None or self._proc.returncode is not None:
+                self._proc = await asyncio.create_subprocess_exec(
+                    'git', 'cat-file', self.mode,
+                    stdin=asyncio.subprocess.PIPE,
+                    stdout=asyncio.subprocess.PIPE,
+                    stderr=asyncio.subprocess.DEVNULL,
+                )
+            p = self._proc
+            assert p.stdin is not None and p.stdout is not None
+
+            # Write the names while reading the answers, git stops reading
+            # once its output pipe is full.
+            async def write() -> None:
+                p.stdin.write(''.join(f'{n}\n' for n in names).encode())
+                await p.stdin.drain()
+            writer = asyncio.ensure_future(write())
+
+            results = []
+            for _ in names:
+                header = (await p.stdout.readline()).decode().split()
+                contents = None
+                # Unknown and ambiguous names only get a "<name> missing"
+                # or "<name> ambiguous" line.
+                if self.mode == '--batch' and len(header) == 3:
+                    contents = (await p.stdout.readexactly(int(header[2]) + 1))[:-1]
+                results.append((header, contents))
+            await writer
+        return results
+
+    async def close(self) -> None:
+        if self._proc is not None and self._proc.returncode is None:
+            assert self._proc.stdin is not None
+            self._proc.stdin.close()
+            await self._proc.wait()
+        self._proc = None
+
+
+class GitBackend:
+
+    """Git objects shared by all the commits being gathered.
+
+    Spawning git for every commit dominates gathering the thousands of
+    commits of a stable branch, so commits are read through a single
+    ``git cat-file --batch`` process, names are resolved through a single
+    ``git cat-file --batch-check`` one, and the ancestors of HEAD are listed
+    by one ``git rev-list`` run. The results are kept for the lifetime of the
+    backend.
+
+    The ancestors are listed under a lock, so that the concurrent callers
+    which find HEAD has changed wait for a single run.
+    """
+
+    def __init__(self) -> None:
+        self.batch = CatFile('--batch')
+        self.batch_check = CatFile('--batch-check')
+        self.messages: typing.Dict[str, str] = {}
+        self.dates: typing.Dict[str, str] = {}
+        self.shas: typing.Dict[str, typing.Optional[str]] = {}
+        self.head: typing.Optional[str] = None
+        self.ancestors: typing.Set[str] = set()
+        self._loop: typing.Optional[asyncio.AbstractEventLoop] = None
+        self._ancestors_lock: typing.Optional[asyncio.Lock] = None
+
+    @staticmethod
+    def _parse_date(raw: bytes) -> str:
+        """Get the commit date of a raw commit, like %cs does."""
+        for line in raw.split(b'\n'):
+            if not line:
+                break
+            if line.startswith(b'committer '):
+                timestamp, offset = line.decode(errors='replace').rsplit(' ', 2)[1:]
+                minutes = int(offset[1:3]) * 60 + int(offset[3:5])
+                tz = datetime.timezone(datetime.timedelta(
+                    minutes=-minutes if offset[0] == '-' else minutes))
+                return datetime.datetime.fromtimestamp(int(timestamp), tz).strftime('%Y-%m-%d')
+        return ''
+
+    async def read_commits(self, shas: typing.Iterable[str]) -> None:
+        """Read the messages and dates of the commits which aren't known yet."""
+        wanted = list(dict.fromkeys(s for s in shas if s not in self.messages))
+        if not wanted:
+            return
+        for sha, (header, raw) in zip(wanted, await self.batch.query(wanted)):
+            if raw is None or header[1] != 'commit':
+                raise PickUIException(f'Invalid Sha {sha}')
+            _, _, message = raw.partition(b'\n\n')
+            self.messages[sha] = message.decode(errors='replace')
+            self.dates[sha] = self._parse_date(raw)
+
+    async def message(self, sha: str) -> str:
+        await self.read_commits([sha])
+        return self.messages[sha]
+
+    async def full_shas(self, names: typing.Iterable[str]) -> typing.List[typing.Optional[str]]:
+        """Resolve names to full shas, None for the names which don't
+        resolve to a single object."""
+        names = list(names)
+        wanted = list(dict.fromkeys(n for n in names if n not in self.shas))
+        if wanted:
+            for name, (header, _) in zip(wanted, await self.batch_check.query(wanted)):
+                self.shas[name] = header[0] if len(header) == 3 else None
+        return [self.shas[n] for n in names]
+
+    async def is_ancestor_of_head(self, sha: str) -> bool:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._ancestors_lock = asyncio.Lock()
+        assert self._ancestors_lock is not None
+
+        async with self._ancestors_lock:
+            (head, _), = await self.batch_check.query(['HEAD'])
+            if head[0] != self.head:
+                p = await asyncio.create_subprocess_exec(
+                    'git', 'rev-list', head[0],
+                    stdout=asyncio.subprocess.PIPE,
+                    stderr=asyncio.subprocess.DEVNULL,
+                )
+                out, _ = await p.communicate()
+                self.ancestors = set(out.decode().split())
+                self.head = head[0]
+        return sha in self.ancestors
+
+    async def close(self) -> None:
+        await self.batch.close()
+        await self.batch_check.close()
+
+
+git = GitBackend()
+
+
 async def commit_state(*, amend: bool = False, message: str = 'Update') -> bool:
     """Commit the .pick_status.json file."""
     async with COMMIT_LOCK:
@@ -120,6 +276,7 @@ class Commit:
     resolution: Resolution = attr.ib(Resolution.UNRESOLVED)
     main_sha: typing.Optional[str] = attr.ib(None)
     because_sha: typing.Optional[str] = attr.ib(None)
+    commit_date: typing.Optional[str] = attr.ib(None)
 
     def to_json(self) -> 'CommitDict':
         d: typing.Dict[str, typing.Any] = attr.asdict(self)
@@ -131,7 +288,8 @@ class Commit:
 
     @classmethod
     def from_json(cls, data: 'CommitDict') -> 'Commit':
-        c = cls(data['sha'], data['description'], data['nominated'], main_sha=data['main_sha'], because_sha=data['because_sha'])
+        c = cls(data['sha'], data['description'], data['nominated'], main_sha=data['main_sha'], because_sha=data['because_sha'],
+                commit_date=data.get('commit_date'))
         if data['nomination_type'] is not None:
             c.nomination_type = NominationType(data['nomination_type'])
         if data['resolution'] is not None:
@@ -141,10 +299,14 @@ class Commit:
     def date(self) -> str:
         # Show commit date, ie. when the commit actually landed
         # (as opposed to when it was first written)
-        return subprocess.check_output(
-            ['git', 'show', '--no-patch', '--format=%cs', self.sha],
-            stderr=subprocess.DEVNULL
-        ).decode("ascii").strip()
+        # It is normally filled in by gather_commits or resolve_dates, and
+        # saved along with the commit.
+        if self.commit_date is None:
+            self.commit_date = subprocess.check_output(
+                ['git', 'show', '--no-patch', '--format=%cs', self.sha],
+                stderr=subprocess.DEVNULL
+            ).decode("ascii").strip()
+        return self.commit_date
 
     async def apply(self, ui: 'UI') -> typing.Tuple[bool, str]:
         # FIXME: This isn't really enough if we fail to cherry-pick because the
@@ -231,39 +393,19 @@ def split_commit_list(commits: str) -> typing.Generator[typing.Tuple[str, str],
 
 
 async def is_commit_in_branch(sha: str) -> bool:
-    async with SEM:
-        p = await asyncio.create_subprocess_exec(
-            'git', 'merge-base', '--is-ancestor', sha, 'HEAD',
-            stdout=asyncio.subprocess.DEVNULL,
-            stderr=asyncio.subprocess.DEVNULL,
-        )
-        await p.wait()
-    return p.returncode == 0
+    full, = await git.full_shas([sha])
+    return full is not None and await git.is_ancestor_of_head(full)
 
 
 async def full_sha(sha: str) -> str:
-    async with SEM:
-        p = await asyncio.create_subprocess_exec(
-            'git', 'rev-parse', sha,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.DEVNULL,
-        )
-        out, _ = await p.communicate()
-    if p.returncode:
+    full, = await git.full_shas([sha])
+    if full is None:
         raise PickUIException(f'Invalid Sha {sha}')
-    return out.decode().strip()
+    return full
 
 
 async def resolve_nomination(commit: 'Commit', version: str) -> 'Commit':
-    async with SEM:
-        p = await asyncio.create_subprocess_exec(
-            'git', 'log', '--format=%B', '-1', commit.sha,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.DEVNULL,
-        )
-        _out, _ = await p.communicate()
-        assert p.returncode == 0, f'git log for {commit.sha} failed'
-    out = _out.decode()
+    out = await git.message(commit.sha)
 
     # We give precedence to fixes and cc tags over revert tags.
     # XXX: not having the walrus operator available makes me sad :=
@@ -348,6 +490,15 @@ async def gather_commits(version: str, previous: typing.List['Commit'],
     m_commits: typing.List[typing.Optional['Commit']] = [None] * len(new)
     tasks = []
 
+    # Read all the commits, and resolve the shas they refer to, in bulk up
+    # front, so that resolve_nomination only hits the cache.
+    await git.read_commits(sha for sha, _ in new)
+    refs = []
+    for sha, _ in new:
+        refs += IS_FIX.findall(git.messages[sha])
+        refs += IS_REVERT.findall(git.messages[sha])
+    await git.full_shas(refs)
+
     async def inner(commit: 'Commit', version: str,
                     commits: typing.List[typing.Optional['Commit']],
                     index: int, cb) -> None:
@@ -356,7 +507,7 @@ async def gather_commits(version: str, previous: typing.List['Commit'],
 
     for i, (sha, desc) in enumerate(new):
         tasks.append(asyncio.ensure_future(
-            inner(Commit(sha, desc), version, m_commits, i, cb)))
+            inner(Commit(sha, desc, commit_date=git.dates[sha]), version, m_commits, i, cb)))
 
     await asyncio.gather(*tasks)
     assert None not in m_commits
@@ -371,6 +522,14 @@ async def gather_commits(version: str, previous: typing.List['Commit'],
     return commits
 
 
+async def resolve_dates(commits: typing.Iterable['Commit']) -> None:
+    """Fill in the commit dates which weren't saved yet, in bulk."""
+    commits = [c for c in commits if c.commit_date is None]
+    await git.read_commits(c.sha for c in commits)
+    for commit in commits:
+        commit.commit_date = git.dates[commit.sha]
+
+
 def load() -> typing.List['Commit']:
     if not pick_status_json.exists():
         return []
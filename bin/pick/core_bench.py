@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+# SPDX-License-Identifier: MIT
+
+"""Measure how long pick takes to gather the commits of a synthetic repository.
+
+Creates a repository with a stable branch and main commits to gather, a
+quarter of them with a Cc: mesa-stable tag, a quarter fixing and a quarter
+reverting commits of the stable branch. Then gathers the commits and gets the
+date of the nominated ones, like the UI does on update. With -b, core.py of
+another git revision is measured too, e.g.
+
+  bin/pick/core_bench.py -b HEAD~1
+"""
+
+import argparse
+import asyncio
+import importlib.util
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+PICK_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def load_core(path, name):
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def fast_import(messages, start=None):
+    stream = []
+    for i, message in enumerate(messages):
+        data = message.encode()
+        stream.append(b'commit refs/heads/main\n'
+                      b'committer Bench <bench@example.com> %d +0000\n'
+                      b'data %d\n%s\n' % (1600000000 + i * 60, len(data), data))
+        if i == 0 and start:
+            stream.append(b'from %s^0\n' % start.encode())
+    subprocess.run(['git', 'fast-import', '--quiet'], input=b''.join(stream), check=True)
+
+
+def create_repo(num_old, num_new):
+    subprocess.check_call(['git', 'init', '-q', '-b', 'main'])
+    fast_import([f'old commit {i}' for i in range(num_old)])
+    subprocess.check_call(['git', 'tag', 'branchpoint', 'main'])
+    subprocess.check_call(['git', 'branch', 'staging', 'main'])
+    subprocess.check_call(['git', 'symbolic-ref', 'HEAD', 'refs/heads/staging'])
+    old = subprocess.check_output(['git', 'rev-list', 'main']).decode().split()
+
+    messages = []
+    for i in range(num_new):
+        trailer = [
+            'Cc: mesa-stable',
+            f'Fixes: {old[i % len(old)][:12]} ("old commit")',
+            f'This reverts commit {old[i % len(old)]}.',
+            'Reviewed-by: Someone <someone@example.com>',
+        ][i % 4]
+        messages.append(f'new commit {i}\n\nSome description.\n\n{trailer}\n')
+    fast_import(messages, start='refs/heads/main')
+
+
+async def gather(core, new):
+    commits = await core.gather_commits('24.0', [], new, lambda: None)
+    nominated = [c for c in commits if c.nominated]
+    if hasattr(core, 'resolve_dates'):
+        await core.resolve_dates(nominated)
+    for commit in nominated:
+        commit.date()
+    if hasattr(core, 'git'):
+        await core.git.close()
+    return len(nominated)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-o', '--old', type=int, default=2000,
+                        help='number of commits of the stable branch (default: %(default)s)')
+    parser.add_argument('-n', '--new', type=int, default=2000,
+                        help='number of commits to gather (default: %(default)s)')
+    parser.add_argument('-b', '--baseline', metavar='REV',
+                        help='also measure core.py at git revision REV')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix='pick_bench') as tmp:
+        implementations = [('current', os.path.join(PICK_DIR, 'core.py'))]
+        if args.baseline:
+            path = os.path.join(tmp, 'core_baseline.py')
+            with open(path, 'wb') as f:
+                f.write(subprocess.check_output(
+                    ['git', 'show', args.baseline + ':./core.py'], cwd=PICK_DIR))
+            implementations.append((args.baseline, path))
+
+        repo = os.path.join(tmp, 'repo')
+        os.mkdir(repo)
+        os.chdir(repo)
+        create_repo(args.old, args.new)
+        log = subprocess.check_output(['git', 'log', '--pretty=oneline', 'branchpoint..main'])
+
+        print(f"{'implementation':<16} {'time (s)':>9} {'commits/s':>10} {'nominated':>10}")
+        for i, (name, path) in enumerate(implementations):
+            core = load_core(path, f'pick_core_{i}')
+            new = list(core.split_commit_list(log.decode().strip()))
+            start = time.perf_counter()
+            nominated = asyncio.run(gather(core, new))
+            elapsed = time.perf_counter() - start
+            print(f'{name:<16} {elapsed:>9.3f} {len(new) / elapsed:>10.1f} {nominated:>10}')
+
+
+if __name__ == '__main__':
+    sys.exit(main())
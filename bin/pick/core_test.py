@@ -21,6 +21,8 @@
 """Tests for pick's core data structures and routines."""
 
 from unittest import mock
+import asyncio
+import subprocess
 import textwrap
 import typing
 
@@ -48,7 +50,7 @@ class TestCommit:
             v = c.to_json()
             assert v == {'sha': 'abc123', 'description': 'sub: A commit', 'nominated': False,
                          'nomination_type': None, 'resolution': core.Resolution.UNRESOLVED.value,
-                         'main_sha': '45678', 'because_sha': None}
+                         'main_sha': '45678', 'because_sha': None, 'commit_date': None}
 
         def test_nominated(self, nominated_commit: 'core.Commit'):
             c = nominated_commit
@@ -59,7 +61,8 @@ class TestCommit:
                          'nomination_type': core.NominationType.CC.value,
                          'resolution': core.Resolution.UNRESOLVED.value,
                          'main_sha': None,
-                         'because_sha': None}
+                         'because_sha': None,
+                         'commit_date': None}
 
     class TestFromJson:
 
@@ -240,23 +243,17 @@ class TestRE:
 class TestResolveNomination:
 
     @attr.s(slots=True)
-    class FakeSubprocess:
+    class FakeGit:
 
-        """A fake asyncio.subprocess like classe for use with mock."""
+        """A fake GitBackend like class for use with mock."""
 
-        out: typing.Optional[bytes] = attr.ib(None)
-        returncode: int = attr.ib(0)
+        out: str = attr.ib()
 
-        async def mock(self, *_, **__):
-            """A dirtly little helper for mocking."""
-            return self
+        async def message(self, sha: str) -> str:
+            return self.out
 
-        async def communicate(self) -> typing.Tuple[bytes, bytes]:
-            assert self.out is not None
-            return self.out, b''
-
-        async def wait(self) -> int:
-            return self.returncode
+        async def full_shas(self, names: typing.Iterable[str]) -> typing.List[typing.Optional[str]]:
+            return list(names)
 
     @staticmethod
     async def return_true(*_, **__) -> bool:
@@ -268,10 +265,10 @@ class TestResolveNomination:
 
     @pytest.mark.asyncio
     async def test_fix_is_nominated(self):
-        s = self.FakeSubprocess(b'Fixes: 3d09bb390a39 (etnaviv: GC7000: State changes for HALTI3..5)')
+        s = self.FakeGit('Fixes: 3d09bb390a39 (etnaviv: GC7000: State changes for HALTI3..5)')
         c = core.Commit('abcdef1234567890', 'a commit')
 
-        with mock.patch('bin.pick.core.asyncio.create_subprocess_exec', s.mock):
+        with mock.patch('bin.pick.core.git', s):
             with mock.patch('bin.pick.core.is_commit_in_branch', self.return_true):
                 await core.resolve_nomination(c, '')
 
@@ -280,10 +277,10 @@ class TestResolveNomination:
 
     @pytest.mark.asyncio
     async def test_fix_is_not_nominated(self):
-        s = self.FakeSubprocess(b'Fixes: 3d09bb390a39 (etnaviv: GC7000: State changes for HALTI3..5)')
+        s = self.FakeGit('Fixes: 3d09bb390a39 (etnaviv: GC7000: State changes for HALTI3..5)')
         c = core.Commit('abcdef1234567890', 'a commit')
 
-        with mock.patch('bin.pick.core.asyncio.create_subprocess_exec', s.mock):
+        with mock.patch('bin.pick.core.git', s):
             with mock.patch('bin.pick.core.is_commit_in_branch', self.return_false):
                 await core.resolve_nomination(c, '')
 
@@ -292,10 +289,10 @@ class TestResolveNomination:
 
     @pytest.mark.asyncio
     async def test_cc_is_nominated(self):
-        s = self.FakeSubprocess(b'Cc: 16.2 <mesa-stable@lists.freedesktop.org>')
+        s = self.FakeGit('Cc: 16.2 <mesa-stable@lists.freedesktop.org>')
         c = core.Commit('abcdef1234567890', 'a commit')
 
-        with mock.patch('bin.pick.core.asyncio.create_subprocess_exec', s.mock):
+        with mock.patch('bin.pick.core.git', s):
             await core.resolve_nomination(c, '16.2')
 
         assert c.nominated
@@ -303,10 +300,10 @@ class TestResolveNomination:
 
     @pytest.mark.asyncio
     async def test_cc_is_nominated2(self):
-        s = self.FakeSubprocess(b'Cc: mesa-stable@lists.freedesktop.org')
+        s = self.FakeGit('Cc: mesa-stable@lists.freedesktop.org')
         c = core.Commit('abcdef1234567890', 'a commit')
 
-        with mock.patch('bin.pick.core.asyncio.create_subprocess_exec', s.mock):
+        with mock.patch('bin.pick.core.git', s):
             await core.resolve_nomination(c, '16.2')
 
         assert c.nominated
@@ -314,10 +311,10 @@ class TestResolveNomination:
 
     @pytest.mark.asyncio
     async def test_cc_is_not_nominated(self):
-        s = self.FakeSubprocess(b'Cc: 16.2 <mesa-stable@lists.freedesktop.org>')
+        s = self.FakeGit('Cc: 16.2 <mesa-stable@lists.freedesktop.org>')
         c = core.Commit('abcdef1234567890', 'a commit')
 
-        with mock.patch('bin.pick.core.asyncio.create_subprocess_exec', s.mock):
+        with mock.patch('bin.pick.core.git', s):
             await core.resolve_nomination(c, '16.1')
 
         assert not c.nominated
@@ -325,10 +322,10 @@ class TestResolveNomination:
 
     @pytest.mark.asyncio
     async def test_revert_is_nominated(self):
-        s = self.FakeSubprocess(b'This reverts commit 1234567890123456789012345678901234567890.')
+        s = self.FakeGit('This reverts commit 1234567890123456789012345678901234567890.')
         c = core.Commit('abcdef1234567890', 'a commit')
 
-        with mock.patch('bin.pick.core.asyncio.create_subprocess_exec', s.mock):
+        with mock.patch('bin.pick.core.git', s):
             with mock.patch('bin.pick.core.is_commit_in_branch', self.return_true):
                 await core.resolve_nomination(c, '')
 
@@ -337,10 +334,10 @@ class TestResolveNomination:
 
     @pytest.mark.asyncio
     async def test_revert_is_not_nominated(self):
-        s = self.FakeSubprocess(b'This reverts commit 1234567890123456789012345678901234567890.')
+        s = self.FakeGit('This reverts commit 1234567890123456789012345678901234567890.')
         c = core.Commit('abcdef1234567890', 'a commit')
 
-        with mock.patch('bin.pick.core.asyncio.create_subprocess_exec', s.mock):
+        with mock.patch('bin.pick.core.git', s):
             with mock.patch('bin.pick.core.is_commit_in_branch', self.return_false):
                 await core.resolve_nomination(c, '')
 
@@ -349,13 +346,13 @@ class TestResolveNomination:
 
     @pytest.mark.asyncio
     async def test_is_fix_and_cc(self):
-        s = self.FakeSubprocess(
-            b'Fixes: 3d09bb390a39 (etnaviv: GC7000: State changes for HALTI3..5)\n'
-            b'Cc: 16.1 <mesa-stable@lists.freedesktop.org>'
+        s = self.FakeGit(
+            'Fixes: 3d09bb390a39 (etnaviv: GC7000: State changes for HALTI3..5)\n'
+            'Cc: 16.1 <mesa-stable@lists.freedesktop.org>'
         )
         c = core.Commit('abcdef1234567890', 'a commit')
 
-        with mock.patch('bin.pick.core.asyncio.create_subprocess_exec', s.mock):
+        with mock.patch('bin.pick.core.git', s):
             with mock.patch('bin.pick.core.is_commit_in_branch', self.return_true):
                 await core.resolve_nomination(c, '16.1')
 
@@ -364,13 +361,13 @@ class TestResolveNomination:
 
     @pytest.mark.asyncio
     async def test_is_fix_and_revert(self):
-        s = self.FakeSubprocess(
-            b'Fixes: 3d09bb390a39 (etnaviv: GC7000: State changes for HALTI3..5)\n'
-            b'This reverts commit 1234567890123456789012345678901234567890.'
+        s = self.FakeGit(
+            'Fixes: 3d09bb390a39 (etnaviv: GC7000: State changes for HALTI3..5)\n'
+            'This reverts commit 1234567890123456789012345678901234567890.'
         )
         c = core.Commit('abcdef1234567890', 'a commit')
 
-        with mock.patch('bin.pick.core.asyncio.create_subprocess_exec', s.mock):
+        with mock.patch('bin.pick.core.git', s):
             with mock.patch('bin.pick.core.is_commit_in_branch', self.return_true):
                 await core.resolve_nomination(c, '16.1')
 
@@ -379,13 +376,13 @@ class TestResolveNomination:
 
     @pytest.mark.asyncio
     async def test_is_cc_and_revert(self):
-        s = self.FakeSubprocess(
-            b'This reverts commit 1234567890123456789012345678901234567890.\n'
-            b'Cc: 16.1 <mesa-stable@lists.freedesktop.org>'
+        s = self.FakeGit(
+            'This reverts commit 1234567890123456789012345678901234567890.\n'
+            'Cc: 16.1 <mesa-stable@lists.freedesktop.org>'
         )
         c = core.Commit('abcdef1234567890', 'a commit')
 
-        with mock.patch('bin.pick.core.asyncio.create_subprocess_exec', s.mock):
+        with mock.patch('bin.pick.core.git', s):
             with mock.patch('bin.pick.core.is_commit_in_branch', self.return_true):
                 await core.resolve_nomination(c, '16.1')
 
@@ -468,3 +465,65 @@ class TestFullSha:
         # This commit is from 2000, it better always be in the branch
         with pytest.raises(core.PickUIException):
             await core.full_sha('fffffffffffffffffffffffffffffffffff')
+
+
+class TestGitBackend:
+
+    @pytest.fixture
+    def repo(self, tmp_path, monkeypatch) -> typing.List[str]:
+        """A repository with a branch of two commits, and another one."""
+        monkeypatch.chdir(tmp_path)
+        monkeypatch.setenv('GIT_AUTHOR_NAME', 'A U Thor')
+        monkeypatch.setenv('GIT_AUTHOR_EMAIL', 'author@example.com')
+        monkeypatch.setenv('GIT_COMMITTER_NAME', 'C O Mitter')
+        monkeypatch.setenv('GIT_COMMITTER_EMAIL', 'committer@example.com')
+        # Still the 1st of January in the committer's timezone
+        monkeypatch.setenv('GIT_COMMITTER_DATE', '2020-01-01T23:30:00 -0300')
+
+        def git(*args: str) -> str:
+            return subprocess.check_output(['git', *args]).decode().strip()
+
+        git('init', '-q', '-b', 'main')
+        git('commit', '-q', '--allow-empty', '-m', 'first\n\nCc: mesa-stable')
+        git('commit', '-q', '--allow-empty', '-m', 'second')
+        git('checkout', '-q', '-b', 'other', 'HEAD~1')
+        git('commit', '-q', '--allow-empty', '-m', 'third')
+        git('checkout', '-q', 'main')
+        return git('rev-list', 'main~1', 'main', 'other').split()
+
+    @pytest.mark.asyncio
+    async def test_read_commits(self, repo: typing.List[str]):
+        g = core.GitBackend()
+        await g.read_commits(repo)
+        assert [g.messages[s] for s in repo] == ['first\n\nCc: mesa-stable\n', 'second\n', 'third\n']
+        assert all(g.dates[s] == '2020-01-01' for s in repo)
+        await g.close()
+
+    @pytest.mark.asyncio
+    async def test_read_invalid(self, repo: typing.List[str]):
+        g = core.GitBackend()
+        with pytest.raises(core.PickUIException):
+            await g.read_commits([repo[0], 'ffffffffffffffffffffffffffffffffffffffff'])
+        await g.close()
+
+    @pytest.mark.asyncio
+    async def test_full_shas(self, repo: typing.List[str]):
+        g = core.GitBackend()
+        assert await g.full_shas([s[:8] for s in repo] + ['fffffffffff']) == repo + [None]
+        await g.close()
+
+    @pytest.mark.asyncio
+    async def test_is_ancestor_of_head(self, repo: typing.List[str]):
+        g = core.GitBackend()
+        assert [await g.is_ancestor_of_head(s) for s in repo] == [True, True, False]
+        await g.close()
+
+    @pytest.mark.asyncio
+    async def test_is_ancestor_of_head_concurrent(self, repo: typing.List[str]):
+        g = core.GitBackend()
+        with mock.patch('bin.pick.core.asyncio.create_subprocess_exec',
+                        wraps=core.asyncio.create_subprocess_exec) as m:
+            results = await asyncio.gather(*[g.is_ancestor_of_head(s) for s in repo * 10])
+        assert results == [True, True, False] * 10
+        assert sum(c.args[1] == 'rev-list' for c in m.call_args_list) == 1
+        await g.close()
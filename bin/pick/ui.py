@@ -169,10 +169,12 @@ class UI:
                 lambda: pb.set_completion(pb.current + 1))
             self.mainloop.widget = o
 
-        for commit in reversed(list(itertools.chain(self.new_commits, self.previous_commits))):
-            if commit.nominated and commit.resolution is core.Resolution.UNRESOLVED:
-                b = urwid.AttrMap(CommitWidget(self, commit), None, focus_map='reversed')
-                self.commit_list.append(b)
+        commits = [c for c in itertools.chain(self.new_commits, self.previous_commits)
+                   if c.nominated and c.resolution is core.Resolution.UNRESOLVED]
+        await core.resolve_dates(commits)
+        for commit in reversed(commits):
+            b = urwid.AttrMap(CommitWidget(self, commit), None, focus_map='reversed')
+            self.commit_list.append(b)
         self.save()
 
     async def feedback(self, text: str) -> None:
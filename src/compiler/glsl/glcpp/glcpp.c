@@ -42,9 +42,10 @@ _mesa_reference_shader(struct gl_context *ctx, struct gl_shader **ptr,
 }
 
 /* Read from fp until EOF and return a string of everything read.
+ * If size is not NULL, it is set to the number of bytes read.
  */
 static char *
-load_text_fp (void *ctx, FILE *fp)
+load_text_fp (void *ctx, FILE *fp, size_t *size)
 {
 #define CHUNK 4096
 	char *text = NULL;
@@ -71,6 +72,9 @@ load_text_fp (void *ctx, FILE *fp)
 
 	text[total_read] = '\0';
 
+	if (size)
+		*size = total_read;
+
 	return text;
 }
 
@@ -81,7 +85,7 @@ load_text_file(void *ctx, const char *filename)
 	FILE *fp;
 
 	if (filename == NULL || strcmp (filename, "-") == 0)
-		return load_text_fp (ctx, stdin);
+		return load_text_fp (ctx, stdin, NULL);
 
 	fp = fopen (filename, "r");
 	if (fp == NULL) {
@@ -90,7 +94,7 @@ load_text_file(void *ctx, const char *filename)
 		return NULL;
 	}
 
-	text = load_text_fp (ctx, fp);
+	text = load_text_fp (ctx, fp, NULL);
 
 	fclose(fp);
 
@@ -116,16 +120,56 @@ usage (void)
 		 "Pre-process the given filename (stdin if no filename given).\n"
 		 "The following options are supported:\n"
 		 "    --disable-line-continuations      Do not interpret lines ending with a\n"
-		 "                                      backslash ('\\') as a line continuation.\n");
+		 "                                      backslash ('\\') as a line continuation.\n"
+		 "    --batch                           Pre-process each of the NUL-terminated\n"
+		 "                                      shaders read from stdin, and write the\n"
+		 "                                      info log and output of each, followed\n"
+		 "                                      by a NUL, to stdout.\n");
+}
+
+/* Pre-process every NUL-terminated shader of stdin, so that the tests don't
+ * need a process per shader. Both the info log and the output go to stdout,
+ * in the order they end up in when running glcpp on a single shader with
+ * stderr redirected to stdout.
+ */
+static int
+preprocess_batch (void *ctx, struct gl_context *gl_ctx)
+{
+	size_t size;
+	char *text = load_text_fp (ctx, stdin, &size);
+	const char *end = text + size;
+	int ret = 0;
+
+	if (text == NULL)
+		return 1;
+
+	for (const char *p = text; p < end; p += strlen (p) + 1) {
+		void *shader_ctx = ralloc_context (ctx);
+		char *info_log = ralloc_strdup (shader_ctx, "");
+		const char *shader = p;
+
+		ret |= glcpp_preprocess (shader_ctx, &shader, &info_log,
+					 NULL, NULL, gl_ctx);
+
+		printf ("%s%s", info_log, shader);
+		putchar ('\0');
+		fflush (stdout);
+
+		ralloc_free (shader_ctx);
+	}
+
+	return ret;
 }
 
 enum {
-	DISABLE_LINE_CONTINUATIONS_OPT = CHAR_MAX + 1
+	DISABLE_LINE_CONTINUATIONS_OPT = CHAR_MAX + 1,
+	BATCH_OPT
 };
 
 static const struct option
 long_options[] = {
 	{"disable-line-continuations", no_argument, 0, DISABLE_LINE_CONTINUATIONS_OPT },
+	{"batch",                      no_argument, 0, BATCH_OPT },
         {"debug",                      no_argument, 0, 'd'},
 	{0,                            0,           0, 0 }
 };
@@ -140,6 +184,7 @@ main (int argc, char *argv[])
 	int ret;
 	struct gl_context gl_ctx;
 	int c;
+	bool batch = false;
 
 	init_fake_gl_context (&gl_ctx);
 
@@ -148,6 +193,9 @@ main (int argc, char *argv[])
 		case DISABLE_LINE_CONTINUATIONS_OPT:
 			gl_ctx.Const.DisableGLSLLineContinuations = true;
 			break;
+		case BATCH_OPT:
+			batch = true;
+			break;
                 case 'd':
 			glcpp_parser_debug = 1;
 			break;
@@ -166,6 +214,18 @@ main (int argc, char *argv[])
 		filename = argv[optind];
 	}
 
+	if (batch) {
+		if (filename) {
+			printf ("--batch reads from stdin\n");
+			usage ();
+			exit (1);
+		}
+		_mesa_locale_init();
+		ret = preprocess_batch (ctx, &gl_ctx);
+		ralloc_free(ctx);
+		return ret;
+	}
+
 	shader = load_text_file (ctx, filename);
 	if (shader == NULL)
 	   return 1;
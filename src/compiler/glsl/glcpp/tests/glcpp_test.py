@@ -22,12 +22,14 @@
 """Run glcpp tests with various line endings."""
 
 import argparse
+import concurrent.futures
 import difflib
 import errno
 import io
 import os
 import subprocess
 import sys
+import time
 
 # The meson version handles windows paths better, but if it's not available
 # fall back to shlex
@@ -45,9 +47,17 @@ def arg_parser():
     parser.add_argument('--windows', action='store_true', help='Run tests for Windows/Dos style newlines')
     parser.add_argument('--oldmac', action='store_true', help='Run tests for Old Mac (pre-OSX) style newlines')
     parser.add_argument('--bizarro', action='store_true', help='Run tests for Bizarro world style newlines')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count(),
+                        help='Number of glcpp processes to run at once')
+    parser.add_argument('--batch-size', type=int, default=16,
+                        help='Number of tests to run in each glcpp process')
     return parser.parse_args()
 
 
+class GeneralError(Exception):
+    """glcpp returned a general error, possibly a missing linker."""
+
+
 def parse_test_file(contents, nl_format):
     """Check for any special arguments and return them as a list."""
     # Disable "universal newlines" mode; we can't directly use `nl_format` as
@@ -59,6 +69,20 @@ def parse_test_file(contents, nl_format):
     return []
 
 
+def check_output(actual, expfile):
+    """Compare the output of glcpp to what we expect."""
+    with open(expfile, 'r') as f:
+        expected = f.read()
+
+    # Bison 3.6 changed '$end' to 'end of file' in its error messages
+    # See: https://gitlab.freedesktop.org/mesa/mesa/-/issues/3181
+    actual = actual.replace('$end', 'end of file')
+
+    if actual == expected:
+        return (True, [])
+    return (False, list(difflib.unified_diff(actual.splitlines(), expected.splitlines())))
+
+
 def test_output(glcpp, contents, expfile, nl_format='\n'):
     """Test that the output of glcpp is what we expect."""
     extra_args = parse_test_file(contents, nl_format)
@@ -72,72 +96,97 @@ def test_output(glcpp, contents, expfile, nl_format='\n'):
     actual = actual.decode('utf-8')
 
     if proc.returncode == 255:
-        print("Test returned general error, possibly missing linker")
-        sys.exit(77)
+        raise GeneralError()
 
-    with open(expfile, 'r') as f:
-        expected = f.read()
+    return check_output(actual, expfile)
 
-    # Bison 3.6 changed '$end' to 'end of file' in its error messages
-    # See: https://gitlab.freedesktop.org/mesa/mesa/-/issues/3181
-    actual = actual.replace('$end', 'end of file')
 
-    if actual == expected:
-        return (True, [])
-    return (False, difflib.unified_diff(actual.splitlines(), expected.splitlines()))
+def test_batch(glcpp, extra_args, tests, nl_format):
+    """Test the output of glcpp for tests using the same arguments, all
+    pre-processed by a single glcpp process.
 
+    glcpp --batch reads NUL-terminated shaders, and follows the output of
+    each with a NUL. If it prints anything on stderr or doesn't process all
+    of them, they are tested again one by one, to know which one it comes
+    from.
+    """
+    proc = subprocess.Popen(
+        glcpp + extra_args + ['--batch'],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        stdin=subprocess.PIPE)
+    out, err = proc.communicate(b''.join(contents + b'\0' for contents, _ in tests))
 
-def test_unix(args):
-    """Test files with unix style (\n) new lines."""
-    total = 0
-    passed = 0
+    if proc.returncode == 255:
+        raise GeneralError()
+
+    outputs = out.decode('utf-8').split('\0')[:-1]
+    if err or len(outputs) != len(tests):
+        return [test_output(glcpp, contents, expfile, nl_format)
+                for contents, expfile in tests]
+
+    return [check_output(actual, expfile)
+            for actual, (_, expfile) in zip(outputs, tests)]
 
-    print('============= Testing for Correctness (Unix) =============')
+
+def submit_tests(args, executor, replace=None):
+    """Start testing all the files, with their newlines replaced by replace if
+    it isn't None.
+
+    Returns the name of each test along with the future and the index of its
+    result in it.
+    """
+    nl_format = '\n' if replace is None else replace
+    names = []
+    tests = []
     for filename in os.listdir(args.testdir):
         if not filename.endswith('.c'):
             continue
 
-        print(   '{}:'.format(os.path.splitext(filename)[0]), end=' ')
-        total += 1
-
         testfile = os.path.join(args.testdir, filename)
-        with open(testfile, 'rb') as f:
-            contents = f.read()
-        valid, diff = test_output(args.glcpp, contents, testfile + '.expected')
-        if valid:
-            passed += 1
-            print('PASS')
+        if replace is None:
+            with open(testfile, 'rb') as f:
+                contents = f.read()
         else:
-            print('FAIL')
-            for l in diff:
-                print(l, file=sys.stderr)
+            with open(testfile, 'rt') as f:
+                contents = f.read()
+            contents = contents.replace('\n', replace).encode('utf-8')
 
-    if not total:
+        names.append(os.path.splitext(filename)[0])
+        tests.append((contents, testfile + '.expected'))
+
+    if not tests:
         raise Exception('Could not find any tests.')
 
-    print('{}/{}'.format(passed, total), 'tests returned correct results')
-    return total == passed
+    # Tests with the same glcpp-args are batched together
+    groups = {}
+    for i, (contents, _) in enumerate(tests):
+        extra_args = tuple(parse_test_file(contents, nl_format))
+        groups.setdefault(extra_args, []).append(i)
+
+    results = [None] * len(tests)
+    for extra_args, indices in groups.items():
+        for start in range(0, len(indices), args.batch_size):
+            batch = indices[start:start + args.batch_size]
+            future = executor.submit(test_batch, args.glcpp, list(extra_args),
+                                     [tests[i] for i in batch], nl_format)
+            for j, i in enumerate(batch):
+                results[i] = (future, j)
+
+    return [(name, future, j) for name, (future, j) in zip(names, results)]
 
 
-def _replace_test(args, replace):
-    """Test files with non-unix style line endings. Print your own header."""
+def report(header, results):
+    """Print the results of the tests in order."""
     total = 0
     passed = 0
 
-    for filename in os.listdir(args.testdir):
-        if not filename.endswith('.c'):
-            continue
-
-        print(   '{}:'.format(os.path.splitext(filename)[0]), end=' ')
+    print('============= Testing for Correctness ({}) ============='.format(header))
+    for name, future, j in results:
+        print(   '{}:'.format(name), end=' ')
         total += 1
-        testfile = os.path.join(args.testdir, filename)
-
-        with open(testfile, 'rt') as f:
-            contents = f.read()
-        contents = contents.replace('\n', replace).encode('utf-8')
-        valid, diff = test_output(
-            args.glcpp, contents, testfile + '.expected', nl_format=replace)
 
+        valid, diff = future.result()[j]
         if valid:
             passed += 1
             print('PASS')
@@ -146,30 +195,21 @@ def _replace_test(args, replace):
             for l in diff:
                 print(l, file=sys.stderr)
 
-    if not total:
-        raise Exception('Could not find any tests.')
-
     print('{}/{}'.format(passed, total), 'tests returned correct results')
     return total == passed
 
 
-def test_windows(args):
-    """Test files with windows/dos style (\r\n) new lines."""
-    print('============= Testing for Correctness (Windows) =============')
-    return _replace_test(args, '\r\n')
-
-
-def test_oldmac(args):
-    """Test files with Old Mac style (\r) new lines."""
-    print('============= Testing for Correctness (Old Mac) =============')
-    return _replace_test(args, '\r')
-
-
-def test_bizarro(args):
-    """Test files with Bizarro world style (\n\r) new lines."""
+MODES = [
+    # Unix style (\n) new lines
+    ('unix', 'Unix', None),
+    # Windows/dos style (\r\n) new lines
+    ('windows', 'Windows', '\r\n'),
+    # Old Mac style (\r) new lines
+    ('oldmac', 'Old Mac', '\r'),
+    # Bizarro world style (\n\r) new lines
     # This is allowed by the spec, but why?
-    print('============= Testing for Correctness (Bizarro) =============')
-    return _replace_test(args, '\n\r')
+    ('bizarro', 'Bizarro', '\n\r'),
+]
 
 
 def main():
@@ -182,15 +222,18 @@ def main():
         args.glcpp = [args.glcpp]
 
     success = True
+    start = time.monotonic()
     try:
-        if args.unix:
-            success = success and test_unix(args)
-        if args.windows:
-            success = success and test_windows(args)
-        if args.oldmac:
-            success = success and test_oldmac(args)
-        if args.bizarro:
-            success = success and test_bizarro(args)
+        with concurrent.futures.ProcessPoolExecutor(args.jobs) as executor:
+            # Submit the tests of all the modes up front, so that they all
+            # run in parallel, and then print their results in order.
+            modes = [(header, submit_tests(args, executor, replace))
+                     for mode, header, replace in MODES if getattr(args, mode)]
+            for header, results in modes:
+                success = report(header, results) and success
+    except GeneralError:
+        print("Test returned general error, possibly missing linker")
+        sys.exit(77)
     except OSError as e:
         if e.errno == errno.ENOEXEC:
             print('Skipping due to inability to run host binaries.',
@@ -198,6 +241,9 @@ def main():
             sys.exit(77)
         raise
 
+    total = sum(len(results) for _, results in modes)
+    print('Ran {} tests, {} at once, in {:.2f}s'.format(
+        total, args.jobs, time.monotonic() - start))
     exit(0 if success else 1)
 
 
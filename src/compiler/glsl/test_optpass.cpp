@@ -34,7 +34,9 @@
 
 #include <string>
 #include <iostream>
+#include <iterator>
 #include <sstream>
+#include <vector>
 #include <getopt.h>
 
 #include "ast.h"
@@ -118,7 +120,7 @@ do_optimization(struct exec_list *ir, const char *optimization,
 }
 
 static GLboolean
-do_optimization_passes(struct exec_list *ir, char **optimizations,
+do_optimization_passes(struct exec_list *ir, const char * const *optimizations,
                        int num_optimizations, bool quiet,
                        const struct gl_shader_compiler_options *options)
 {
@@ -141,40 +143,13 @@ do_optimization_passes(struct exec_list *ir, char **optimizations,
    return overall_progress;
 }
 
-int test_optpass(int argc, char **argv)
+static int
+run_optpass(const char *input, const char * const *optimizations,
+            int num_optimizations, int input_format_ir, int loop,
+            int shader_type, int quiet)
 {
-   int input_format_ir = 0; /* 0=glsl, 1=ir */
-   int loop = 0;
-   int shader_type = GL_VERTEX_SHADER;
-   int quiet = 0;
    int error;
 
-   const struct option optpass_opts[] = {
-      { "input-ir", no_argument, &input_format_ir, 1 },
-      { "input-glsl", no_argument, &input_format_ir, 0 },
-      { "loop", no_argument, &loop, 1 },
-      { "vertex-shader", no_argument, &shader_type, GL_VERTEX_SHADER },
-      { "fragment-shader", no_argument, &shader_type, GL_FRAGMENT_SHADER },
-      { "quiet", no_argument, &quiet, 1 },
-      { NULL, 0, NULL, 0 }
-   };
-
-   int idx = 0;
-   int c;
-   while ((c = getopt_long(argc, argv, "", optpass_opts, &idx)) != -1) {
-      if (c != 0) {
-         printf("*** usage: %s optpass <optimizations> <options>\n", argv[0]);
-         printf("\n");
-         printf("Possible options are:\n");
-         printf("  --input-ir: input format is IR\n");
-         printf("  --input-glsl: input format is GLSL (the default)\n");
-         printf("  --loop: run optimizations repeatedly until no progress\n");
-         printf("  --vertex-shader: test with a vertex shader (the default)\n");
-         printf("  --fragment-shader: test with a fragment shader\n");
-         exit(EXIT_FAILURE);
-      }
-   }
-
    struct gl_context local_ctx;
    struct gl_context *ctx = &local_ctx;
    initialize_context_to_defaults(ctx, API_OPENGL_COMPAT);
@@ -185,17 +160,15 @@ int test_optpass(int argc, char **argv)
    shader->Type = shader_type;
    shader->Stage = _mesa_shader_enum_to_shader_stage(shader_type);
 
-   string input = read_stdin_to_eof();
-
    struct _mesa_glsl_parse_state *state
       = new(shader) _mesa_glsl_parse_state(ctx, shader->Stage, shader);
 
    if (input_format_ir) {
       shader->ir = new(shader) exec_list;
       _mesa_glsl_initialize_types(state);
-      _mesa_glsl_read_ir(state, shader->ir, input.c_str(), true);
+      _mesa_glsl_read_ir(state, shader->ir, input, true);
    } else {
-      shader->Source = input.c_str();
+      shader->Source = input;
       const char *source = shader->Source;
       state->error = glcpp_preprocess(state, &source, &state->info_log,
                                       NULL, NULL, ctx) != 0;
@@ -224,8 +197,9 @@ int test_optpass(int argc, char **argv)
       const struct gl_shader_compiler_options *options =
          &ctx->Const.ShaderCompilerOptions[_mesa_shader_enum_to_shader_stage(shader_type)];
       do {
-         progress = do_optimization_passes(shader->ir, &argv[optind],
-                                           argc - optind, quiet != 0, options);
+         progress = do_optimization_passes(shader->ir, optimizations,
+                                           num_optimizations, quiet != 0,
+                                           options);
       } while (loop && progress);
    }
 
@@ -254,3 +228,89 @@ int test_optpass(int argc, char **argv)
    return error;
 }
 
+int test_optpass(int argc, char **argv)
+{
+   int input_format_ir = 0; /* 0=glsl, 1=ir */
+   int loop = 0;
+   int shader_type = GL_VERTEX_SHADER;
+   int quiet = 0;
+   int batch = 0;
+
+   const struct option optpass_opts[] = {
+      { "input-ir", no_argument, &input_format_ir, 1 },
+      { "input-glsl", no_argument, &input_format_ir, 0 },
+      { "loop", no_argument, &loop, 1 },
+      { "vertex-shader", no_argument, &shader_type, GL_VERTEX_SHADER },
+      { "fragment-shader", no_argument, &shader_type, GL_FRAGMENT_SHADER },
+      { "quiet", no_argument, &quiet, 1 },
+      { "batch", no_argument, &batch, 1 },
+      { NULL, 0, NULL, 0 }
+   };
+
+   int idx = 0;
+   int c;
+   while ((c = getopt_long(argc, argv, "", optpass_opts, &idx)) != -1) {
+      if (c != 0) {
+         printf("*** usage: %s optpass <optimizations> <options>\n", argv[0]);
+         printf("\n");
+         printf("Possible options are:\n");
+         printf("  --input-ir: input format is IR\n");
+         printf("  --input-glsl: input format is GLSL (the default)\n");
+         printf("  --loop: run optimizations repeatedly until no progress\n");
+         printf("  --vertex-shader: test with a vertex shader (the default)\n");
+         printf("  --fragment-shader: test with a fragment shader\n");
+         printf("  --batch: run the NUL-terminated tests read from stdin, each\n");
+         printf("           made of its optimizations, one per line, an empty\n");
+         printf("           line and its input, and NUL-terminate each output\n");
+         exit(EXIT_FAILURE);
+      }
+   }
+
+   if (!batch) {
+      string input = read_stdin_to_eof();
+      return run_optpass(input.c_str(), &argv[optind], argc - optind,
+                         input_format_ir, loop, shader_type, quiet);
+   }
+
+   /* Running all the tests in a single process saves the tests runner
+    * from starting a process for each of them.
+    */
+   string tests((istreambuf_iterator<char>(cin)), istreambuf_iterator<char>());
+   int error = 0;
+   size_t pos = 0;
+   while (pos < tests.size()) {
+      size_t end = tests.find('\0', pos);
+      if (end == string::npos)
+         end = tests.size();
+
+      /* The optimizations end at the first empty line */
+      vector<string> optimizations;
+      size_t input = pos;
+      for (;;) {
+         size_t line = input;
+         size_t eol = tests.find('\n', line);
+         if (eol >= end) {
+            input = end;
+            break;
+         }
+         input = eol + 1;
+         if (eol == line)
+            break;
+         optimizations.push_back(tests.substr(line, eol - line));
+      }
+
+      vector<const char *> names;
+      for (const string &optimization : optimizations)
+         names.push_back(optimization.c_str());
+
+      string source = tests.substr(input, end - input);
+      error |= run_optpass(source.c_str(), names.data(), names.size(),
+                           input_format_ir, loop, shader_type, quiet);
+      putchar('\0');
+      fflush(stdout);
+
+      pos = end + 1;
+   }
+
+   return error;
+}
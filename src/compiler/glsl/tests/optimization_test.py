@@ -22,11 +22,13 @@
 """Script to generate and run glsl optimization tests."""
 
 import argparse
+import concurrent.futures
 import difflib
 import errno
 import os
 import subprocess
 import sys
+import time
 
 import sexps
 import lower_jump_cases
@@ -45,6 +47,16 @@ def arg_parser():
         '--test-runner',
         required=True,
         help='The glsl_test binary.')
+    parser.add_argument(
+        '-j', '--jobs',
+        type=int,
+        default=os.cpu_count(),
+        help='Number of glsl_test processes to run at once.')
+    parser.add_argument(
+        '--batch-size',
+        type=int,
+        default=16,
+        help='Number of tests to run in each glsl_test process.')
     return parser.parse_args()
 
 
@@ -70,48 +82,96 @@ def get_test_runner(runner):
     return split_args(wrapper) + [runner]
 
 
+class GeneralError(Exception):
+    """glsl_test returned a general error, possibly a missing linker."""
+
+
+def check_output(out, err, expected):
+    """Return whether the test passed, and what to print on stdout and
+    stderr."""
+    if err:
+        return False, ['FAIL', 'Unexpected output on stderr: {}'.format(err)], []
+
+    result = compare(out, expected)
+    if result is not None:
+        return False, ['FAIL'], list(result)
+    return True, ['PASS'], []
+
+
+def run_test(runner, name, opt, source, expected):
+    """Run a single test in its own glsl_test process."""
+    proc = subprocess.Popen(
+        runner + ['optpass', '--quiet', '--input-ir', opt],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        stdin=subprocess.PIPE)
+    out, err = proc.communicate(source.encode('utf-8'))
+
+    if proc.returncode == 255:
+        raise GeneralError()
+
+    return check_output(out.decode('utf-8'), err.decode('utf-8'), expected)
+
+
+def run_batch(runner, tests):
+    """Run tests in a single glsl_test process.
+
+    Each test is sent as its optimization, an empty line and its IR, followed
+    by a NUL, and glsl_test follows the output of each with a NUL. If
+    glsl_test prints anything on stderr or doesn't run all the tests, they are
+    run again one by one, to know which one it comes from.
+    """
+    proc = subprocess.Popen(
+        runner + ['optpass', '--quiet', '--input-ir', '--batch'],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        stdin=subprocess.PIPE)
+    out, err = proc.communicate(b''.join(
+        '{}\n\n{}\0'.format(opt, source).encode('utf-8')
+        for _, opt, source, _ in tests))
+
+    if proc.returncode == 255:
+        raise GeneralError()
+
+    outputs = out.decode('utf-8').split('\0')[:-1]
+    if err or len(outputs) != len(tests):
+        return [run_test(runner, *test) for test in tests]
+
+    return [check_output(output, '', test[3])
+            for test, output in zip(tests, outputs)]
+
+
 def main():
     """Generate each test and report pass or fail."""
     args = arg_parser()
 
-    total = 0
-    passes = 0
-
     runner = get_test_runner(args.test_runner)
 
-    for gen in lower_jump_cases.CASES:
-        for name, opt, source, expected in gen():
-            total += 1
-            print('{}: '.format(name), end='')
-            proc = subprocess.Popen(
-                runner + ['optpass', '--quiet', '--input-ir', opt],
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                stdin=subprocess.PIPE)
-            out, err = proc.communicate(source.encode('utf-8'))
-            out = out.decode('utf-8')
-            err = err.decode('utf-8')
-
-            if proc.returncode == 255:
-                print("Test returned general error, possibly missing linker")
-                sys.exit(77)
-
-            if err:
-                print('FAIL')
-                print('Unexpected output on stderr: {}'.format(err),
-                      file=sys.stdout)
-                continue
-
-            result = compare(out, expected)
-            if result is not None:
-                print('FAIL')
-                for l in result:
-                    print(l, file=sys.stderr)
-            else:
-                print('PASS')
-                passes += 1
+    tests = [test for gen in lower_jump_cases.CASES for test in gen()]
+    batches = [tests[i:i + args.batch_size]
+               for i in range(0, len(tests), args.batch_size)]
+
+    start = time.monotonic()
+    passes = 0
+
+    # The batches run in parallel, but their results are printed in order.
+    with concurrent.futures.ProcessPoolExecutor(args.jobs) as executor:
+        try:
+            results = executor.map(run_batch, [runner] * len(batches), batches)
+            for batch, batch_results in zip(batches, results):
+                for (name, _, _, _), (passed, out, err) in zip(batch, batch_results):
+                    print('{}: {}'.format(name, '\n'.join(out)))
+                    for l in err:
+                        print(l, file=sys.stderr)
+                    passes += passed
+        except GeneralError:
+            print("Test returned general error, possibly missing linker")
+            sys.exit(77)
 
+    total = len(tests)
     print('{}/{} tests returned correct results'.format(passes, total))
+    print('Ran {} tests in {} batches, {} at once, in {:.2f}s'.format(
+        total, len(batches), args.jobs, time.monotonic() - start))
     exit(0 if passes == total else 1)
 
 
@@ -25,9 +25,13 @@
 
 import ast
 from collections import defaultdict
+import hashlib
 import itertools
+import json
+import os
 import struct
 import sys
+import mako
 import mako.template
 import re
 import traceback
@@ -766,6 +770,12 @@ class BitSizeValidator(object):
 
 _optimization_ids = itertools.count()
 
+def _peek_optimization_id():
+   global _optimization_ids
+   next_id = next(_optimization_ids)
+   _optimization_ids = itertools.count(next_id)
+   return next_id
+
 condition_list = ['true']
 
 class SearchAndReplace(object):
@@ -881,6 +891,8 @@ class TreeAutomaton(object):
          # This the set of opcodes for parents of this item. Used to speed up
          # filtering.
          self.parent_ops = set()
+         # Bit representing this item in the bitsets used as match sets.
+         self.bit = 0
 
       def __str__(self):
          return '(' + ', '.join([self.opcode] + [str(c) for c in self.children]) + ')'
@@ -946,6 +958,39 @@ class TreeAutomaton(object):
       for i, pattern in enumerate(self.patterns):
          process_subpattern(pattern, i)
 
+      # Number the deduplicated items, so that sets of items can be
+      # represented as integer bitsets.
+      self.item_list = self.IndexMap(self.items.values())
+      for i, item in enumerate(self.item_list):
+         item.bit = 1 << i
+
+   def _item_set(self, bits):
+      """Return the list of items in a bitset."""
+      items = []
+      while bits:
+         low = bits & -bits
+         items.append(self.item_list[low.bit_length() - 1])
+         bits ^= low
+      return items
+
+   @staticmethod
+   def _new_src_indices(num_filtered, worklist_index, num_srcs):
+      """Generate the same tuples as itertools.product(range(num_filtered),
+      repeat=num_srcs), in the same order, except for those where every index
+      is below worklist_index, without enumerating those.
+      """
+      if num_srcs == 0:
+         return
+      all_srcs = range(num_filtered)
+      new_srcs = range(worklist_index, num_filtered)
+      for prefix in itertools.product(all_srcs, repeat=num_srcs - 1):
+         if max(prefix, default=-1) < worklist_index:
+            for src_idx in new_srcs:
+               yield prefix + (src_idx,)
+         else:
+            for src_idx in all_srcs:
+               yield prefix + (src_idx,)
+
    def _build_table(self):
       """This is the core algorithm which builds up the transition table. It
       is based off of Algorithm 5.7.38 "Reachability-based tabulation of Cl .
@@ -953,6 +998,8 @@ class TreeAutomaton(object):
       simultaneously builds up a list of all possible "match sets" or
       "states", where each match set represents the set of Item's that match a
       given instruction, and builds up the transition table between states.
+
+      Match sets, and filtered match sets, are integer bitsets of Item.bit.
       """
       # Map from opcode + filtered state indices to transitioned state.
       self.table = defaultdict(dict)
@@ -970,12 +1017,40 @@ class TreeAutomaton(object):
       # q_{a,j} in the original algorithm is len(self.rep[op]).
       self.rep = defaultdict(self.IndexMap)
 
+      # Filtering a state for an opcode only keeps the items which can be a
+      # source of that opcode, so it is a single AND with a mask. Opcodes
+      # with the same mask see the same filtered states in the same order,
+      # so they share their filter table and representor set, and each state
+      # is only filtered once per distinct mask.
+      filter_masks = defaultdict(int)
+      for item in self.item_list:
+         for op in item.parent_ops:
+            filter_masks[op] |= item.bit
+      filter_groups = {}
+      for op in self.opcodes:
+         group = filter_groups.setdefault(filter_masks[op],
+                                          (self.filter[op], self.rep[op]))
+         self.filter[op], self.rep[op] = group
+
+      # Comp_a is computed on the (item_srcs, item) pairs of each opcode,
+      # including the swapped sources of commutative items. For every
+      # opcode, source and filtered state, src_masks has a bitset of the
+      # pairs whose item for that source is in the filtered state; ANDing
+      # them for all sources gives the pairs matched by a combination of
+      # filtered states. They are filled in as new filtered states appear.
+      op_items = defaultdict(list)
+      for (op, item_srcs), item in self.items.items():
+         if item_srcs:
+            op_items[op].append((item_srcs, item))
+      src_masks = {}
+
       # Everything in self.states with a index at least worklist_index is part
       # of the worklist of newly created states. There is also a worklist of
       # newly fitered states for each opcode, for which worklist_indices
       # serves a similar purpose. worklist_index corresponds to p in the
       # original algorithm, while worklist_indices is p_{a,j} (although since
-      # we only filter by opcode/symbol, it's really just p_a).
+      # we only filter by opcode/symbol, it's really just p_a). Since states
+      # are identified by their index, the worklists are just index ranges.
       self.worklist_index = 0
       worklist_indices = defaultdict(lambda: 0)
 
@@ -997,7 +1072,8 @@ class TreeAutomaton(object):
             # deduplicating them here. However, we do have to sort them so
             # that they're visited at runtime in the order they're specified
             # in the source.
-            patterns = list(sorted(p for item in state for p in item.patterns))
+            patterns = list(sorted(p for item in self._item_set(state)
+                                     for p in item.patterns))
 
             if patterns:
                 # Add our patterns to the global table.
@@ -1010,18 +1086,19 @@ class TreeAutomaton(object):
 
             # calculate filter table for this state, and update filtered
             # worklists.
-            for op in self.opcodes:
-               filt = self.filter[op]
-               rep = self.rep[op]
-               filtered = frozenset(item for item in state if \
-                  op in item.parent_ops)
-               if filtered in rep:
-                  rep_index = rep.index(filtered)
-               else:
+            new_masks = set()
+            for mask, (filt, rep) in filter_groups.items():
+               filtered = state & mask
+               rep_index = rep.map.get(filtered)
+               if rep_index is None:
                   rep_index = rep.add(filtered)
-                  new_opcodes.add(op)
+                  new_masks.add(mask)
                assert len(filt) == self.worklist_index
                filt.append(rep_index)
+            if new_masks:
+               for op in self.opcodes:
+                  if filter_masks[op] in new_masks:
+                     new_opcodes.add(op)
             self.worklist_index += 1
 
       # There are two start states: one which can only match as a wildcard,
@@ -1030,8 +1107,8 @@ class TreeAutomaton(object):
       # respectively. The indices of these must match the definitions of
       # WILDCARD_STATE and CONST_STATE below, so that the runtime C code can
       # initialize things correctly.
-      self.states.add(frozenset((self.wildcard,)))
-      self.states.add(frozenset((self.const,self.wildcard)))
+      self.states.add(self.wildcard.bit)
+      self.states.add(self.const.bit | self.wildcard.bit)
       process_new_states()
 
       while len(new_opcodes) > 0:
@@ -1044,28 +1121,112 @@ class TreeAutomaton(object):
             else:
                num_srcs = opcodes[op].num_inputs
 
+            pairs = op_items[op]
+            pair_items = [item.bit for item_srcs, item in pairs]
+            masks = src_masks.setdefault(op, [[] for i in range(num_srcs)])
+            for i, src_mask in enumerate(masks):
+               for filtered in rep.objects[len(src_mask):]:
+                  mask = 0
+                  for j, (item_srcs, item) in enumerate(pairs):
+                     if item_srcs[i].bit & filtered:
+                        mask |= 1 << j
+                  src_mask.append(mask)
+            all_pairs = (1 << len(pairs)) - 1
+
             # Iterate over all possible source combinations where at least one
             # is on the worklist.
-            for src_indices in itertools.product(range(len(rep)), repeat=num_srcs):
-               if all(src_idx < op_worklist_index for src_idx in src_indices):
-                  continue
-
-               srcs = tuple(rep[src_idx] for src_idx in src_indices)
-
-               # Try all possible pairings of source items and add the
-               # corresponding parent items. This is Comp_a from the paper.
-               parent = set(self.items[op, item_srcs] for item_srcs in
-                  itertools.product(*srcs) if (op, item_srcs) in self.items)
+            for src_indices in self._new_src_indices(len(rep),
+                                                     op_worklist_index,
+                                                     num_srcs):
+               # Find all pairings of source items with a corresponding
+               # parent item. This is Comp_a from the paper.
+               matched = all_pairs
+               for src_mask, src_idx in zip(masks, src_indices):
+                  matched &= src_mask[src_idx]
 
                # We could always start matching something else with a
                # wildcard. This is Cl from the paper.
-               parent.add(self.wildcard)
+               parent = self.wildcard.bit
+               while matched:
+                  low = matched & -matched
+                  parent |= pair_items[low.bit_length() - 1]
+                  matched ^= low
 
-               table[src_indices] = self.states.add(frozenset(parent))
+               table[src_indices] = self.states.add(parent)
             worklist_indices[op] = len(rep)
          new_opcodes.clear()
          process_new_states()
 
+   def table_size(self):
+      """Return the size in bytes of the uncompressed filter and transition
+      tables."""
+      size = 0
+      for op in self.opcodes:
+         if any(self.filter[op]):
+            size += 2 * len(self.filter[op])
+         size += 2 * len(self.table[op])
+      return size
+
+   def compress(self):
+      """Compute a compressed encoding of the filter and transition tables.
+
+      Opcodes share identical filter tables. The transition table of an
+      opcode is split into rows, one for every combination of filtered states
+      of its sources but the last, and the rows of all opcodes are packed
+      into a single array, where identical rows are stored once and rows
+      overlap when the end of one matches the start of the next. Every
+      opcode then has a table of row offsets into that array.
+      """
+      if hasattr(self, 'packed_table'):
+         return
+
+      # Distinct non-zero filter tables, and the index of each opcode's.
+      self.filters = self.IndexMap()
+      self.filter_index = {}
+      for op in self.opcodes:
+         if any(self.filter[op]):
+            self.filter_index[op] = self.filters.add(tuple(self.filter[op]))
+
+      # Rows are packed as strings with one character per entry, which makes
+      # looking for them in what has been packed so far cheap.
+      def op_rows(op):
+         table = self.table[op]
+         num_filtered = len(self.rep[op])
+         num_srcs = len(next(iter(table)))
+         for prefix in itertools.product(range(num_filtered),
+                                         repeat=num_srcs - 1):
+            yield ''.join(chr(table[prefix + (src_idx,)])
+                          for src_idx in range(num_filtered))
+
+      rows = {}
+      for op in self.opcodes:
+         for row in op_rows(op):
+            rows.setdefault(row, None)
+
+      packed = ''
+      # Longer rows first, so that shorter ones are more likely to be found
+      # in them.
+      for row in sorted(rows, key=len, reverse=True):
+         offset = packed.find(row)
+         if offset < 0:
+            overlap = min(len(row), len(packed)) - 1
+            while overlap > 0 and not packed.endswith(row[:overlap]):
+               overlap -= 1
+            offset = len(packed) - max(overlap, 0)
+            packed += row[len(packed) - offset:]
+         rows[row] = offset
+
+      self.packed_table = [ord(c) for c in packed]
+      self.row_offsets = {}
+      for op in self.opcodes:
+         self.row_offsets[op] = [rows[row] for row in op_rows(op)]
+
+   def compressed_table_size(self):
+      """Return the size in bytes of the tables emitted by compress()."""
+      return (2 * sum(len(f) for f in self.filters) +
+              2 * len(self.packed_table) +
+              4 * sum(len(offsets) for offsets in self.row_offsets.values()))
+
 _algebraic_pass_template = mako.template.Template("""
 #include "nir.h"
 #include "nir_builder.h"
@@ -1115,9 +1276,40 @@ static const struct transform ${pass_name}_transforms[] = {
 % endfor
 };
 
+% if compressed:
+% for i, filt in enumerate(automaton.filters):
+static const uint16_t ${pass_name}_filter${i}[] = {
+% for e in filt:
+   ${e},
+% endfor
+};
+
+% endfor
+/* Transition table rows of all opcodes, see per_op_table::row_offsets */
+static const uint16_t ${pass_name}_packed_table[] = {
+% for e in automaton.packed_table:
+   ${e},
+% endfor
+};
+
+% endif
 static const struct per_op_table ${pass_name}_pass_op_table[nir_num_search_ops] = {
 % for op in automaton.opcodes:
    [${get_c_opcode(op)}] = {
+% if compressed:
+% if op in automaton.filter_index:
+      .filter = ${pass_name}_filter${automaton.filter_index[op]},
+% else:
+      .filter = NULL,
+% endif
+      .num_filtered_states = ${len(automaton.rep[op])},
+      .table = ${pass_name}_packed_table,
+      .row_offsets = (const uint32_t []) {
+      % for offset in automaton.row_offsets[op]:
+         ${offset},
+      % endfor
+      },
+% else:
 % if all(e == 0 for e in automaton.filter[op]):
       .filter = NULL,
 % else:
@@ -1139,6 +1331,7 @@ static const struct per_op_table ${pass_name}_pass_op_table[nir_num_search_ops]
          ${automaton.table[op][indices]},
       % endfor
       },
+% endif
    },
 % endfor
 };
@@ -1150,6 +1343,38 @@ static const uint16_t ${pass_name}_transform_offsets[] = {
 % endfor
 };
 
+% if profile:
+/* Transform counters by Python source line */
+static const char *const ${pass_name}_profile_sources[] = {
+% for source in profile['sources']:
+   ${c_string(source)},
+% endfor
+};
+
+static const char *const ${pass_name}_profile_transforms[] = {
+% for transforms in profile['transforms']:
+   ${c_string(transforms)},
+% endfor
+};
+
+static const uint16_t ${pass_name}_transform_counter[] = {
+% for i in automaton.state_patterns:
+   ${0 if i is None else profile['counter'][i]},
+% endfor
+};
+
+static nir_algebraic_transform_counters ${pass_name}_counters[${len(profile['sources'])}];
+
+static nir_algebraic_profile ${pass_name}_profile = {
+   .pass_name = "${pass_name}",
+   .num_counters = ${len(profile['sources'])},
+   .sources = ${pass_name}_profile_sources,
+   .transforms = ${pass_name}_profile_transforms,
+   .transform_counter = ${pass_name}_transform_counter,
+   .counters = ${pass_name}_counters,
+};
+
+% endif
 static const nir_algebraic_table ${pass_name}_table = {
    .transforms = ${pass_name}_transforms,
    .transform_offsets = ${pass_name}_transform_offsets,
@@ -1157,6 +1382,9 @@ static const nir_algebraic_table ${pass_name}_table = {
    .values = ${pass_name}_values,
    .expression_cond = ${ pass_name + "_expression_cond" if expression_cond else "NULL" },
    .variable_cond = ${ pass_name + "_variable_cond" if variable_cond else "NULL" },
+% if profile:
+   .profile = &${pass_name}_profile,
+% endif
 };
 
 bool
@@ -1186,11 +1414,254 @@ ${pass_name}(nir_shader *shader)
 """)
 
 
+class AlgebraicCache(object):
+   """A content-addressed cache of generated algebraic passes.
+
+   Building the automaton and rendering a pass is by far the most expensive
+   part of running the generators, so when NIR_ALGEBRAIC_CACHE_DIR is set
+   in the environment, the rendered C code of each pass is stored there,
+   keyed by a hash of the transforms, of the generator sources and of the
+   global state of this module that the output depends on (the list of
+   conditions and the transform ids). The directory can be shared between
+   build trees.
+   """
+
+   _source_hash = None
+
+   def __init__(self, directory):
+      self.directory = directory
+
+   @staticmethod
+   def from_environment():
+      directory = os.environ.get('NIR_ALGEBRAIC_CACHE_DIR')
+      if not directory:
+         return None
+      return AlgebraicCache(directory)
+
+   @classmethod
+   def source_hash(cls):
+      if cls._source_hash is None:
+         h = hashlib.sha256()
+         h.update(mako.__version__.encode('utf-8'))
+         for f in (__file__, sys.modules['nir_opcodes'].__file__):
+            with open(f, 'rb') as fp:
+               h.update(fp.read())
+         cls._source_hash = h.hexdigest()
+      return cls._source_hash
+
+   @staticmethod
+   def file_hash(filename):
+      with open(filename, 'rb') as fp:
+         return hashlib.sha256(fp.read()).hexdigest()
+
+   def key(self, *parts):
+      """Return the cache key for parts, or None if they cannot be
+      reproducibly serialized."""
+      text = repr(parts)
+      # Objects without a meaningful repr() (already parsed transforms, for
+      # instance) would make the key unstable.
+      if ' object at 0x' in text:
+         return None
+      h = hashlib.sha256(self.source_hash().encode('utf-8'))
+      h.update(text.encode('utf-8'))
+      return h.hexdigest()
+
+   def _path(self, key, ext):
+      return os.path.join(self.directory, key[:2], key + ext)
+
+   def load(self, key, ext):
+      try:
+         with open(self._path(key, ext), 'r', encoding='utf-8') as f:
+            return f.read()
+      except OSError:
+         return None
+
+   def store(self, key, ext, data):
+      # Write to a temporary file first, since several generators may share
+      # the same cache directory concurrently.
+      path = self._path(key, ext)
+      try:
+         os.makedirs(os.path.dirname(path), exist_ok=True)
+         tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+         with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(data)
+         os.replace(tmp_path, path)
+      except OSError:
+         # The cache is only an optimization.
+         pass
+
+
+def _c_string(s):
+   return '"' + s.replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+class TransformLocator(object):
+   """Finds the Python source line of transforms.
+
+   Transforms are plain tuples by the time they reach AlgebraicPass, so they
+   are matched against the tuple expressions of the script which defined
+   them: literals and f-strings have to match, names which are only assigned
+   once, at the top level of the script, have to have the same value, and
+   anything else (loop variables, function calls, ...) matches anything. The
+   expression with the most matching leaves wins, the first one on ties.
+   """
+   def __init__(self, filename, module_globals):
+      self.globals = module_globals
+      with open(filename) as f:
+         tree = ast.parse(f.read(), filename)
+
+      stores = defaultdict(int)
+      for node in ast.walk(tree):
+         if isinstance(node, ast.Name) and isinstance(node.ctx, ast.Store):
+            stores[node.id] += 1
+         elif isinstance(node, ast.arg):
+            stores[node.arg] += 1
+      self.constant_names = set()
+      for stmt in tree.body:
+         if isinstance(stmt, ast.Assign):
+            for target in stmt.targets:
+               for node in ast.walk(target):
+                  if isinstance(node, ast.Name) and stores[node.id] == 1:
+                     self.constant_names.add(node.id)
+
+      # Candidate transform expressions, by search opcode when it is a
+      # literal.
+      self.candidates = defaultdict(list)
+      self.any_opcode = []
+      for node in ast.walk(tree):
+         if not isinstance(node, ast.Tuple) or \
+               not isinstance(node.ctx, ast.Load) or \
+               not 2 <= len(node.elts) <= 4 or \
+               not isinstance(node.elts[0], (ast.Tuple, ast.Call, ast.Name)):
+            continue
+         search = node.elts[0]
+         if isinstance(search, ast.Tuple) and search.elts and \
+               isinstance(search.elts[0], ast.Constant):
+            self.candidates[search.elts[0].value].append(node)
+         else:
+            self.any_opcode.append(node)
+      self.patterns = {}
+
+   @staticmethod
+   def _equal(a, b):
+      return type(a) is type(b) and a == b
+
+   def _score(self, node, value):
+      """Return the number of leaves of node equal to the corresponding part
+      of value, or None if node cannot have evaluated to value."""
+      if isinstance(node, ast.Tuple):
+         if any(isinstance(elt, ast.Starred) for elt in node.elts):
+            return 0
+         if not isinstance(value, tuple) or len(value) != len(node.elts):
+            return None
+         score = 0
+         for elt, elt_value in zip(node.elts, value):
+            elt_score = self._score(elt, elt_value)
+            if elt_score is None:
+               return None
+            score += elt_score
+         return score
+      elif isinstance(node, (ast.Constant, ast.UnaryOp)):
+         try:
+            literal = ast.literal_eval(node)
+         except ValueError:
+            return 0
+         return 1 if self._equal(literal, value) else None
+      elif isinstance(node, ast.JoinedStr):
+         pattern = self.patterns.get(node)
+         if pattern is None:
+            pattern = ''.join(re.escape(part.value)
+                              if isinstance(part, ast.Constant) else '.*'
+                              for part in node.values)
+            pattern = self.patterns[node] = re.compile(pattern + '$')
+         return 1 if isinstance(value, str) and pattern.match(value) else None
+      elif isinstance(node, ast.Name) and node.id in self.constant_names and \
+            node.id in self.globals:
+         return 1 if self._equal(self.globals[node.id], value) else None
+      else:
+         return 0
+
+   def line(self, transform):
+      """Return the line number of the expression which created transform,
+      or None if it cannot be found."""
+      if not isinstance(transform, tuple):
+         return None
+      search = transform[0]
+      if isinstance(search, SearchExpression):
+         opcode = search.opcode
+      elif isinstance(search, tuple) and search:
+         opcode = search[0]
+      else:
+         return None
+
+      best = None
+      best_score = -1
+      for node in self.candidates.get(opcode, []) + self.any_opcode:
+         score = self._score(node, transform)
+         if score is not None and (score > best_score or (
+               score == best_score and node.lineno < best.lineno)):
+            best = node
+            best_score = score
+      return best.lineno if best is not None else None
+
 class AlgebraicPass(object):
+   _lazy_attributes = ('xforms', 'opcode_xforms', 'expression_cond',
+                       'variable_cond', 'automaton')
+
    def __init__(self, pass_name, transforms):
+      global _optimization_ids
+
+      self.pass_name = pass_name
+      self.transforms = transforms
+      self.first_id = _peek_optimization_id()
+
+      # Where the transforms come from, to find their source lines.
+      self.caller = None
+      if os.environ.get('NIR_ALGEBRAIC_PROFILE'):
+         frame = sys._getframe(1)
+         self.caller = (frame.f_code.co_filename, frame.f_globals)
+
+      self.cache = AlgebraicCache.from_environment()
+      self.cache_key = None
+      if self.cache is not None:
+         self.cache_key = self.cache.key(pass_name, transforms,
+                                         condition_list, self.first_id)
+      if self.cache_key is not None:
+         effects = self.cache.load(self.cache_key, '.json')
+         if effects is not None:
+            # Apply the side effects that building the pass would have had on
+            # the global state, and only build it if it is actually needed.
+            effects = json.loads(effects)
+            condition_list[:] = effects['condition_list']
+            _optimization_ids = itertools.count(effects['next_id'])
+            return
+
+      self._build()
+
+      if self.cache_key is not None:
+         self.cache.store(self.cache_key, '.json', json.dumps({
+            'condition_list': condition_list,
+            'next_id': _peek_optimization_id(),
+         }))
+
+   def __getattr__(self, name):
+      # Only called for attributes that are missing, which happens after a
+      # cache hit: build the pass the same way it would have been originally.
+      if name not in AlgebraicPass._lazy_attributes:
+         raise AttributeError(name)
+
+      global _optimization_ids
+      next_id = _peek_optimization_id()
+      _optimization_ids = itertools.count(self.first_id)
+      try:
+         self._build()
+      finally:
+         _optimization_ids = itertools.count(next_id)
+      return self.__dict__[name]
+
+   def _build(self):
+      transforms = self.transforms
       self.xforms = []
       self.opcode_xforms = defaultdict(lambda : [])
-      self.pass_name = pass_name
       self.expression_cond = {}
       self.variable_cond = {}
 
@@ -1250,7 +1721,88 @@ class AlgebraicPass(object):
 
 
    def render(self):
+      compress = bool(os.environ.get('NIR_ALGEBRAIC_COMPRESS'))
+      profile = self.caller is not None
+      if os.environ.get('NIR_ALGEBRAIC_SIZE_REPORT'):
+         self.report_size()
+
+      render_key = None
+      if self.cache_key is not None:
+         # The output also depends on conditions added by passes built after
+         # this one, and the profiling counters on the source lines of the
+         # transforms.
+         profile_source = None
+         if profile:
+            filename = self.caller[0]
+            profile_source = (filename, AlgebraicCache.file_hash(filename))
+         render_key = self.cache.key(self.cache_key, condition_list, compress,
+                                     profile_source)
+         rendered = self.cache.load(render_key, '.c')
+         if rendered is not None:
+            return rendered
+
+      rendered = self._render(compress, profile)
+
+      if render_key is not None:
+         self.cache.store(render_key, '.c', rendered)
+      return rendered
+
+   def report_size(self):
+      """Print the number of automaton states and the size of its tables,
+      uncompressed and compressed, to stderr."""
+      automaton = self.automaton
+      automaton.compress()
+      size = automaton.table_size()
+      compressed_size = automaton.compressed_table_size()
+      print('{}: {} states, {} bytes of tables, {} bytes compressed '
+            '({:.1f}%)'.format(self.pass_name, len(automaton.states), size,
+                               compressed_size,
+                               100.0 * compressed_size / max(size, 1)),
+            file=sys.stderr)
+
+   def profile_counters(self):
+      """Group the transforms by Python source line, for the profiling
+      counters. Returns the JSON encoded "file:line" and list of transforms
+      of each group, and the group of each transform."""
+      filename, module_globals = self.caller
+      locator = TransformLocator(filename, module_globals)
+      top = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                         '..', '..', '..')
+      relpath = os.path.relpath(filename, top)
+
+      groups = {}
+      transforms = []
+      counter = []
+      # Transforms which fail to parse are fatal, so these line up.
+      for transform, xform in zip(self.transforms, self.xforms):
+         line = locator.line(transform)
+         source = '{}:{}'.format(relpath, line if line is not None else '?')
+         if source not in groups:
+            groups[source] = len(groups)
+            transforms.append([])
+         counter.append(groups[source])
+         transforms[groups[source]].append(
+            '{} => {}'.format(xform.search, xform.replace))
+
+      return {
+         'sources': [json.dumps(source) for source in groups],
+         'transforms': [json.dumps(t) for t in transforms],
+         'counter': counter,
+      }
+
+   def _render(self, compress=False, profile=False):
+      compressed = False
+      if compress:
+         self.automaton.compress()
+         # Small passes are not worth it, the row offsets cost more than
+         # what they save.
+         compressed = (self.automaton.compressed_table_size() <
+                       self.automaton.table_size())
+
       return _algebraic_pass_template.render(pass_name=self.pass_name,
+                                             compressed=compressed,
+                                             profile=self.profile_counters() if profile else None,
+                                             c_string=_c_string,
                                              xforms=self.xforms,
                                              opcode_xforms=self.opcode_xforms,
                                              condition_list=condition_list,
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+# SPDX-License-Identifier: MIT
+
+"""Time the construction of the NIR algebraic passes.
+
+Runs the algebraic pass generators in-process and reports, for every pass,
+how long constructing the AlgebraicPass (parsing the transforms and building
+the tree automaton) and rendering it took. With -b, the generated code is
+also checked to be byte-identical to what nir_algebraic.py from another git
+revision produces, e.g.
+
+  ./nir_algebraic_bench.py -b HEAD~1
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import runpy
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+NIR_DIR = os.path.dirname(os.path.abspath(__file__))
+SRC_DIR = os.path.normpath(os.path.join(NIR_DIR, '..', '..'))
+
+DEFAULT_SCRIPTS = [
+   os.path.join(NIR_DIR, 'nir_opt_algebraic.py'),
+   os.path.join(SRC_DIR, 'panfrost', 'bifrost', 'bifrost_nir_algebraic.py'),
+   os.path.join(SRC_DIR, 'microsoft', 'compiler', 'dxil_nir_algebraic.py'),
+]
+
+
+def run_script(script, algebraic_dir):
+   """Run a generator script with a fresh nir_algebraic module imported
+   from algebraic_dir, and return its output and the per-pass timings."""
+   for name in ('nir_algebraic', 'nir_opcodes'):
+      sys.modules.pop(name, None)
+   sys.path[:0] = [algebraic_dir, NIR_DIR]
+   try:
+      import nir_algebraic
+   finally:
+      del sys.path[:2]
+
+   timings = []
+   pass_init = nir_algebraic.AlgebraicPass.__init__
+   pass_render = nir_algebraic.AlgebraicPass.render
+
+   def timed_init(self, pass_name, transforms):
+      start = time.perf_counter()
+      pass_init(self, pass_name, transforms)
+      timings.append([pass_name, len(transforms),
+                      time.perf_counter() - start, 0.0])
+
+   def timed_render(self):
+      start = time.perf_counter()
+      result = pass_render(self)
+      for timing in timings:
+         if timing[0] == self.pass_name:
+            timing[3] += time.perf_counter() - start
+      return result
+
+   nir_algebraic.AlgebraicPass.__init__ = timed_init
+   nir_algebraic.AlgebraicPass.render = timed_render
+
+   argv = sys.argv
+   sys.argv = [script, '-p', NIR_DIR]
+   output = io.StringIO()
+   try:
+      with contextlib.redirect_stdout(output):
+         runpy.run_path(script, run_name='__main__')
+   finally:
+      sys.argv = argv
+   return output.getvalue(), timings
+
+
+def checkout_baseline(rev, directory):
+   """Write nir_algebraic.py from the given git revision to directory."""
+   source = subprocess.check_output(
+      ['git', 'show', rev + ':./nir_algebraic.py'], cwd=NIR_DIR)
+   with open(os.path.join(directory, 'nir_algebraic.py'), 'wb') as f:
+      f.write(source)
+
+
+def main():
+   parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+   parser.add_argument('scripts', nargs='*', metavar='SCRIPT',
+                       help='algebraic pass generators to run (default: '
+                            'nir_opt_algebraic.py, bifrost_nir_algebraic.py, '
+                            'dxil_nir_algebraic.py)')
+   parser.add_argument('-n', '--repeat', type=int, default=3,
+                       help='number of runs per script, the median is '
+                            'reported (default: %(default)s)')
+   parser.add_argument('-b', '--baseline', metavar='REV',
+                       help='check the output is identical to the one of '
+                            'nir_algebraic.py at git revision REV')
+   args = parser.parse_args()
+
+   # Cached passes would not be constructed at all.
+   os.environ.pop('NIR_ALGEBRAIC_CACHE_DIR', None)
+
+   baseline_dir = None
+   if args.baseline:
+      baseline_dir = tempfile.mkdtemp(prefix='nir_algebraic_bench')
+      checkout_baseline(args.baseline, baseline_dir)
+
+   failed = False
+   header = ['pass', 'xforms', 'build (s)', 'render (s)']
+   if baseline_dir is not None:
+      header.append('base build (s)')
+   print('{:<40} {:>7} {:>10} {:>10}'.format(*header[:4]), *header[4:])
+   try:
+      for script in args.scripts or DEFAULT_SCRIPTS:
+         runs = []
+         baseline_runs = []
+         for i in range(max(args.repeat, 1)):
+            output, timings = run_script(script, NIR_DIR)
+            runs.append(timings)
+            if baseline_dir is not None:
+               expected, timings = run_script(script, baseline_dir)
+               baseline_runs.append(timings)
+
+         for i, (pass_name, num_xforms, build, render) in enumerate(runs[0]):
+            build = statistics.median(run[i][2] for run in runs)
+            render = statistics.median(run[i][3] for run in runs)
+            line = '{:<40} {:>7} {:>10.3f} {:>10.3f}'.format(
+               pass_name, num_xforms, build, render)
+            if baseline_runs:
+               line += ' {:>14.3f}'.format(
+                  statistics.median(run[i][2] for run in baseline_runs))
+            print(line)
+
+         if baseline_dir is not None and output != expected:
+            print('{}: output differs from {}'.format(
+               os.path.basename(script), args.baseline), file=sys.stderr)
+            failed = True
+   finally:
+      if baseline_dir is not None:
+         shutil.rmtree(baseline_dir)
+
+   if baseline_dir is not None and not failed:
+      print('output identical to {}'.format(args.baseline))
+   return 1 if failed else 0
+
+
+if __name__ == '__main__':
+   sys.exit(main())
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+# SPDX-License-Identifier: MIT
+
+"""Aggregate NIR algebraic transform counters.
+
+Mesa built with NIR_ALGEBRAIC_PROFILE set in the environment counts, for
+every Python source line of the algebraic passes, how often its transforms
+were selected by the automaton, skipped because of their condition, matched
+against an instruction and applied. With NIR_ALGEBRAIC_PROFILE_DIR set, each
+process writes these counters to a JSON file in that directory when it
+exits. This script sums them, e.g. over a shader-db run:
+
+  NIR_ALGEBRAIC_PROFILE_DIR=/tmp/prof ./run shaders
+  ./nir_algebraic_profile.py /tmp/prof --sort attempted
+"""
+
+import argparse
+import json
+import os
+import sys
+
+COUNTERS = ('automaton_matched', 'condition_failed', 'attempted', 'replaced')
+
+
+def profile_files(paths):
+   for path in paths:
+      if os.path.isdir(path):
+         for name in sorted(os.listdir(path)):
+            if name.endswith('.json'):
+               yield os.path.join(path, name)
+      else:
+         yield path
+
+
+def merge(profiles, profile):
+   """Add the counters of profile to profiles."""
+   for pass_name, sources in profile.items():
+      merged = profiles.setdefault(pass_name, {})
+      for source, entry in sources.items():
+         counters = merged.setdefault(source, {
+            'transforms': entry['transforms'],
+            **{name: 0 for name in COUNTERS},
+         })
+         for name in COUNTERS:
+            counters[name] += entry[name]
+
+
+def main():
+   parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+   parser.add_argument('paths', nargs='+', metavar='PATH',
+                       help='counter files, or directories of them')
+   parser.add_argument('-o', '--output', metavar='FILE',
+                       help='write the summed counters as JSON to FILE')
+   parser.add_argument('-p', '--pass', dest='pass_name',
+                       help='only report this pass')
+   parser.add_argument('-s', '--sort', choices=COUNTERS, default='attempted',
+                       help='counter to sort by (default: %(default)s)')
+   parser.add_argument('-n', '--limit', type=int, default=0,
+                       help='only report the first N lines of each pass')
+   parser.add_argument('--unused', action='store_true',
+                       help='only report lines which never replaced anything')
+   args = parser.parse_args()
+
+   profiles = {}
+   num_files = 0
+   for filename in profile_files(args.paths):
+      with open(filename) as f:
+         try:
+            merge(profiles, json.load(f))
+         except ValueError as e:
+            # Processes which crashed may have left a truncated file.
+            print('{}: {}'.format(filename, e), file=sys.stderr)
+            continue
+      num_files += 1
+
+   if args.output:
+      with open(args.output, 'w') as f:
+         json.dump(profiles, f, indent=1, sort_keys=True)
+
+   print('{} files'.format(num_files))
+   for pass_name, sources in sorted(profiles.items()):
+      if args.pass_name and pass_name != args.pass_name:
+         continue
+
+      rows = sorted(sources.items(), key=lambda kv: kv[1][args.sort],
+                    reverse=True)
+      if args.unused:
+         rows = [row for row in rows if row[1]['replaced'] == 0]
+      if args.limit:
+         rows = rows[:args.limit]
+
+      print()
+      print(pass_name)
+      print('   {:<56} {:>12} {:>12} {:>12} {:>12}'.format(
+         'source', 'matched', 'cond failed', 'attempted', 'replaced'))
+      for source, counters in rows:
+         print('   {:<56} {:>12} {:>12} {:>12} {:>12}'.format(
+            source, *(counters[name] for name in COUNTERS)))
+
+
+if __name__ == '__main__':
+   main()
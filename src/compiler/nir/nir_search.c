@@ -30,6 +30,15 @@
 #include "nir_builder.h"
 #include "nir_worklist.h"
 #include "util/half_float.h"
+#include "util/simple_mtx.h"
+#include "util/u_atomic.h"
+
+#ifdef _WIN32
+#include <process.h>
+#define getpid _getpid
+#else
+#include <unistd.h>
+#endif
 
 /* This should be the same as nir_search_max_comm_ops in nir_algebraic.py. */
 #define NIR_SEARCH_MAX_COMM_OPS 8
@@ -824,11 +833,16 @@ nir_algebraic_automaton(nir_instr *instr, struct util_dynarray *states,
       /* Calculate the index into the transition table. Note the index
        * calculated must match the iteration order of Python's
        * itertools.product(), which was used to emit the transition
-       * table.
+       * table. For compressed tables, the index of the row is calculated
+       * the same way, and then looked up before adding the last source.
        */
+      unsigned num_inputs = nir_op_infos[op].num_inputs;
       unsigned index = 0;
-      for (unsigned i = 0; i < nir_op_infos[op].num_inputs; i++) {
-         index *= tbl->num_filtered_states;
+      for (unsigned i = 0; i < num_inputs; i++) {
+         if (tbl->row_offsets && i == num_inputs - 1)
+            index = tbl->row_offsets[index];
+         else
+            index *= tbl->num_filtered_states;
          if (tbl->filter)
             index += tbl->filter[*util_dynarray_element(states, uint16_t,
                                                         alu->src[i].src.ssa->index)];
@@ -887,11 +901,28 @@ nir_algebraic_instr(nir_builder *build, nir_instr *instr,
    for (const struct transform *xform = &table->transforms[table->transform_offsets[xform_idx]];
         xform->condition_offset != ~0;
         xform++) {
-      if (condition_flags[xform->condition_offset] &&
-          !(table->values[xform->search].expression.inexact && ignore_inexact) &&
-          nir_replace_instr(build, alu, range_ht, states, table,
+      nir_algebraic_transform_counters *counters = NULL;
+      if (unlikely(table->profile)) {
+         const nir_algebraic_profile *profile = table->profile;
+         counters = &profile->counters[profile->transform_counter[xform - table->transforms]];
+         p_atomic_inc(&counters->automaton_matched);
+      }
+
+      if (!condition_flags[xform->condition_offset] ||
+          (table->values[xform->search].expression.inexact && ignore_inexact)) {
+         if (counters)
+            p_atomic_inc(&counters->condition_failed);
+         continue;
+      }
+
+      if (counters)
+         p_atomic_inc(&counters->attempted);
+
+      if (nir_replace_instr(build, alu, range_ht, states, table,
                             &table->values[xform->search].expression,
                             &table->values[xform->replace].value, worklist)) {
+         if (counters)
+            p_atomic_inc(&counters->replaced);
          _mesa_hash_table_clear(range_ht, NULL);
          return true;
       }
@@ -900,6 +931,81 @@ nir_algebraic_instr(nir_builder *build, nir_instr *instr,
    return false;
 }
 
+static simple_mtx_t profile_mutex = _SIMPLE_MTX_INITIALIZER_NP;
+static once_flag profile_once_flag = ONCE_FLAG_INIT;
+static nir_algebraic_profile *profiles;
+
+/**
+ * Write the transform counters of all the profiled passes which ran so far
+ * as a JSON object, keyed by pass name and then by transform source line.
+ */
+void
+nir_algebraic_dump_profile(FILE *fp)
+{
+   simple_mtx_lock(&profile_mutex);
+   fprintf(fp, "{");
+   for (nir_algebraic_profile *profile = profiles; profile; profile = profile->next) {
+      fprintf(fp, "%s\n  \"%s\": {", profile == profiles ? "" : ",",
+              profile->pass_name);
+      for (unsigned i = 0; i < profile->num_counters; i++) {
+         const nir_algebraic_transform_counters *counters = &profile->counters[i];
+         fprintf(fp, "%s\n    %s: {\"transforms\": %s, "
+                 "\"automaton_matched\": %" PRIu64 ", "
+                 "\"condition_failed\": %" PRIu64 ", "
+                 "\"attempted\": %" PRIu64 ", "
+                 "\"replaced\": %" PRIu64 "}",
+                 i ? "," : "", profile->sources[i], profile->transforms[i],
+                 counters->automaton_matched, counters->condition_failed,
+                 counters->attempted, counters->replaced);
+      }
+      fprintf(fp, "\n  }");
+   }
+   fprintf(fp, "\n}\n");
+   simple_mtx_unlock(&profile_mutex);
+}
+
+static void
+nir_algebraic_profile_atexit(void)
+{
+   const char *dir = getenv("NIR_ALGEBRAIC_PROFILE_DIR");
+   if (!dir)
+      return;
+
+   /* Several drivers, each with their own copy of NIR, may be loaded in
+    * the same process.
+    */
+   char *path = ralloc_asprintf(NULL, "%s/nir_algebraic.%d.%p.json", dir,
+                                (int)getpid(), (void *)&profiles);
+   FILE *fp = fopen(path, "w");
+   if (fp) {
+      nir_algebraic_dump_profile(fp);
+      fclose(fp);
+   } else {
+      fprintf(stderr, "nir_algebraic: failed to open %s\n", path);
+   }
+   ralloc_free(path);
+}
+
+static void
+nir_algebraic_profile_init(void)
+{
+   atexit(nir_algebraic_profile_atexit);
+}
+
+static void
+nir_algebraic_profile_register(nir_algebraic_profile *profile)
+{
+   call_once(&profile_once_flag, nir_algebraic_profile_init);
+
+   simple_mtx_lock(&profile_mutex);
+   if (!profile->registered) {
+      profile->registered = true;
+      profile->next = profiles;
+      profiles = profile;
+   }
+   simple_mtx_unlock(&profile_mutex);
+}
+
 bool
 nir_algebraic_impl(nir_function_impl *impl,
                    const bool *condition_flags,
@@ -907,6 +1013,9 @@ nir_algebraic_impl(nir_function_impl *impl,
 {
    bool progress = false;
 
+   if (unlikely(table->profile))
+      nir_algebraic_profile_register(table->profile);
+
    nir_builder build;
    nir_builder_init(&build, impl);
 
@@ -176,6 +176,16 @@ struct per_op_table {
    const uint16_t *filter;
    unsigned num_filtered_states;
    const uint16_t *table;
+
+   /**
+    * Optional row offsets for compressed tables
+    *
+    * When set, the transitions for each combination of filtered states of
+    * all sources but the last one are a row of num_filtered_states entries
+    * starting at table[row_offsets[combination]], and rows may be shared
+    * with other opcodes.
+    */
+   const uint32_t *row_offsets;
 };
 
 struct transform {
@@ -198,6 +208,39 @@ typedef bool (*nir_search_variable_cond)(struct hash_table *range_ht,
                                          unsigned src, unsigned num_components,
                                          const uint8_t *swizzle);
 
+/* Counters of how far each transform got, see NIR_ALGEBRAIC_PROFILE. */
+typedef struct {
+   /** Times the automaton selected the transform for an instruction. */
+   uint64_t automaton_matched;
+   /** Times it was then skipped because of the pass conditions, or because
+    * it is inexact and the float controls require exactness.
+    */
+   uint64_t condition_failed;
+   /** Times its search expression was matched against the instruction. */
+   uint64_t attempted;
+   /** Times the instruction was replaced. */
+   uint64_t replaced;
+} nir_algebraic_transform_counters;
+
+/* Transform counters of a pass generated with NIR_ALGEBRAIC_PROFILE set.
+ * Transforms are counted per Python source line.
+ */
+typedef struct nir_algebraic_profile {
+   const char *pass_name;
+   unsigned num_counters;
+   /** JSON string with the "file:line" of each counter. */
+   const char *const *sources;
+   /** JSON array with the transforms of each counter. */
+   const char *const *transforms;
+   /** Counter index for each entry of nir_algebraic_table::transforms. */
+   const uint16_t *transform_counter;
+   nir_algebraic_transform_counters *counters;
+
+   /* Set once the pass has run, for nir_algebraic_dump_profile(). */
+   bool registered;
+   struct nir_algebraic_profile *next;
+} nir_algebraic_profile;
+
 /* Generated data table for an algebraic optimization pass. */
 typedef struct {
    /** Array of all transforms in the pass. */
@@ -218,6 +261,9 @@ typedef struct {
     * nir_search_variable->cond.
     */
    const nir_search_variable_cond *variable_cond;
+
+   /** Transform counters, only set for profiling builds. */
+   nir_algebraic_profile *profile;
 } nir_algebraic_table;
 
 /* Note: these must match the start states created in
@@ -245,6 +291,9 @@ nir_replace_instr(struct nir_builder *b, nir_alu_instr *instr,
                   const nir_search_expression *search,
                   const nir_search_value *replace,
                   nir_instr_worklist *algebraic_worklist);
+void
+nir_algebraic_dump_profile(FILE *fp);
+
 bool
 nir_algebraic_impl(nir_function_impl *impl,
                    const bool *condition_flags,
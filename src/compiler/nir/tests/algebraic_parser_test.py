@@ -24,9 +24,11 @@ import unittest
 
 import sys
 import os
+import subprocess
+import tempfile
 sys.path.insert(1, os.path.join(sys.path[0], '..'))
 
-from nir_algebraic import SearchAndReplace, AlgebraicPass
+from nir_algebraic import SearchAndReplace, AlgebraicPass, TransformLocator
 
 # These tests check that the bitsize validator correctly rejects various
 # different kinds of malformed expressions, and documents what the error
@@ -115,4 +117,57 @@ class ValidatorTests(unittest.TestCase):
             "The search expression bit size ('b2i', ('i2b', 'a')) and " \
             "replace expression bit size a may not be the same")
 
+class TransformLocatorTests(unittest.TestCase):
+    source = """\
+a = 'a'
+xforms = [
+   (('iadd', a, 0), a),
+   (('imul', a, 1), a),
+]
+for op in ['iand', 'ior']:
+   xforms.append(((op, a, a), a))
+"""
+
+    def test_lines(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.py') as f:
+            f.write(self.source)
+            f.flush()
+            module_globals = {}
+            exec(compile(self.source, f.name, 'exec'), module_globals)
+            locator = TransformLocator(f.name, module_globals)
+            self.assertEqual([locator.line(x) for x in module_globals['xforms']],
+                             [3, 4, 7, 7])
+
+class RenderCacheTests(unittest.TestCase):
+    source = """\
+import sys
+from nir_algebraic import AlgebraicPass
+a = 'a'
+xforms = [
+   (('iadd', a, 0), a),
+]
+sys.stdout.write(AlgebraicPass('test_pass', xforms).render())
+"""
+
+    def render(self, filename, source, cache_dir):
+        with open(filename, 'w') as f:
+            f.write(source)
+        env = dict(os.environ, NIR_ALGEBRAIC_PROFILE='1',
+                   NIR_ALGEBRAIC_CACHE_DIR=cache_dir,
+                   PYTHONPATH=os.path.join(sys.path[0], '..'))
+        return subprocess.check_output([sys.executable, filename], env=env,
+                                       universal_newlines=True)
+
+    def test_profile_lines(self):
+        # The profiling counters name the source line of the transforms, so
+        # editing the script must not get the output of the old one from
+        # the cache.
+        with tempfile.TemporaryDirectory() as tmp:
+            filename = os.path.join(tmp, 'xforms.py')
+            cache_dir = os.path.join(tmp, 'cache')
+            first = self.render(filename, self.source, cache_dir)
+            second = self.render(filename, '\n' + self.source, cache_dir)
+            self.assertIn('xforms.py:5', first)
+            self.assertIn('xforms.py:6', second)
+
 unittest.main()
@@ -29,9 +29,10 @@ import sys
 #
 parser = argparse.ArgumentParser()
 parser.add_argument('-p', '--import-path', required=True)
-parser.add_argument('--utrace-src', required=True)
-parser.add_argument('--utrace-hdr', required=True)
-parser.add_argument('--perfetto-hdr', required=True)
+parser.add_argument('--utrace-src')
+parser.add_argument('--utrace-hdr')
+parser.add_argument('--perfetto-hdr')
+parser.add_argument('--decoder')
 args = parser.parse_args()
 sys.path.insert(0, args.import_path)
 
@@ -42,6 +43,7 @@ from u_trace import Tracepoint
 from u_trace import TracepointArg as Arg
 from u_trace import TracepointArgStruct as ArgStruct
 from u_trace import utrace_generate
+from u_trace import utrace_generate_decoder
 from u_trace import utrace_generate_perfetto_utils
 
 #
@@ -151,3 +153,4 @@ Tracepoint('end_compute',
 
 utrace_generate(cpath=args.utrace_src, hpath=args.utrace_hdr, ctx_param='struct tu_device *dev')
 utrace_generate_perfetto_utils(hpath=args.perfetto_hdr)
+utrace_generate_decoder(pypath=args.decoder)
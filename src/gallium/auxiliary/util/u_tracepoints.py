@@ -31,6 +31,7 @@ parser = argparse.ArgumentParser()
 parser.add_argument('-p', '--import-path', required=True)
 parser.add_argument('-C', '--src')
 parser.add_argument('-H', '--hdr')
+parser.add_argument('-D', '--decoder')
 args = parser.parse_args()
 sys.path.insert(0, args.import_path)
 
@@ -40,6 +41,7 @@ from u_trace import Tracepoint
 from u_trace import TracepointArg as Arg
 from u_trace import TracepointArgStruct as ArgStruct
 from u_trace import utrace_generate
+from u_trace import utrace_generate_decoder
 
 #
 # Tracepoint definitions:
@@ -92,3 +94,4 @@ Tracepoint('grid_info',
 )
 
 utrace_generate(cpath=args.src, hpath=args.hdr, ctx_param='struct pipe_context *pctx')
+utrace_generate_decoder(pypath=args.decoder)
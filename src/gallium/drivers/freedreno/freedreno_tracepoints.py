@@ -29,8 +29,9 @@ import sys
 #
 parser = argparse.ArgumentParser()
 parser.add_argument('-p', '--import-path', required=True)
-parser.add_argument('-C', '--src', required=True)
-parser.add_argument('-H', '--hdr', required=True)
+parser.add_argument('-C', '--src')
+parser.add_argument('-H', '--hdr')
+parser.add_argument('-D', '--decoder')
 args = parser.parse_args()
 sys.path.insert(0, args.import_path)
 
@@ -39,6 +40,7 @@ from u_trace import Header
 from u_trace import Tracepoint
 from u_trace import TracepointArg
 from u_trace import utrace_generate
+from u_trace import utrace_generate_decoder
 
 #
 # Tracepoint definitions:
@@ -143,3 +145,4 @@ Tracepoint('end_compute',
     tp_perfetto='fd_end_compute')
 
 utrace_generate(cpath=args.src, hpath=args.hdr, ctx_param='struct pipe_context *pctx')
+utrace_generate_decoder(pypath=args.decoder)
@@ -1,9 +1,21 @@
 #!/usr/bin/env python3
 
-import re
-import sys
+import argparse
+import collections
+import csv
 import gzip
 import io
+import json
+import math
+import multiprocessing
+import re
+import sys
+import time
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 # Captures per-frame state, including all the renderpasses, and
 # time spent in blits and compute jobs:
@@ -11,6 +23,7 @@ class Frame:
     def __init__(self):
         self.frame_nr = None
         self.renderpasses = []
+        self.warnings = []
         # Times in ns:
         self.times_sysmem = []
         self.times_gmem = []
@@ -137,172 +150,439 @@ class RenderPass:
         else:
             self.print_sysmem_pass(nr)
 
-def main():
-    filename = sys.argv[1]
-    if filename.endswith(".gz"):
-        file = gzip.open(filename, "r")
-        file = io.TextIOWrapper(file)
-    else:
-        file = open(filename, "r")
-    lines = file.read().split('\n')
-
-    flush_batch_match = re.compile(r": flush_batch: (\S+): cleared=(\S+), gmem_reason=(\S+), num_draws=(\S+)")
-    framebuffer_match = re.compile(r": framebuffer: (\S+)x(\S+)x(\S+)@(\S+), nr_cbufs: (\S+)")
-    surface_match     = re.compile(r": surface: (\S+)x(\S+)@(\S+), fmt=(\S+)")
+# The traces handled by TraceParser.  Lines are dispatched on the name of
+# their tracepoint (or on ELAPSED / END OF FRAME), and the groups captured
+# by the pattern for it are passed to the TraceParser method handling it.
+PATTERNS = [
+    # Note, we only expect the flush_batch trace for !nondraw:
+    ("flush_batch",           r": flush_batch: (\S+): cleared=(\S+), gmem_reason=(\S+), num_draws=(\S+)"),
+    ("framebuffer",           r": framebuffer: (\S+)x(\S+)x(\S+)@(\S+), nr_cbufs: (\S+)"),
+    ("surface",               r": surface: (\S+)x(\S+)@(\S+), fmt=(\S+)"),
 
     # draw/renderpass passes:
-    gmem_match          = re.compile(r": render_gmem: (\S+)x(\S+) bins of (\S+)x(\S+)")
-    sysmem_match        = re.compile(r": render_sysmem")
-    state_restore_match = re.compile(r"\+(\S+): end_state_restore")
-    prologue_match      = re.compile(r"\+(\S+): end_prologue")
-    binning_ib_match    = re.compile(r"\+(\S+): end_binning_ib")
-    vsc_overflow_match  = re.compile(r"\+(\S+): end_vsc_overflow_test")
-    draw_ib_match       = re.compile(r"\+(\S+): end_draw_ib")
-    resolve_match       = re.compile(r"\+(\S+): end_resolve")
-    
-    start_clear_restore_match = re.compile(r"start_clear_restore: fast_cleared: (\S+)")
-    end_clear_restore_match   = re.compile(r"\+(\S+): end_clear_restore")
+    ("render_gmem",           r": render_gmem: (\S+)x(\S+) bins of (\S+)x(\S+)"),
+    ("render_sysmem",         r": render_sysmem"),
+    ("end_state_restore",     r"\+(\S+): end_state_restore"),
+    ("end_prologue",          r"\+(\S+): end_prologue"),
+    ("end_binning_ib",        r"\+(\S+): end_binning_ib"),
+    ("end_vsc_overflow_test", r"\+(\S+): end_vsc_overflow_test"),
+    ("end_draw_ib",           r"\+(\S+): end_draw_ib"),
+    ("end_resolve",           r"\+(\S+): end_resolve"),
+    ("start_clear_restore",   r"start_clear_restore: fast_cleared: (\S+)"),
+    ("end_clear_restore",     r"\+(\S+): end_clear_restore"),
 
     # Non-draw passes:
-    compute_match = re.compile(r": start_compute")
-    blit_match    = re.compile(r": start_blit")
+    ("start_compute",         r": start_compute"),
+    ("start_blit",            r": start_blit"),
 
     # End of pass/frame markers:
-    elapsed_match = re.compile(r"ELAPSED: (\S+) ns")
-    eof_match     = re.compile(r"END OF FRAME (\S+)")
+    ("ELAPSED",               r"ELAPSED: (\S+) ns"),
+    ("END OF FRAME",          r"END OF FRAME (\S+)"),
+]
+
+# Returns the key of a line in PATTERNS, e.g. "end_draw_ib" for
+# "0000000012345678      +420: end_draw_ib"
+def line_key(line):
+    head, sep, tail = line.partition(": ")
+    if not sep:
+        if line.startswith("END OF FRAME"):
+            return "END OF FRAME"
+        return None
+    if head == "ELAPSED":
+        return head
+    return tail.partition(":")[0].rstrip()
+
+EOF_RE = re.compile(dict(PATTERNS)["END OF FRAME"])
+
+# Parses trace lines into Frames:
+class TraceParser:
+    def __init__(self):
+        self.frame = Frame()      # current frame state
+        self.renderpass = None    # current renderpass state
+        self.times = None
 
-    frame = Frame()      # current frame state
-    renderpass = None    # current renderpass state
-    times = None
+        handler_names = {"ELAPSED": "elapsed", "END OF FRAME": "end_of_frame"}
+        self.handlers = {}
+        for key, pattern in PATTERNS:
+            handler = getattr(self, handler_names.get(key, key))
+            self.handlers[key] = (re.compile(pattern).search, handler)
 
     # Helper to set the appropriate times table for the current pass,
     # which is expected to only happen once for a given render pass
-    def set_times(t):
-        nonlocal times
-        if times  is not None:
-            print("expected times to not be set yet")
-        times = t
-
+    def set_times(self, t):
+        if self.times is not None:
+            self.frame.warnings.append("expected times to not be set yet")
+        self.times = t
+
+    def flush_batch(self, batch, cleared, gmem_reason, num_draws):
+        assert(self.renderpass is None)
+        self.renderpass = RenderPass(cleared=cleared,
+                                     gmem_reason=gmem_reason,
+                                     num_draws=num_draws)
+        self.frame.renderpasses.append(self.renderpass)
+
+    def framebuffer(self, width, height, layers, samples, nr_cbufs):
+        assert(self.renderpass.fb is None)
+        self.renderpass.fb = FramebufferState(width=width,
+                                              height=height,
+                                              layers=layers,
+                                              samples=samples,
+                                              nr_cbufs=nr_cbufs)
+
+    def surface(self, width, height, samples, format):
+        surface = SurfaceState(width=width,
+                               height=height,
+                               samples=samples,
+                               format=format)
+        self.renderpass.fb.surfaces.append(surface)
+
+    def render_gmem(self, nbins_x, nbins_y, bin_w, bin_h):
+        assert(self.renderpass.binning_state is None)
+        self.renderpass.binning_state = BinningState(nbins_x=nbins_x,
+                                                     nbins_y=nbins_y,
+                                                     bin_w=bin_w,
+                                                     bin_h=bin_h)
+        self.set_times(self.frame.times_gmem)
+
+    def render_sysmem(self):
+        assert(self.renderpass.binning_state is None)
+        self.set_times(self.frame.times_sysmem)
+
+    def end_state_restore(self, time):
+        self.renderpass.state_restore_time += int(time)
+
+    def end_prologue(self, time):
+        self.renderpass.prologue_time += int(time)
+
+    def end_binning_ib(self, time):
+        assert(self.renderpass.binning_state is not None)
+        self.renderpass.binning_time += int(time)
+
+    def end_vsc_overflow_test(self, time):
+        assert(self.renderpass.binning_state is not None)
+        self.renderpass.vsc_overflow_test_time += int(time)
+
+    def end_draw_ib(self, time):
+        self.renderpass.draw_time += int(time)
+
+    def end_resolve(self, time):
+        assert(self.renderpass.binning_state is not None)
+        self.renderpass.resolve_time += int(time)
+
+    def start_clear_restore(self, fast_cleared):
+        self.renderpass.fast_cleared = fast_cleared
+
+    def end_clear_restore(self, time):
+        self.renderpass.restore_clear_time += int(time)
+
+    def start_compute(self):
+        self.set_times(self.frame.times_compute)
+
+    def start_blit(self):
+        self.set_times(self.frame.times_blit)
+
+    def end_of_frame(self, frame_nr):
+        frame = self.frame
+        frame.frame_nr = int(frame_nr)
+        self.frame = Frame()
+        self.times = None
+        self.renderpass = None
+        return frame
+
+    def elapsed(self, time):
+        time = int(time)
+        #print("ELAPSED: " + str(time) + " ns")
+        if self.renderpass is not None:
+            self.renderpass.elapsed_time = time
+        self.times.append(time)
+        self.times = None
+        self.renderpass = None
+
+    # Generates the frames of the given lines, as soon as they are complete.
+    # Warnings about the incomplete frame at the end are left in
+    # self.frame.warnings.
+    def parse(self, lines):
+        handlers = self.handlers
+        for line in lines:
+            handler = handlers.get(line_key(line))
+            if handler is None:
+                continue
+            search, handler = handler
+            match = search(line)
+            if match is None:
+                continue
+            frame = handler(*match.groups())
+            if frame is not None:
+                yield frame
+
+# Timings summarized per renderpass, and per frame:
+RENDERPASS_TIMES = ["prologue", "binning", "restore_clear", "draw", "resolve", "elapsed"]
+FRAME_TIMES = ["blit", "compute", "gmem", "sysmem", "total"]
+
+# How the renderpass timings are grouped in the summary, "frame" is only
+# used on request since it gives rows for every frame:
+GROUPINGS = ["all", "type", "gmem_reason", "bins", "formats"]
+
+PERCENTILES = [50, 95, 99]
+
+# Linear interpolation between the closest ranks, like numpy.percentile():
+def percentile(values, p):
+    if not values:
+        return 0
+    k = (len(values) - 1) * p / 100.0
+    lo = math.floor(k)
+    hi = min(lo + 1, len(values) - 1)
+    return values[lo] + (values[hi] - values[lo]) * (k - lo)
+
+# Counts of the values in power of two buckets, keyed by the lower bound of
+# the bucket (with 0 ns counted in the 1 ns one):
+def histogram(values):
+    buckets = collections.Counter(1 << max(int(v).bit_length() - 1, 0)
+                                  for v in values)
+    return dict(sorted(buckets.items()))
+
+# Accumulates the timings of all frames and renderpasses of a capture, as
+# columns, and computes their statistics:
+class Summary:
+    def __init__(self, groupings=GROUPINGS):
+        self.groupings = groupings
+        self.renderpasses = {name: [] for name in
+                             ["frame", "type", "gmem_reason", "bins", "formats", "num_draws"] +
+                             RENDERPASS_TIMES}
+        self.frames = {name: [] for name in
+                       ["frame", "renderpasses"] + FRAME_TIMES}
+
+    def add(self, frame):
+        rp = self.renderpasses
+        for renderpass in frame.renderpasses:
+            binning_state = renderpass.binning_state
+            rp["frame"].append(frame.frame_nr)
+            rp["type"].append("gmem" if binning_state else "sysmem")
+            rp["gmem_reason"].append(renderpass.gmem_reason)
+            if binning_state:
+                rp["bins"].append("{}x{}".format(binning_state.bin_w, binning_state.bin_h))
+            else:
+                rp["bins"].append("-")
+            if renderpass.fb:
+                rp["formats"].append(",".join(renderpass.fb.get_formats()))
+            else:
+                rp["formats"].append("-")
+            rp["num_draws"].append(int(renderpass.num_draws))
+            rp["prologue"].append(renderpass.prologue_time)
+            rp["binning"].append(renderpass.binning_time)
+            rp["restore_clear"].append(renderpass.restore_clear_time)
+            rp["draw"].append(renderpass.draw_time)
+            rp["resolve"].append(renderpass.resolve_time)
+            rp["elapsed"].append(renderpass.elapsed_time)
+
+        f = self.frames
+        f["frame"].append(frame.frame_nr)
+        f["renderpasses"].append(len(frame.renderpasses))
+        f["blit"].append(sum(frame.times_blit))
+        f["compute"].append(sum(frame.times_compute))
+        f["gmem"].append(sum(frame.times_gmem))
+        f["sysmem"].append(sum(frame.times_sysmem))
+        f["total"].append(f["blit"][-1] + f["compute"][-1] +
+                          f["gmem"][-1] + f["sysmem"][-1])
+
+    def stats_row(self, level, grouping, group, metric, values):
+        values = sorted(values)
+        row = {
+            "level": level,
+            "grouping": grouping,
+            "group": group,
+            "metric": metric,
+            "count": len(values),
+            "sum": sum(values),
+            "mean": sum(values) / len(values) if values else 0,
+            "min": values[0] if values else 0,
+        }
+        for p in PERCENTILES:
+            row["p{}".format(p)] = percentile(values, p)
+        row["max"] = values[-1] if values else 0
+        row["histogram"] = histogram(values)
+        return row
+
+    # Returns one row of statistics per frame timing over the whole
+    # capture, and per renderpass timing and group of renderpasses:
+    def stats(self):
+        rows = []
+        for metric in FRAME_TIMES:
+            rows.append(self.stats_row("frame", "all", "all", metric,
+                                       self.frames[metric]))
+
+        rp = self.renderpasses
+        for grouping in self.groupings:
+            groups = collections.defaultdict(list)
+            for i in range(len(rp["frame"])):
+                key = "all" if grouping == "all" else rp[grouping][i]
+                groups[key].append(i)
+            for group, indices in sorted(groups.items()):
+                for metric in RENDERPASS_TIMES:
+                    rows.append(self.stats_row("renderpass", grouping, group, metric,
+                                               [rp[metric][i] for i in indices]))
+        return rows
+
+    def write_text(self, out):
+        print("{:<10} {:<12} {:<40} {:<14} {:>8} {:>14} {:>14} {:>14} {:>14}".format(
+                "level", "grouping", "group", "metric", "count", "p50", "p95", "p99", "max"),
+              file=out)
+        for row in self.stats():
+            print("{:<10} {:<12} {:<40} {:<14} {:>8} {:>14,.0f} {:>14,.0f} {:>14,.0f} {:>14,}".format(
+                    row["level"], row["grouping"], row["group"], row["metric"],
+                    row["count"], row["p50"], row["p95"], row["p99"], row["max"]),
+                  file=out)
+
+    # The histograms don't fit in the CSV rows, only the JSON has them:
+    def write_csv(self, out):
+        rows = self.stats()
+        fields = [field for field in rows[0] if field != "histogram"] if rows else []
+        writer = csv.DictWriter(out, fields, extrasaction="ignore")
+        writer.writeheader()
+        writer.writerows(rows)
+
+    def write_json(self, out):
+        json.dump({"frames": len(self.frames["frame"]),
+                   "renderpasses": len(self.renderpasses["frame"]),
+                   "stats": self.stats()}, out, indent=1)
+        out.write("\n")
+
+    # Returns the columns as NumPy arrays, named frame_<column> and
+    # renderpass_<column>:
+    def arrays(self):
+        arrays = {}
+        for level, columns in (("frame", self.frames), ("renderpass", self.renderpasses)):
+            for name, values in columns.items():
+                if name in ("type", "gmem_reason", "bins", "formats"):
+                    arrays[level + "_" + name] = np.array(values, dtype=str)
+                else:
+                    arrays[level + "_" + name] = np.array(values, dtype=np.int64)
+        return arrays
+
+def open_trace(filename):
+    if filename.endswith(".gz"):
+        return io.TextIOWrapper(gzip.open(filename, "r"))
+    return open(filename, "r")
+
+# Splits the trace into chunks of whole frames, which can be parsed
+# independently since the parser state is reset at the end of every frame.
+def shards(lines, frames_per_shard, counter):
+    shard = []
+    frames = 0
     for line in lines:
-        # Note, we only expect the flush_batch trace for !nondraw:
-        match = re.search(flush_batch_match, line)
-        if match is not None:
-            assert(renderpass is None)
-            renderpass = RenderPass(cleared=match.group(2),
-                                    gmem_reason=match.group(3),
-                                    num_draws=match.group(4))
-            frame.renderpasses.append(renderpass)
-            continue
-
-        match = re.search(framebuffer_match, line)
-        if match is not None:
-            assert(renderpass.fb is None)
-            renderpass.fb = FramebufferState(width=match.group(1),
-                                             height=match.group(2),
-                                             layers=match.group(3),
-                                             samples=match.group(4),
-                                             nr_cbufs=match.group(5))
-            continue
-
-        match = re.search(surface_match, line)
-        if match is not None:
-            surface = SurfaceState(width=match.group(1),
-                                   height=match.group(2),
-                                   samples=match.group(3),
-                                   format=match.group(4))
-            renderpass.fb.surfaces.append(surface)
-            continue
-
-        match = re.search(gmem_match, line)
-        if match is not None:
-            assert(renderpass.binning_state is None)
-            renderpass.binning_state = BinningState(nbins_x=match.group(1),
-                                                    nbins_y=match.group(2),
-                                                    bin_w=match.group(3),
-                                                    bin_h=match.group(4))
-            set_times(frame.times_gmem)
-            continue
-
-        match = re.search(sysmem_match, line)
-        if match is not None:
-            assert(renderpass.binning_state is None)
-            set_times(frame.times_sysmem)
-            continue
-
-        match = re.search(state_restore_match, line)
-        if match is not None:
-            renderpass.state_restore_time += int(match.group(1))
-            continue
-
-        match = re.search(prologue_match, line)
-        if match is not None:
-            renderpass.prologue_time += int(match.group(1))
-            continue
-
-        match = re.search(binning_ib_match, line)
-        if match is not None:
-            assert(renderpass.binning_state is not None)
-            renderpass.binning_time += int(match.group(1))
-            continue
-
-        match = re.search(vsc_overflow_match, line)
-        if match is not None:
-            assert(renderpass.binning_state is not None)
-            renderpass.vsc_overflow_test_time += int(match.group(1))
-            continue
-
-        match = re.search(draw_ib_match, line)
-        if match is not None:
-            renderpass.draw_time += int(match.group(1))
-            continue
-
-        match = re.search(resolve_match, line)
-        if match is not None:
-            assert(renderpass.binning_state is not None)
-            renderpass.resolve_time += int(match.group(1))
-            continue
-
-        match = re.search(start_clear_restore_match, line)
-        if match is not None:
-            renderpass.fast_cleared = match.group(1)
-            continue
-
-        match = re.search(end_clear_restore_match, line)
-        if match is not None:
-            renderpass.restore_clear_time += int(match.group(1))
-            continue
-
-        match = re.search(compute_match, line)
-        if match is not None:
-            set_times(frame.times_compute)
-            continue
-
-        match = re.search(blit_match, line)
-        if match is not None:
-            set_times(frame.times_blit)
-            continue
-
-        match = re.search(eof_match, line)
-        if match is not None:
-            frame.frame_nr = int(match.group(1))
-            frame.print()
-            frame = Frame()
-            times = None
-            renderpass = None
-            continue
-
-        match = re.search(elapsed_match, line)
-        if match is not None:
-            time = int(match.group(1))
-            #print("ELAPSED: " + str(time) + " ns")
-            if renderpass is not None:
-                renderpass.elapsed_time = time
-            times.append(time)
-            times = None
-            renderpass = None
-            continue
+        counter[0] += 1
+        shard.append(line)
+        # Same test as TraceParser.parse(), but cheaper for the other lines
+        if (line.startswith("END OF FRAME") and
+            line_key(line) == "END OF FRAME" and EOF_RE.search(line)):
+            frames += 1
+            if frames == frames_per_shard:
+                yield "".join(shard)
+                shard = []
+                frames = 0
+    if shard:
+        yield "".join(shard)
+
+def parse_shard(text):
+    parser = TraceParser()
+    frames = list(parser.parse(io.StringIO(text)))
+    return frames, parser.frame.warnings
+
+# Parses the shards in a pool of worker processes, while keeping only a few
+# of them in flight so that the trace is still streamed, and generates the
+# frames in order along with the warnings of the final incomplete frame.
+def parse_parallel(lines, jobs, frames_per_shard, counter):
+    with multiprocessing.Pool(jobs) as pool:
+        pending = collections.deque()
+        for shard in shards(lines, frames_per_shard, counter):
+            pending.append(pool.apply_async(parse_shard, (shard,)))
+            while len(pending) > 2 * jobs:
+                yield pending.popleft().get()
+        while pending:
+            yield pending.popleft().get()
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Summarize the per-frame GPU timings in a freedreno u_trace log")
+    parser.add_argument("filename",
+                        help="trace log, optionally gzipped")
+    parser.add_argument("-j", "--jobs", type=int, default=1,
+                        help="number of processes to parse with (default: %(default)s)")
+    parser.add_argument("--frames-per-shard", type=int, default=64,
+                        help="number of frames each process parses at a time "
+                             "with -j (default: %(default)s)")
+    parser.add_argument("-q", "--quiet", action="store_true",
+                        help="don't print every frame")
+    parser.add_argument("--stats", choices=["text", "csv", "json"],
+                        help="print percentiles of the frame and renderpass timings "
+                             "(and with json, their histograms), over the whole "
+                             "capture and grouped by pass type, gmem_reason, bin "
+                             "size and framebuffer formats")
+    parser.add_argument("--per-frame", action="store_true",
+                        help="also group the renderpass timings by frame in the --stats")
+    parser.add_argument("--stats-output", metavar="FILE",
+                        help="write the --stats to FILE instead of stdout")
+    parser.add_argument("--npz", metavar="FILE",
+                        help="save the per-frame and per-renderpass timings as "
+                             "NumPy arrays to FILE")
+    args = parser.parse_args()
+
+    if args.npz and np is None:
+        parser.error("--npz requires NumPy")
+
+    start = time.perf_counter()
+    counter = [0]
+
+    summary = None
+    if args.stats or args.npz:
+        summary = Summary(GROUPINGS + ["frame"] if args.per_frame else GROUPINGS)
+
+    def emit(frame):
+        if summary:
+            summary.add(frame)
+        if args.quiet:
+            return
+        for warning in frame.warnings:
+            print(warning)
+        frame.print()
+
+    with open_trace(args.filename) as file:
+        if args.jobs > 1:
+            warnings = []
+            for frames, warnings in parse_parallel(file, args.jobs,
+                                                   args.frames_per_shard,
+                                                   counter):
+                for frame in frames:
+                    emit(frame)
+        else:
+            def count(lines):
+                for line in lines:
+                    counter[0] += 1
+                    yield line
+
+            trace = TraceParser()
+            for frame in trace.parse(count(file)):
+                emit(frame)
+            warnings = trace.frame.warnings
+
+    if not args.quiet:
+        for warning in warnings:
+            print(warning)
+
+    if args.stats:
+        out = open(args.stats_output, "w", newline="") if args.stats_output else sys.stdout
+        getattr(summary, "write_" + args.stats)(out)
+        if out is not sys.stdout:
+            out.close()
+
+    if args.npz:
+        np.savez(args.npz, **summary.arrays())
+
+    elapsed = time.perf_counter() - start
+    print("{:,} lines in {:.2f} s ({:,.0f} lines/s)".format(
+            counter[0], elapsed, counter[0] / elapsed if elapsed else 0),
+          file=sys.stderr)
 
 
 if __name__ == "__main__":
     main()
-
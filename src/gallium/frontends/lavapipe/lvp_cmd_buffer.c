@@ -284,9 +284,8 @@ VKAPI_ATTR void VKAPI_CALL lvp_CmdPushDescriptorSetWithTemplateKHR(
    LVP_FROM_HANDLE(lvp_cmd_buffer, cmd_buffer, commandBuffer);
    LVP_FROM_HANDLE(lvp_descriptor_update_template, templ, descriptorUpdateTemplate);
    size_t info_size = 0;
-   struct vk_cmd_queue_entry *cmd = vk_zalloc(cmd_buffer->vk.cmd_queue.alloc,
-                                              sizeof(*cmd), 8,
-                                              VK_SYSTEM_ALLOCATION_SCOPE_COMMAND);
+   struct vk_cmd_queue_entry *cmd =
+      vk_cmd_queue_zalloc(&cmd_buffer->vk.cmd_queue, sizeof(*cmd));
    if (!cmd)
       return;
 
@@ -326,7 +325,7 @@ VKAPI_ATTR void VKAPI_CALL lvp_CmdPushDescriptorSetWithTemplateKHR(
       }
    }
 
-   cmd->u.push_descriptor_set_with_template_khr.data = vk_zalloc(cmd_buffer->vk.cmd_queue.alloc, info_size, 8, VK_SYSTEM_ALLOCATION_SCOPE_COMMAND);
+   cmd->u.push_descriptor_set_with_template_khr.data = vk_cmd_queue_zalloc(&cmd_buffer->vk.cmd_queue, info_size);
 
    uint64_t offset = 0;
    for (unsigned i = 0; i < templ->entry_count; i++) {
@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+# SPDX-License-Identifier: MIT
+
+'''Call sequence diff engines for pytracediff.py.
+
+All engines compare calls with Call.__hash__()/__eq__() and produce
+difflib.SequenceMatcher style matching blocks and opcodes:
+
+  difflib   difflib.SequenceMatcher, quadratic on large traces
+  myers     anchors on calls that occur exactly once in both traces (context
+            and screen creation, resource creation, ...), keeps the longest
+            increasing run of those, and runs Myers' O(ND) algorithm on the
+            gaps between them
+
+diff_blocks() additionally supports a windowed mode, which only ever holds a
+window of calls from each trace and so can work on the call generators
+returned by TraceParser.parse_calls().
+'''
+
+import bisect
+import collections
+import difflib
+import itertools
+
+
+ENGINES = ('myers', 'difflib')
+
+# Give up on Myers for gaps between anchors which need more edits than this,
+# and report them as replaced instead.
+MYERS_MAX_COST = 4096
+
+# Stop looking for nested anchors past this recursion depth.
+MAX_ANCHOR_DEPTH = 32
+
+
+def _middle_snake(a, alo, ahi, b, blo, bhi, max_cost):
+    '''Return (d, x, y, u, v), where d is the length of a shortest edit
+    script between a[alo:ahi] and b[blo:bhi], and a[x:u] == b[y:v] is the
+    diagonal in its middle, or None if d exceeds max_cost.
+
+    This is the linear space variant of Myers' algorithm, which runs the
+    search from both ends at once until the two paths overlap.'''
+    n = ahi - alo
+    m = bhi - blo
+    delta = n - m
+    odd = delta & 1
+    # Furthest reaching x on every diagonal, the backward one counted from
+    # the ends of the sequences.
+    vf = {1: 0}
+    vb = {1: 0}
+    for d in range(min((n + m + 1) // 2, (max_cost + 1) // 2) + 1):
+        for k in range(-d, d + 1, 2):
+            if k == -d or (k != d and vf[k - 1] < vf[k + 1]):
+                x = vf[k + 1]
+            else:
+                x = vf[k - 1] + 1
+            y = x - k
+            x0, y0 = x, y
+            while x < n and y < m and a[alo + x] == b[blo + y]:
+                x += 1
+                y += 1
+            vf[k] = x
+            if odd and -d < delta - k < d and x + vb[delta - k] >= n:
+                if 2 * d - 1 > max_cost:
+                    return None
+                return 2 * d - 1, alo + x0, blo + y0, alo + x, blo + y
+        for k in range(-d, d + 1, 2):
+            if k == -d or (k != d and vb[k - 1] < vb[k + 1]):
+                x = vb[k + 1]
+            else:
+                x = vb[k - 1] + 1
+            y = x - k
+            x0, y0 = x, y
+            while x < n and y < m and a[ahi - 1 - x] == b[bhi - 1 - y]:
+                x += 1
+                y += 1
+            vb[k] = x
+            if not odd and -d <= delta - k <= d and x + vf[delta - k] >= n:
+                if 2 * d > max_cost:
+                    return None
+                return 2 * d, ahi - x, bhi - y, ahi - x0, bhi - y0
+    return None
+
+
+def _myers(a, alo, ahi, b, blo, bhi, blocks, max_cost):
+    '''Append the matching blocks of a shortest edit script between
+    a[alo:ahi] and b[blo:bhi] to blocks, or return False if that needs more
+    than max_cost edits.'''
+    # Common prefix and suffix
+    prefix = alo
+    while alo < ahi and blo < bhi and a[alo] == b[blo]:
+        alo += 1
+        blo += 1
+    suffix = ahi
+    while alo < ahi and blo < bhi and a[ahi - 1] == b[bhi - 1]:
+        ahi -= 1
+        bhi -= 1
+
+    snake = None
+    if alo < ahi and blo < bhi:
+        snake = _middle_snake(a, alo, ahi, b, blo, bhi, max_cost)
+        if snake is None:
+            return False
+    elif (ahi - alo) + (bhi - blo) > max_cost:
+        return False
+
+    if alo > prefix:
+        blocks.append((prefix, blo - (alo - prefix), alo - prefix))
+    if snake is not None:
+        # Both halves need fewer edits than the whole
+        d, x, y, u, v = snake
+        _myers(a, alo, x, b, blo, y, blocks, d)
+        if u > x:
+            blocks.append((x, y, u - x))
+        _myers(a, u, ahi, b, v, bhi, blocks, d)
+    if suffix > ahi:
+        blocks.append((ahi, bhi, suffix - ahi))
+    return True
+
+
+def _anchors(a, alo, ahi, b, blo, bhi, junk):
+    '''Return the longest increasing sequence of (i, j) pairs of calls
+    occurring exactly once in both a[alo:ahi] and b[blo:bhi].'''
+    count_a = collections.Counter(a[alo:ahi])
+    count_b = collections.Counter(b[blo:bhi])
+    where_b = {}
+    for j in range(blo, bhi):
+        h = b[j]
+        if count_b[h] == 1 and count_a[h] == 1 and h not in junk:
+            where_b[h] = j
+
+    # Patience sorting
+    tails = []
+    tail_js = []
+    links = {}
+    for i in range(alo, ahi):
+        j = where_b.get(a[i])
+        if j is None:
+            continue
+        pos = bisect.bisect_left(tail_js, j)
+        links[(i, j)] = tails[pos - 1] if pos else None
+        if pos == len(tails):
+            tails.append((i, j))
+            tail_js.append(j)
+        else:
+            tails[pos] = (i, j)
+            tail_js[pos] = j
+
+    result = []
+    pair = tails[-1] if tails else None
+    while pair is not None:
+        result.append(pair)
+        pair = links[pair]
+    result.reverse()
+    return result
+
+
+def _anchored_diff(a, alo, ahi, b, blo, bhi, junk, blocks, depth=0):
+    # Common prefix and suffix
+    start = alo
+    while alo < ahi and blo < bhi and a[alo] == b[blo]:
+        alo += 1
+        blo += 1
+    if alo > start:
+        blocks.append((start, blo - (alo - start), alo - start))
+
+    end = ahi
+    while alo < ahi and blo < bhi and a[ahi - 1] == b[bhi - 1]:
+        ahi -= 1
+        bhi -= 1
+    suffix = (ahi, bhi, end - ahi) if end > ahi else None
+
+    if alo < ahi and blo < bhi:
+        if depth < MAX_ANCHOR_DEPTH:
+            anchors = _anchors(a, alo, ahi, b, blo, bhi, junk)
+        else:
+            anchors = None
+        if anchors:
+            for i, j in anchors:
+                _anchored_diff(a, alo, i, b, blo, j, junk, blocks, depth + 1)
+                blocks.append((i, j, 1))
+                alo, blo = i + 1, j + 1
+            _anchored_diff(a, alo, ahi, b, blo, bhi, junk, blocks, depth + 1)
+        else:
+            _myers(a, alo, ahi, b, blo, bhi, blocks, MYERS_MAX_COST)
+
+    if suffix is not None:
+        blocks.append(suffix)
+
+
+def _merge_blocks(blocks):
+    '''Coalesce adjacent matching blocks, like SequenceMatcher does.'''
+    merged = []
+    for i, j, n in blocks:
+        if merged:
+            pi, pj, pn = merged[-1]
+            if pi + pn == i and pj + pn == j:
+                merged[-1] = (pi, pj, pn + n)
+                continue
+        merged.append((i, j, n))
+    return merged
+
+
+def matching_blocks(calls1, calls2, engine='myers'):
+    '''Return (i, j, n) triples such that calls1[i:i+n] == calls2[j:j+n],
+    in increasing order of i and j.'''
+    if engine == 'difflib':
+        sequence = difflib.SequenceMatcher(lambda x : x.is_junk, calls1, calls2, autojunk=False)
+        return [block for block in sequence.get_matching_blocks() if block[2]]
+
+    if engine != 'myers':
+        raise ValueError(f"unknown diff engine '{engine}'")
+
+    a = [hash(call) for call in calls1]
+    b = [hash(call) for call in calls2]
+    junk = set(hash(call) for call in itertools.chain(calls1, calls2) if call.is_junk)
+    blocks = []
+    _anchored_diff(a, 0, len(a), b, 0, len(b), junk, blocks)
+    return _merge_blocks(blocks)
+
+
+def opcodes(blocks, len1, len2):
+    '''Turn matching blocks into SequenceMatcher.get_opcodes() 5-tuples.'''
+    result = []
+    i = j = 0
+    for ai, bj, size in itertools.chain(blocks, [(len1, len2, 0)]):
+        if i < ai and j < bj:
+            result.append(('replace', i, ai, j, bj))
+        elif i < ai:
+            result.append(('delete', i, ai, j, bj))
+        elif j < bj:
+            result.append(('insert', i, ai, j, bj))
+        if size:
+            result.append(('equal', ai, ai + size, bj, bj + size))
+        i, j = ai + size, bj + size
+    return result
+
+
+def diff_blocks(calls1, calls2, engine='myers', window=0):
+    '''Generate (tag, calls1 slice, calls2 slice) tuples describing how to
+    turn calls1 into calls2.
+
+    With window == 0 both call sequences are read in full. Otherwise at most
+    window calls of each are held at a time: every window is diffed, the part
+    up to its last match is emitted, and the rest is carried over into the
+    next window. Differing regions longer than the window are then reported
+    as replaced in window sized pieces.'''
+    if not window:
+        calls1 = list(calls1)
+        calls2 = list(calls2)
+        for tag, i1, i2, j1, j2 in opcodes(matching_blocks(calls1, calls2, engine), len(calls1), len(calls2)):
+            yield tag, calls1[i1:i2], calls2[j1:j2]
+        return
+
+    iter1 = iter(calls1)
+    iter2 = iter(calls2)
+    buf1 = []
+    buf2 = []
+    while True:
+        buf1.extend(itertools.islice(iter1, window - len(buf1)))
+        buf2.extend(itertools.islice(iter2, window - len(buf2)))
+        if not buf1 and not buf2:
+            return
+
+        blocks = matching_blocks(buf1, buf2, engine)
+        if len(buf1) < window and len(buf2) < window:
+            # Both traces are exhausted
+            for tag, i1, i2, j1, j2 in opcodes(blocks, len(buf1), len(buf2)):
+                yield tag, buf1[i1:i2], buf2[j1:j2]
+            return
+
+        if blocks:
+            i, j, n = blocks[-1]
+            cut1, cut2 = i + n, j + n
+        else:
+            # Always move on, even with a window of a single call
+            cut1 = min(len(buf1), max(window // 2, 1))
+            cut2 = min(len(buf2), max(window // 2, 1))
+
+        for tag, i1, i2, j1, j2 in opcodes(blocks, cut1, cut2):
+            yield tag, buf1[i1:i2], buf2[j1:j2]
+        del buf1[:cut1]
+        del buf2[:cut2]
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+# SPDX-License-Identifier: MIT
+
+'''Benchmark the pytracediff.py diff engines on synthetic trace pairs.
+
+The second trace of each pair is a copy of the first one with a number of
+calls inserted, deleted and modified, e.g.
+
+  ./diff_bench.py -n 10000 -n 50000 -e myers -e difflib
+'''
+
+import argparse
+import random
+import time
+
+import calldiff
+from model import *
+
+
+def synthetic_calls(num_calls, state, rng):
+    calls = []
+    for no in range(1, num_calls + 1):
+        if no % 1000 == 1:
+            # Occasional unique calls, like context or resource creation
+            calls.append(Call(no, 'pipe_screen', 'resource_create',
+                              [('screen', Pointer(state, '0x1000', 'screen')),
+                               ('templat', Struct('pipe_resource', [('width0', Literal(no))]))],
+                              Pointer(state, hex(0x200000 + no), 'ret'), None))
+        else:
+            calls.append(Call(no, 'pipe_context', rng.choice(('draw_vbo', 'set_constant_buffer', 'bind_fs_state')),
+                              [('pipe', Pointer(state, '0x2000', 'pipe')),
+                               ('count', Literal(rng.randrange(16)))],
+                              None, None))
+    return calls
+
+
+def mutate(calls, num_edits, state, rng):
+    calls = list(calls)
+    for i in range(num_edits):
+        pos = rng.randrange(len(calls))
+        op = rng.randrange(3)
+        if op == 0:
+            del calls[pos]
+        elif op == 1:
+            calls.insert(pos, Call(0, 'pipe_context', 'flush', [('pipe', Pointer(state, '0x2000', 'pipe'))], None, None))
+        else:
+            call = calls[pos]
+            calls[pos] = Call(call.no, call.klass, call.method,
+                              call.args[:1] + [('count', Literal(100 + rng.randrange(16)))],
+                              call.ret, call.time)
+    return calls
+
+
+def main():
+    optparser = argparse.ArgumentParser(
+        description="Benchmark the Gallium trace diff engines")
+
+    optparser.add_argument("-n", "--num-calls",
+        type=int, action="append", dest="sizes", metavar="N",
+        help="number of calls per trace, may be repeated (default: 2000, 10000)")
+
+    optparser.add_argument("-d", "--edits",
+        type=int, default=50, metavar="N",
+        help="number of edits between the two traces (default: %(default)s)")
+
+    optparser.add_argument("-e", "--engine",
+        action="append", dest="engines", choices=calldiff.ENGINES,
+        help="engine to benchmark, may be repeated (default: all)")
+
+    optparser.add_argument("-W", "--window",
+        type=int, default=0, metavar="N",
+        help="also benchmark the windowed mode with N calls per window")
+
+    args = optparser.parse_args()
+    sizes = args.sizes or [2000, 10000]
+    engines = args.engines or list(calldiff.ENGINES)
+
+    rng = random.Random(42)
+    print(f"{'calls':>10} {'engine':>10} {'window':>8} {'seconds':>10} {'matched':>10}")
+    for size in sizes:
+        state = TraceStateData()
+        calls1 = synthetic_calls(size, state, rng)
+        calls2 = mutate(calls1, args.edits, state, rng)
+        for engine in engines:
+            for window in sorted(set((0, args.window))):
+                start = time.perf_counter()
+                matched = 0
+                for tag, slice1, slice2 in calldiff.diff_blocks(calls1, calls2, engine, window):
+                    if tag == 'equal':
+                        matched += len(slice1)
+                elapsed = time.perf_counter() - start
+                print(f"{size:>10} {engine:>10} {window or '-':>8} {elapsed:>10.3f} {matched:>10}")
+
+
+if __name__ == '__main__':
+    main()
@@ -27,13 +27,16 @@
 ##########################################################################
 
 
+import os
 import sys
 import struct
 import json
 import binascii
 import re
 import copy
+import pickle
 import argparse
+import hashlib
 
 import model
 import format
@@ -148,6 +151,12 @@ class Dispatcher:
     def __init__(self, interpreter):
         self.interpreter = interpreter
 
+    def __getstate__(self):
+        # The interpreter is rebound when a checkpoint is restored
+        state = self.__dict__.copy()
+        del state['interpreter']
+        return state
+
 
 class Global(Dispatcher):
     '''Global name space.
@@ -757,6 +766,85 @@ class Context(Dispatcher):
         return so_target
 
 
+class Checkpoints:
+    '''On-disk snapshots of the interpreter state at regular call intervals.
+
+    Snapshots live in a directory next to the trace, one pickle per call
+    number, and are discarded whenever the trace file, the sources of the
+    trace tools or the options the state depends on change.'''
+
+    # Options which do not change the interpreter state
+    ignored_options = frozenset((
+        'verbosity', 'call', 'draw', 'at_call', 'checkpoint_interval',
+        'checkpoint_dir', 'jobs',
+    ))
+
+    def __init__(self, directory, filename, options):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+        st = os.stat(filename)
+        stamp = f'{st.st_size} {st.st_mtime_ns} {self.tool_hash(options)}\n'
+        stamp_filename = os.path.join(directory, 'trace.stamp')
+        try:
+            with open(stamp_filename, 'rt') as fp:
+                valid = fp.read() == stamp
+        except OSError:
+            valid = False
+        if not valid:
+            for no in self.call_numbers():
+                os.unlink(self._filename(no))
+            with open(stamp_filename, 'wt') as fp:
+                fp.write(stamp)
+
+    @classmethod
+    def tool_hash(cls, options):
+        '''Hash the sources of the trace tools and the options.'''
+        h = hashlib.sha256()
+        tools_dir = os.path.dirname(os.path.abspath(__file__))
+        for entry in sorted(os.listdir(tools_dir)):
+            if entry.endswith('.py'):
+                h.update(entry.encode('utf-8') + b'\0')
+                with open(os.path.join(tools_dir, entry), 'rb') as fp:
+                    h.update(fp.read())
+        for name, value in sorted(vars(options).items()):
+            if name not in cls.ignored_options:
+                h.update(f'{name}={value!r}\0'.encode('utf-8'))
+        return h.hexdigest()
+
+    def _filename(self, no):
+        return os.path.join(self.directory, f'{no}.pickle')
+
+    def call_numbers(self):
+        numbers = []
+        for entry in os.listdir(self.directory):
+            name, ext = os.path.splitext(entry)
+            if ext == '.pickle' and name.isdigit():
+                numbers.append(int(name))
+        return sorted(numbers)
+
+    def nearest(self, call_no):
+        '''Return the number of the last checkpointed call before call_no.'''
+        result = None
+        for no in self.call_numbers():
+            if no >= call_no:
+                break
+            result = no
+        return result
+
+    def save(self, no, interpreter):
+        # Write to a temporary file first, so that an interrupted run never
+        # leaves a truncated checkpoint behind.
+        tmp_filename = self._filename(no) + '.tmp'
+        with open(tmp_filename, 'wb') as fp:
+            pickle.dump(interpreter.snapshot(), fp, pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_filename, self._filename(no))
+
+    def load(self, no, interpreter):
+        with open(self._filename(no), 'rb') as fp:
+            interpreter.restore(pickle.load(fp))
+
+
 class Interpreter(parser.SimpleTraceDumper):
     '''Specialization of a trace parser that interprets the calls as it goes
     along.'''
@@ -786,6 +874,42 @@ class Interpreter(parser.SimpleTraceDumper):
         self.result = None
         self.globl = Global(self)
         self.call_no = None
+        self.checkpoints = None
+
+    def parse(self):
+        start = None
+        if self.checkpoints is not None and self.options.at_call is not None:
+            start = self.checkpoints.nearest(self.options.call)
+            if start is not None:
+                if self.verbosity(1):
+                    sys.stderr.write(f'restoring checkpoint at call {start}\n')
+                self.checkpoints.load(start, self)
+                start += 1
+
+        interval = self.options.checkpoint_interval
+        last_checkpoint = start or 0
+        for call in self.parse_calls(start):
+            self.handle_call(call)
+            if self.checkpoints is not None and call.no - last_checkpoint >= interval:
+                self.checkpoints.save(call.no, self)
+                last_checkpoint = call.no
+
+    def snapshot(self):
+        '''Return everything needed to resume interpreting after the current
+        call.'''
+        return {
+            'objects': self.objects,
+            'globl': self.globl,
+            'ptr_state': self.state,
+        }
+
+    def restore(self, snapshot):
+        self.objects = snapshot['objects']
+        self.globl = snapshot['globl']
+        self.state.__dict__.update(snapshot['ptr_state'].__dict__)
+        for obj in [self.globl] + list(self.objects.values()):
+            if isinstance(obj, Dispatcher):
+                obj.interpreter = self
 
     def register_object(self, address, object):
         self.objects[address] = object
@@ -854,6 +978,9 @@ class DumpStateOptions(parser.ParseOptions):
         self.verbosity = None
         self.call = None
         self.draw = None
+        self.at_call = None
+        self.checkpoint_interval = None
+        self.checkpoint_dir = None
 
         parser.ParseOptions.__init__(self, args)
 
@@ -865,12 +992,16 @@ class Main(parser.Main):
             description="Parse and dump Gallium trace(s) as JSON")
 
         optparser.add_argument("filename", action="extend", nargs="+",
-            type=str, metavar="filename", help="Gallium trace filename (plain or .gz, .bz2)")
+            type=str, metavar="filename", help="Gallium trace filename (plain, .gz, .bz2 or indexed)")
 
         optparser.add_argument("-v", "--verbose", action="count", default=0, dest="verbosity", help="increase verbosity level")
         optparser.add_argument("-q", "--quiet", action="store_const", const=0, dest="verbosity", help="no messages")
         optparser.add_argument("-c", "--call", action="store", type=int, dest="call", default=0xffffffff, help="dump on this call")
         optparser.add_argument("-d", "--draw", action="store", type=int, dest="draw", default=0xffffffff, help="dump on this draw")
+        optparser.add_argument("-a", "--at-call", action="store", type=int, dest="at_call", default=None, help="dump on this call, resuming from the nearest checkpoint")
+        optparser.add_argument("-K", "--checkpoint-interval", action="store", type=int, dest="checkpoint_interval", default=None, help="checkpoint the state every this many calls (default: 50000 with --at-call)")
+        optparser.add_argument("--checkpoint-dir", action="store", type=str, dest="checkpoint_dir", default=None, help="checkpoint directory (default: <filename>.checkpoints)")
+        optparser.add_argument("-j", "--jobs", action="store", type=int, dest="jobs", default=1, help="parse XML traces with this many worker processes (0 for one per CPU)")
         return optparser
 
     def make_options(self, args):
@@ -879,6 +1010,15 @@ class Main(parser.Main):
     def process_arg(self, stream, options):
         formatter = format.Formatter(sys.stderr)
         parser = Interpreter(stream, options, formatter, model.TraceStateData())
+
+        if options.at_call is not None:
+            options.call = options.at_call
+            if options.checkpoint_interval is None:
+                options.checkpoint_interval = 50000
+        if options.checkpoint_interval:
+            directory = options.checkpoint_dir or self.filename + '.checkpoints'
+            parser.checkpoints = Checkpoints(directory, self.filename, options)
+
         parser.parse()
 
 
@@ -65,7 +65,9 @@ class TraceStateData:
 
 
 class Node:
-    
+
+    __slots__ = ()
+
     def visit(self, visitor):
         raise NotImplementedError
 
@@ -81,7 +83,9 @@ class Node:
 
 
 class Literal(Node):
-    
+
+    __slots__ = ('value',)
+
     def __init__(self, value):
         self.value = value
 
@@ -93,9 +97,14 @@ class Literal(Node):
 
 
 class Blob(Node):
-    
+
+    __slots__ = ('value',)
+
     def __init__(self, value):
-        self.value = binascii.a2b_hex(value)
+        # Accept either the hex dump found in XML traces or raw bytes
+        if isinstance(value, str):
+            value = binascii.a2b_hex(value)
+        self.value = value
 
     def getValue(self):
         return self.value
@@ -108,7 +117,9 @@ class Blob(Node):
 
 
 class NamedConstant(Node):
-    
+
+    __slots__ = ('name',)
+
     def __init__(self, name):
         self.name = name
 
@@ -120,7 +131,9 @@ class NamedConstant(Node):
     
 
 class Array(Node):
-    
+
+    __slots__ = ('elements',)
+
     def __init__(self, elements):
         self.elements = elements
 
@@ -135,7 +148,9 @@ class Array(Node):
 
 
 class Struct(Node):
-    
+
+    __slots__ = ('name', 'members')
+
     def __init__(self, name, members):
         self.name = name
         self.members = members        
@@ -152,11 +167,14 @@ class Struct(Node):
 
 class Pointer(Node):
 
+    __slots__ = ('address', 'state', 'pname')
+
     ptr_ignore_list = ["ret", "elem"]
 
     def __init__(self, state, address, pname):
         self.address = address
         self.state = state
+        self.pname = pname
 
         # Check if address exists in list and if it is a return value address
         t1 = address in state.ptr_list
@@ -196,7 +214,9 @@ class Pointer(Node):
 
 
 class Call:
-    
+
+    __slots__ = ('no', 'klass', 'method', 'args', 'ret', 'time', 'hashvalue', 'is_junk')
+
     def __init__(self, no, klass, method, args, ret, time):
         self.no = no
         self.klass = klass
@@ -204,7 +224,10 @@ class Call:
         self.args = args
         self.ret = ret
         self.time = time
+        self.is_junk = False
+        self.rehash()
 
+    def rehash(self):
         # Calculate hashvalue "cached" into a variable
         self.hashvalue = hash(self.klass) ^ hash(self.method)
         for mname, mobj in self.args:
@@ -34,6 +34,7 @@ import argparse
 
 import format
 from model import *
+from trace_index import TraceIndex, is_trace_index
 
 
 trace_ignore_calls = set((
@@ -57,6 +58,8 @@ ELEMENT_START, ELEMENT_END, CHARACTER_DATA, EOF = range(4)
 
 class XmlToken:
 
+    __slots__ = ('type', 'name_or_data', 'attrs', 'line', 'column')
+
     def __init__(self, type, name_or_data, attrs = None, line = None, column = None):
         assert type in (ELEMENT_START, ELEMENT_END, CHARACTER_DATA, EOF)
         self.type = type
@@ -209,19 +212,46 @@ class XmlParser:
 class TraceParser(XmlParser):
 
     def __init__(self, fp, options, state):
-        XmlParser.__init__(self, fp)
+        if hasattr(fp, 'calls'):
+            # Indexed and parallel traces hand out ready made calls
+            self.reader = fp
+        else:
+            self.reader = None
+            XmlParser.__init__(self, fp)
         self.last_call_no = 0
         self.state = state
         self.options = options
 
     def parse(self):
+        start, end = getattr(self.options, 'call_range', None) or (None, None)
+        for call in self.parse_calls(start, end):
+            self.handle_call(call)
+
+    def parse_calls(self, start=None, end=None):
+        '''Generator yielding each call as soon as its closing tag has been
+        parsed, so that callers never need to hold the whole trace in memory.
+
+        Only calls numbered from start to end (both inclusive) are yielded.
+        Indexed traces jump straight to the first one, XML traces have to be
+        parsed up to it.'''
+        if self.reader is not None:
+            for call in self.reader.calls(self.state, start, end):
+                call.is_junk = trace_call_ignore(call)
+                yield call
+            return
+
         self.element_start('trace')
         while self.token.type not in (ELEMENT_END, EOF):
             call = self.parse_call()
+            if start is not None and call.no < start:
+                continue
+            if end is not None and call.no > end:
+                break
             call.is_junk = trace_call_ignore(call)
-            self.handle_call(call)
-        if self.token.type != EOF:
-            self.element_end('trace')
+            yield call
+        else:
+            if self.token.type != EOF:
+                self.element_end('trace')
 
     def parse_call(self):
         attrs = self.element_start('call')
@@ -388,19 +418,59 @@ class SimpleTraceDumper(TraceParser):
 
 
 class TraceDumper(SimpleTraceDumper):
+    '''Trace dumper which also handles symbolic pointer names.
 
-    def __init__(self, fp, options, formatter, state):
-        SimpleTraceDumper.__init__(self, fp, options, formatter, state)
-        self.call_stack = []
+    Pointer names only become final once the whole trace has been seen, so
+    with named pointers the stream is parsed twice: a first pass that just
+    collects the names (see name_pointers()) and a second one that prints
+    the calls as they are parsed.'''
 
-    def handle_call(self, call):
-        if self.options.ignore_junk and call.is_junk:
-            return
 
-        if self.options.named_ptrs:
-            self.call_stack.append(call)
+def name_pointers(fp, options, state):
+    '''Parse a whole trace only to fill in the pointer names of state.
+
+    Calls are dropped as soon as they are parsed, so memory usage is bounded
+    by the number of distinct pointers rather than by the trace size. The
+    call range of options is ignored, so that the names don't depend on it,
+    nor on whether an index lets the parser skip to the first call of the
+    range. The stream is rewound afterwards.'''
+    for call in TraceParser(fp, options, state).parse_calls():
+        pass
+    fp.seek(0)
+
+
+def open_trace(fname, jobs=1):
+    '''Open a plain, compressed or indexed trace for TraceParser.
+
+    With more than one job, XML traces are parsed by a pool of worker
+    processes instead (see parse_parallel.py).'''
+    if jobs != 1 and not is_trace_index(fname):
+        from parse_parallel import ParallelTrace
+        return ParallelTrace(fname, jobs)
+    if fname.endswith('.gz'):
+        from gzip import GzipFile
+        return io.TextIOWrapper(GzipFile(fname, 'rb'))
+    elif fname.endswith('.bz2'):
+        from bz2 import BZ2File
+        return io.TextIOWrapper(BZ2File(fname, 'rb'))
+    elif is_trace_index(fname):
+        return TraceIndex(fname)
+    else:
+        return open(fname, 'rt')
+
+
+def call_range(vstr):
+    '''Parse a "N", "N-M", "N-" or "-M" call number range.'''
+    try:
+        if '-' not in vstr:
+            start = end = int(vstr)
         else:
-            call.visit(self.pretty_printer)
+            start, end = vstr.split('-', 1)
+            start = int(start) if start else None
+            end = int(end) if end else None
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid call range '{vstr}'")
+    return start, end
 
 
 class ParseOptions(ModelOptions):
@@ -409,6 +479,8 @@ class ParseOptions(ModelOptions):
         # Initialize options local to this module
         self.plain = False
         self.ignore_junk = False
+        self.call_range = None
+        self.jobs = 1
 
         ModelOptions.__init__(self, args)
 
@@ -417,7 +489,7 @@ class Main:
     '''Common main class for all retrace command line utilities.''' 
 
     def __init__(self):
-        pass
+        self.filename = None
 
     def main(self):
         optparser = self.get_optparser()
@@ -426,18 +498,12 @@ class Main:
 
         for fname in args.filename:
             try:
-                if fname.endswith('.gz'):
-                    from gzip import GzipFile
-                    stream = io.TextIOWrapper(GzipFile(fname, 'rb'))
-                elif fname.endswith('.bz2'):
-                    from bz2 import BZ2File
-                    stream = io.TextIOWrapper(BZ2File(fname, 'rb'))
-                else:
-                    stream = open(fname, 'rt')
+                stream = open_trace(fname, options.jobs)
             except Exception as e:
                 print("ERROR: {}".format(str(e)))
                 sys.exit(1)
 
+            self.filename = fname
             self.process_arg(stream, options)
 
     def make_options(self, args):
@@ -454,7 +520,15 @@ class Main:
             epilog=estr)
 
         optparser.add_argument("filename", action="extend", nargs="+",
-            type=str, metavar="filename", help="Gallium trace filename (plain or .gz, .bz2)")
+            type=str, metavar="filename", help="Gallium trace filename (plain, .gz, .bz2 or indexed)")
+
+        optparser.add_argument("-r", "--range",
+            type=call_range, default=None, metavar="N[-M]",
+            dest="call_range", help="only dump calls in this call number range")
+
+        optparser.add_argument("-j", "--jobs",
+            type=int, default=1, metavar="N",
+            dest="jobs", help="parse XML traces with N worker processes (0 for one per CPU)")
 
         optparser.add_argument("-p", "--plain",
             action="store_const", const=True, default=False,
@@ -484,12 +558,12 @@ class Main:
         else:
             formatter = format.DefaultFormatter(sys.stdout)
 
-        dump = TraceDumper(stream, options, formatter, TraceStateData())
-        dump.parse()
-
+        state = TraceStateData()
         if options.named_ptrs:
-            for call in dump.call_stack:
-                call.visit(dump.pretty_printer)
+            name_pointers(stream, options, state)
+
+        dump = TraceDumper(stream, options, formatter, state)
+        dump.parse()
 
 
 if __name__ == '__main__':
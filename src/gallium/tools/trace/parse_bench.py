@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+# SPDX-License-Identifier: MIT
+
+'''Benchmark the streaming trace parser on a synthetic trace.
+
+Reports parsing throughput and the peak RSS of the process, e.g.
+
+  ./parse_bench.py -n 1000000
+  ./parse_bench.py -n 1000000 --named
+'''
+
+import argparse
+import os
+import resource
+import sys
+import tempfile
+import time
+
+import parse
+from model import TraceStateData
+
+
+def write_synthetic_trace(fp, num_calls):
+    '''Write a trace of num_calls calls looking roughly like a draw loop.'''
+    fp.write("<?xml version='1.0' encoding='UTF-8'?>\n")
+    fp.write("<trace version='0.2'>\n")
+    for no in range(1, num_calls + 1):
+        kind = no % 4
+        if kind == 0:
+            fp.write(f"<call no='{no}' class='pipe_context' method='draw_vbo'>"
+                     "<arg name='pipe'><ptr>0x55d0c0de0000</ptr></arg>"
+                     "<arg name='info'><struct name='pipe_draw_info'>"
+                     "<member name='index_size'><uint>2</uint></member>"
+                     "<member name='mode'><enum>PIPE_PRIM_TRIANGLES</enum></member>"
+                     "<member name='index.resource'><ptr>0x55d0c0de1000</ptr></member>"
+                     "</struct></arg>"
+                     "<arg name='drawid_offset'><uint>0</uint></arg>"
+                     "<arg name='indirect'><null/></arg>"
+                     "<arg name='draws'><array><elem><struct name='pipe_draw_start_count_bias'>"
+                     f"<member name='start'><uint>{no % 1024}</uint></member>"
+                     "<member name='count'><uint>36</uint></member>"
+                     "<member name='index_bias'><int>0</int></member>"
+                     "</struct></elem></array></arg>"
+                     "<arg name='num_draws'><uint>1</uint></arg>"
+                     "<time><int>3</int></time></call>\n")
+        elif kind == 1:
+            fp.write(f"<call no='{no}' class='pipe_context' method='create_sampler_view'>"
+                     "<arg name='pipe'><ptr>0x55d0c0de0000</ptr></arg>"
+                     f"<arg name='resource'><ptr>0x{0x55d0c0e00000 + (no % 4096) * 0x100:x}</ptr></arg>"
+                     "<arg name='templ'><struct name='pipe_sampler_view'>"
+                     "<member name='format'><enum>PIPE_FORMAT_B8G8R8A8_UNORM</enum></member>"
+                     "</struct></arg>"
+                     f"<ret><ptr>0x{0x55d0c1000000 + (no % 4096) * 0x100:x}</ptr></ret>"
+                     "<time><int>1</int></time></call>\n")
+        elif kind == 2:
+            fp.write(f"<call no='{no}' class='pipe_context' method='set_constant_buffer'>"
+                     "<arg name='pipe'><ptr>0x55d0c0de0000</ptr></arg>"
+                     "<arg name='shader'><enum>PIPE_SHADER_FRAGMENT</enum></arg>"
+                     "<arg name='index'><uint>0</uint></arg>"
+                     "<arg name='take_ownership'><bool>0</bool></arg>"
+                     "<arg name='constant_buffer'><struct name='pipe_constant_buffer'>"
+                     "<member name='buffer'><null/></member>"
+                     "<member name='buffer_offset'><uint>0</uint></member>"
+                     "<member name='buffer_size'><uint>16</uint></member>"
+                     "<member name='user_buffer'><bytes>0000803f0000803f0000803f0000803f</bytes></member>"
+                     "</struct></arg>"
+                     "<time><int>1</int></time></call>\n")
+        else:
+            fp.write(f"<call no='{no}' class='pipe_screen' method='get_param'>"
+                     "<arg name='screen'><ptr>0x55d0c0ce0000</ptr></arg>"
+                     "<arg name='param'><enum>PIPE_CAP_NPOT_TEXTURES</enum></arg>"
+                     "<ret><int>1</int></ret>"
+                     "<time><float>0.5</float></time></call>\n")
+    fp.write("</trace>\n")
+
+
+def peak_rss_mib():
+    # ru_maxrss is in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def main():
+    optparser = argparse.ArgumentParser(
+        description="Benchmark the Gallium trace parser on a synthetic trace")
+
+    optparser.add_argument("-n", "--num-calls",
+        type=int, default=1000000, dest="num_calls",
+        help="number of calls in the synthetic trace (default: %(default)s)")
+
+    optparser.add_argument("-N", "--named",
+        action="store_const", const=True, default=False,
+        dest="named_ptrs", help="also run the pointer naming pass")
+
+    optparser.add_argument("-j", "--jobs",
+        type=int, default=1, metavar="N",
+        dest="jobs", help="parse with N worker processes (0 for one per CPU)")
+
+    optparser.add_argument("-k", "--keep",
+        type=str, default=None, metavar="filename",
+        help="write the synthetic trace to this file and keep it")
+
+    args = optparser.parse_args()
+    options = parse.ParseOptions(args)
+
+    if args.keep:
+        filename = args.keep
+    else:
+        fd, filename = tempfile.mkstemp(suffix='.gtrace')
+        os.close(fd)
+
+    try:
+        print(f"Generating {args.num_calls} calls ...", file=sys.stderr)
+        with open(filename, 'wt') as fp:
+            write_synthetic_trace(fp, args.num_calls)
+        baseline_rss = peak_rss_mib()
+
+        stream = parse.open_trace(filename, options.jobs)
+        state = TraceStateData()
+        start = time.perf_counter()
+        if options.named_ptrs:
+            parse.name_pointers(stream, options, state)
+        ncalls = 0
+        for call in parse.TraceParser(stream, options, state).parse_calls():
+            ncalls += 1
+        elapsed = time.perf_counter() - start
+    finally:
+        if not args.keep:
+            os.unlink(filename)
+
+    print(f"calls:     {ncalls}")
+    print(f"time:      {elapsed:.2f} s")
+    print(f"calls/sec: {ncalls / elapsed:.0f}")
+    # Worker processes are not accounted for
+    print(f"peak RSS:  {peak_rss_mib():.1f} MiB (before parsing: {baseline_rss:.1f} MiB)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+# SPDX-License-Identifier: MIT
+
+'''Multi-process front end for parse.py.
+
+The trace is cut into chunks before top-level <call> tags, never inside a
+call, which may have nested calls. Uncompressed traces are cut by seeking
+into the file, so workers read their own chunk directly; gzip and bzip2
+streams cannot be entered at arbitrary offsets, so they are decompressed by
+the main process and the chunks handed to the workers. Either way the main
+process reads the trace to find the cuts, but it only counts tags, which is
+much cheaper than parsing.
+
+Workers parse their chunk with the regular TraceParser and send the calls
+back in batches. A call without a no attribute is numbered after the call
+before it, and symbolic pointer names depend on every pointer seen before,
+so workers record the numbers and pointers of every call in trace order,
+nested calls included, and the main process replays them: it numbers the
+calls and binds the pointers to the real state. Call hashes depend on the
+pointer names, and on the hash seed of the process, so they are computed by
+the main process too, once the pointers are bound.
+'''
+
+import collections
+import io
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from model import *
+
+
+CALL_START = b'<call '
+CALL_END = b'</call>'
+TRACE_END = '</trace>'
+
+
+def _cuts(fp, chunk_size, block_size=1024*1024):
+    '''Yield the offsets to cut the trace read from fp at: the first
+    top-level <call> tag, then the first one at least chunk_size bytes after
+    the previous cut, and so on.
+
+    Only the tags around the cuts are looked at one by one, the depth of the
+    nesting is otherwise kept up to date by counting them.'''
+    depth = 0
+    offset = 0      # of data[0] in the trace
+    target = 0      # where the next cut is due
+    data = b''
+    while True:
+        block = fp.read(block_size)
+        data += block
+        # A tag cut by the end of the block is left for the next one
+        end = len(data)
+        if block:
+            lt = data.rfind(b'<', max(end - len(CALL_END) + 1, 0))
+            if lt >= 0:
+                end = lt
+
+        pos = 0
+        while pos < end:
+            stop = min(target - offset, end)
+            if stop < end:
+                # Don't stop in the middle of a tag
+                lt = data.rfind(b'<', max(stop - len(CALL_END) + 1, pos),
+                                stop + 1)
+                if lt >= 0:
+                    stop = lt
+            if stop > pos:
+                depth += data.count(CALL_START, pos, stop) - \
+                         data.count(CALL_END, pos, stop)
+                pos = stop
+                continue
+
+            start = data.find(CALL_START, pos, end)
+            close = data.find(CALL_END, pos, start if start >= 0 else end)
+            if close >= 0:
+                depth -= 1
+                pos = close + len(CALL_END)
+            elif start >= 0:
+                if depth == 0:
+                    yield offset + start
+                    target = offset + start + chunk_size
+                depth += 1
+                pos = start + len(CALL_START)
+            else:
+                pos = end
+
+        offset += end
+        data = data[end:]
+        if not block:
+            return
+
+
+class _Recorder:
+    '''Keeps what is read from a stream, from offset on.'''
+
+    def __init__(self, fp):
+        self.fp = fp
+        self.data = bytearray()
+        self.offset = 0
+
+    def read(self, size):
+        block = self.fp.read(size)
+        self.data += block
+        return block
+
+    def take(self, end):
+        '''Return the data up to end, and forget it.'''
+        data = bytes(self.data[:end - self.offset])
+        del self.data[:end - self.offset]
+        self.offset = end
+        return data
+
+
+def _parse_chunk(task):
+    import parse
+
+    class ChunkParser(parse.TraceParser):
+        # Records the no attribute of every call, or None, and every
+        # pointer, in trace order
+
+        def __init__(self, fp, options, state):
+            parse.TraceParser.__init__(self, fp, options, state)
+            self.call_nos = []
+            self.pointers = []
+
+        def element_start(self, name):
+            attrs = parse.TraceParser.element_start(self, name)
+            if name == 'call':
+                no = attrs.get('no')
+                self.call_nos.append(None if no is None else int(no))
+            return attrs
+
+        def parse_ptr(self, pname):
+            pointer = parse.TraceParser.parse_ptr(self, pname)
+            self.pointers.append(pointer)
+            return pointer
+
+    filename, offset, size, data = task
+    if data is None:
+        with open(filename, 'rb') as fp:
+            fp.seek(offset)
+            data = fp.read(size)
+
+    text = data.decode('utf-8')
+    end = text.find(TRACE_END)
+    if end >= 0:
+        text = text[:end]
+    text = text.rstrip('\0')
+
+    stream = io.StringIO('<trace>' + text + TRACE_END)
+    parser = ChunkParser(stream, parse.ParseOptions(), TraceStateData())
+    calls = []
+    for call in parser.parse_calls():
+        for pointer in parser.pointers:
+            pointer.state = None
+        call.hashvalue = None
+        calls.append((call, parser.call_nos, parser.pointers))
+        parser.call_nos = []
+        parser.pointers = []
+    return calls
+
+
+class ParallelTrace:
+    '''XML trace parsed by a pool of worker processes.
+
+    Can be handed to parse.TraceParser in place of a stream; calls come out
+    in trace order.'''
+
+    chunk_size = 4*1024*1024
+
+    def __init__(self, filename, jobs=0):
+        self.filename = filename
+        self.jobs = jobs or os.cpu_count()
+
+    def seek(self, pos):
+        # Every calls() invocation re-reads the file from the start; this
+        # only lets parallel traces stand in for a rewindable stream.
+        assert pos == 0
+
+    def calls(self, state, start=None, end=None):
+        # Keep a bounded number of chunks in flight so that memory usage
+        # stays proportional to the number of jobs, not to the trace size.
+        with ProcessPoolExecutor(self.jobs) as executor:
+            pending = collections.deque()
+            tasks = self._tasks()
+            last_no = 0
+            while True:
+                while len(pending) < 2*self.jobs:
+                    task = next(tasks, None)
+                    if task is None:
+                        break
+                    pending.append(executor.submit(_parse_chunk, task))
+                if not pending:
+                    break
+
+                for call, call_nos, pointers in pending.popleft().result():
+                    # Numbered like TraceParser.parse_call() does
+                    for i, no in enumerate(call_nos):
+                        last_no = last_no + 1 if no is None else no
+                        if i == 0:
+                            call.no = last_no
+                    for pointer in pointers:
+                        Pointer.__init__(pointer, state, pointer.address,
+                                         pointer.pname)
+                    call.rehash()
+                    if start is not None and call.no < start:
+                        continue
+                    if end is not None and call.no > end:
+                        for future in pending:
+                            future.cancel()
+                        return
+                    yield call
+
+    def _tasks(self):
+        if self.filename.endswith('.gz'):
+            from gzip import GzipFile
+            return self._stream_tasks(GzipFile(self.filename, 'rb'))
+        elif self.filename.endswith('.bz2'):
+            from bz2 import BZ2File
+            return self._stream_tasks(BZ2File(self.filename, 'rb'))
+        else:
+            return self._file_tasks()
+
+    def _file_tasks(self):
+        size = os.path.getsize(self.filename)
+        with open(self.filename, 'rb') as fp:
+            begin = None
+            for end in _cuts(fp, self.chunk_size):
+                if begin is not None:
+                    yield self.filename, begin, end - begin, None
+                begin = end
+        if begin is not None:
+            yield self.filename, begin, size - begin, None
+
+    def _stream_tasks(self, fp):
+        with fp:
+            recorder = _Recorder(fp)
+            begin = None
+            for end in _cuts(recorder, self.chunk_size):
+                data = recorder.take(end)
+                if begin is not None:
+                    yield self.filename, 0, len(data), data
+                begin = end
+            if begin is not None:
+                data = recorder.take(recorder.offset + len(recorder.data))
+                yield self.filename, 0, len(data), data
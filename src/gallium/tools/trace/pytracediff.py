@@ -26,13 +26,13 @@
 ##########################################################################
 
 from parse import *
+import calldiff
 import os
 import sys
 import re
 import signal
 import functools
 import argparse
-import difflib
 import subprocess
 
 assert sys.version_info >= (3, 6), 'Python >= 3.6 required'
@@ -232,18 +232,17 @@ class PKKPrettyPrinter(PrettyPrinter):
 def pkk_parse_trace(filename, options, state):
     pkk_info(f"Parsing {filename} ...")
     try:
-        if filename.endswith(".gz"):
-            from gzip import GzipFile
-            stream = io.TextIOWrapper(GzipFile(filename, "rb"))
-        elif filename.endswith(".bz2"):
-            from bz2 import BZ2File
-            stream = io.TextIOWrapper(BZ2File(filename, "rb"))
-        else:
-            stream = open(filename, "rt")
-
-    except OSError as e:
+        stream = open_trace(filename, options.jobs)
+    except (OSError, ValueError) as e:
         pkk_fatal(str(e))
 
+    if options.window:
+        # Calls are consumed while diffing, but symbolic pointer names are
+        # only final once the whole trace has been seen.
+        if options.named_ptrs:
+            name_pointers(stream, options, state)
+        return TraceParser(stream, options, state).parse_calls()
+
     parser = PKKTraceParser(stream, options, state)
     parser.parse()
 
@@ -291,12 +290,12 @@ if __name__ == "__main__":
     optparser.add_argument("filename1",
         type=str, action="store",
         metavar="<tracefile #1>",
-        help="Gallium trace XML filename (plain or .gz, .bz2)")
+        help="Gallium trace filename (plain, .gz, .bz2 or indexed)")
 
     optparser.add_argument("filename2",
         type=str, action="store",
         metavar="<tracefile #2>",
-        help="Gallium trace XML filename (plain or .gz, .bz2)")
+        help="Gallium trace filename (plain, .gz, .bz2 or indexed)")
 
     optparser.add_argument("-p", "--plain",
         dest="plain",
@@ -328,6 +327,23 @@ if __name__ == "__main__":
         action="store_true",
         help="filter out/ignore junk calls (see below)")
 
+    optparser.add_argument("-j", "--jobs",
+        dest="jobs",
+        type=int, default=1,
+        metavar="N",
+        help="parse XML traces with N worker processes (0 for one per CPU)")
+
+    optparser.add_argument("-e", "--engine",
+        dest="engine",
+        choices=calldiff.ENGINES, default="myers",
+        help="diff engine (default: %(default)s)")
+
+    optparser.add_argument("-W", "--window",
+        dest="window",
+        type=functools.partial(pkk_arg_range, vmin=0, vmax=1 << 30), default=0,
+        metavar="N",
+        help="diff in windows of N calls instead of loading both traces fully (default: off)")
+
     optparser.add_argument("-w", "--width",
         dest="output_width",
         type=functools.partial(pkk_arg_range, vmin=16, vmax=512), default=defwidth,
@@ -342,13 +358,14 @@ if __name__ == "__main__":
 
     ### Perform diffing
     pkk_info("Matching trace sequences ...")
-    sequence = difflib.SequenceMatcher(lambda x : x.is_junk, stack1, stack2, autojunk=False)
+    blocks = calldiff.diff_blocks(stack1, stack2, options.engine, options.window)
 
-    pkk_info("Sequencing diff ...")
-    opcodes = sequence.get_opcodes()
-    if len(opcodes) == 1 and opcodes[0][0] == "equal":
-        print("The files are identical.")
-        sys.exit(0)
+    if not options.window:
+        blocks = list(blocks)
+        if len(blocks) == 1 and blocks[0][0] == "equal":
+            print("The files are identical.")
+            sys.exit(0)
+    identical = True
 
     ### Redirect output to 'less' if stdout is a tty
     try:
@@ -363,7 +380,10 @@ if __name__ == "__main__":
         printer = PKKPrettyPrinter(options)
 
         prevtag = ""
-        for tag, start1, end1, start2, end2 in opcodes:
+        for tag, calls1, calls2 in blocks:
+            if tag != "equal":
+                identical = False
+
             if tag == "equal":
                 show_args = False
                 if options.suppress_common:
@@ -389,7 +409,7 @@ if __name__ == "__main__":
                 ansi1 = ansi2 = PKK_ANSI_ESC + PKK_ANSI_BOLD
                 show_args = True
             else:
-                pkk_fatal(f"Internal error, unsupported difflib.SequenceMatcher operation '{tag}'.")
+                pkk_fatal(f"Internal error, unsupported diff operation '{tag}'.")
 
             # No ANSI, please
             if options.plain:
@@ -400,15 +420,17 @@ if __name__ == "__main__":
 
 
             # Print out the block
-            ncall1 = start1
-            ncall2 = start2
+            ncall1 = 0
+            ncall2 = 0
+            end1 = len(calls1)
+            end2 = len(calls2)
             last1 = last2 = False
             while True:
                 # Get line data
                 if ncall1 < end1:
-                    if not options.ignore_junk or not stack1[ncall1].is_junk:
+                    if not options.ignore_junk or not calls1[ncall1].is_junk:
                         printer.entry_start(show_args)
-                        stack1[ncall1].visit(printer)
+                        calls1[ncall1].visit(printer)
                         data1 = printer.entry_get()
                     else:
                         data1 = []
@@ -418,9 +440,9 @@ if __name__ == "__main__":
                     last1 = True
 
                 if ncall2 < end2:
-                    if not options.ignore_junk or not stack2[ncall2].is_junk:
+                    if not options.ignore_junk or not calls2[ncall2].is_junk:
                         printer.entry_start(show_args)
-                        stack2[ncall2].visit(printer)
+                        calls2[ncall2].visit(printer)
                         data2 = printer.entry_get()
                     else:
                         data2 = []
@@ -473,3 +495,6 @@ if __name__ == "__main__":
 
     if outpipe is not None:
         outpipe.communicate()
+
+    if options.window and identical:
+        pkk_info("The files are identical.")
@@ -0,0 +1,439 @@
+#!/usr/bin/env python3
+# SPDX-License-Identifier: MIT
+
+'''Binary, randomly accessible container for Gallium traces.
+
+Converting an XML trace once with
+
+  ./trace_index.py foo.gtrace.bz2 -o foo.gtidx
+
+produces a file that all the trace tools accept in place of the XML one, and
+which can be positioned at any call without re-parsing what precedes it.
+
+File layout (all integers little endian):
+
+  header    magic, version, call count and the offsets of the sections below
+  calls     one variable length record per call, in trace order
+  blobs     raw contents of every <bytes> element, back to back
+  strings   interned class, method, argument, member, enum and pointer names
+  blob idx  (offset, size) pairs, one per blob
+  call idx  (call number, record offset) pairs, in trace order
+  no idx    (call number, call position) pairs sorted by call number, where
+            the position is that of the first call in trace order numbered
+            as high or higher; empty when the calls are numbered in order
+
+Call records encode values with a one byte tag followed by unsigned LEB128
+integers (zig-zag encoded for signed ones), string table indices or nested
+values, see _write_value() / _read_value().
+'''
+
+import argparse
+import array
+import mmap
+import struct
+import sys
+import tempfile
+
+from model import *
+
+
+MAGIC = b'GTRCIDX\0'
+VERSION = 2
+
+# magic, version, num_calls, num_strings, num_blobs, num_nos, then the offsets
+# of the blob, string, blob index, call index and number index sections
+_header = struct.Struct('<8sIQQQQQQQQQ')
+
+TAG_NULL, TAG_INT, TAG_FLOAT, TAG_STRING, TAG_ENUM, TAG_BYTES, TAG_ARRAY, TAG_STRUCT, TAG_PTR = range(9)
+
+_float = struct.Struct('<d')
+
+
+def _write_uint(out, value):
+    while value >= 0x80:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _write_int(out, value):
+    # zig-zag encoding, which works for arbitrarily large Python integers
+    _write_uint(out, (value << 1) if value >= 0 else ((-value << 1) - 1))
+
+
+def _read_uint(buf, pos):
+    result = 0
+    shift = 0
+    while True:
+        byte = buf[pos]
+        pos += 1
+        result |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return result, pos
+        shift += 7
+
+
+def _read_int(buf, pos):
+    value, pos = _read_uint(buf, pos)
+    if value & 1:
+        return -((value + 1) >> 1), pos
+    return value >> 1, pos
+
+
+class TraceIndexWriter:
+    '''Serialize model.Call objects into an indexed trace file.'''
+
+    def __init__(self, fp):
+        self.fp = fp
+        self.strings = {}
+        self.blobs = tempfile.TemporaryFile()
+        self.blob_index = array.array('Q')
+        self.blob_size = 0
+        self.call_index = array.array('Q')
+        self.last_no = -1
+        self.sorted = True
+
+        self.fp.write(b'\0' * _header.size)
+        self.offset = _header.size
+
+    def intern(self, string):
+        try:
+            return self.strings[string]
+        except KeyError:
+            index = len(self.strings)
+            self.strings[string] = index
+            return index
+
+    def write_call(self, call):
+        out = bytearray()
+        _write_uint(out, call.no)
+        _write_uint(out, self.intern(call.klass))
+        _write_uint(out, self.intern(call.method))
+        _write_uint(out, len(call.args))
+        for name, value in call.args:
+            _write_uint(out, self.intern(name))
+            self._write_value(out, value)
+        for value in (call.ret, call.time):
+            if value is None:
+                out.append(0)
+            else:
+                out.append(1)
+                self._write_value(out, value)
+
+        self.sorted = self.sorted and call.no > self.last_no
+        self.last_no = call.no
+        self.call_index.append(call.no)
+        self.call_index.append(self.offset)
+        self.fp.write(out)
+        self.offset += len(out)
+
+    def _write_value(self, out, node):
+        if isinstance(node, Literal):
+            value = node.value
+            if value is None:
+                out.append(TAG_NULL)
+            elif isinstance(value, str):
+                out.append(TAG_STRING)
+                _write_uint(out, self.intern(value))
+            elif isinstance(value, float):
+                out.append(TAG_FLOAT)
+                out += _float.pack(value)
+            else:
+                out.append(TAG_INT)
+                _write_int(out, value)
+        elif isinstance(node, NamedConstant):
+            out.append(TAG_ENUM)
+            _write_uint(out, self.intern(node.name))
+        elif isinstance(node, Blob):
+            out.append(TAG_BYTES)
+            _write_uint(out, len(self.blob_index) // 2)
+            self.blob_index.append(self.blob_size)
+            self.blob_index.append(len(node.value))
+            self.blobs.write(node.value)
+            self.blob_size += len(node.value)
+        elif isinstance(node, Array):
+            out.append(TAG_ARRAY)
+            _write_uint(out, len(node.elements))
+            for elem in node.elements:
+                self._write_value(out, elem)
+        elif isinstance(node, Struct):
+            out.append(TAG_STRUCT)
+            _write_uint(out, self.intern(node.name))
+            _write_uint(out, len(node.members))
+            for name, value in node.members:
+                _write_uint(out, self.intern(name))
+                self._write_value(out, value)
+        elif isinstance(node, Pointer):
+            out.append(TAG_PTR)
+            _write_uint(out, self.intern(node.address))
+        else:
+            raise TypeError(f'unexpected trace node {node!r}')
+
+    def close(self):
+        blobs_offset = self.offset
+        self.blobs.seek(0)
+        while True:
+            data = self.blobs.read(1024*1024)
+            if not data:
+                break
+            self.fp.write(data)
+        self.blobs.close()
+        self.offset += self.blob_size
+
+        strings_offset = self.offset
+        out = bytearray()
+        for string in self.strings:
+            data = string.encode('utf-8')
+            _write_uint(out, len(data))
+            out += data
+        self.fp.write(out)
+        self.offset += len(out)
+
+        # Calls are normally numbered in order already, and lookups by number
+        # can bisect the call index. Otherwise they bisect a separate table,
+        # as the calls have to stay in trace order.
+        no_index = array.array('Q')
+        if not self.sorted:
+            nos = self.call_index[0::2]
+            first = len(nos)
+            for pos in sorted(range(len(nos)), key=nos.__getitem__, reverse=True):
+                first = min(first, pos)
+                no_index.append(first)
+                no_index.append(nos[pos])
+            no_index.reverse()
+
+        blob_index_offset = self.offset
+        self._write_array(self.blob_index)
+
+        call_index_offset = self.offset
+        self._write_array(self.call_index)
+
+        no_index_offset = self.offset
+        self._write_array(no_index)
+
+        self.fp.seek(0)
+        self.fp.write(_header.pack(MAGIC, VERSION,
+                                   len(self.call_index) // 2,
+                                   len(self.strings),
+                                   len(self.blob_index) // 2,
+                                   len(no_index) // 2,
+                                   blobs_offset, strings_offset,
+                                   blob_index_offset, call_index_offset,
+                                   no_index_offset))
+        self.fp.flush()
+
+    def _write_array(self, values):
+        if sys.byteorder != 'little':
+            values = array.array('Q', values)
+            values.byteswap()
+        self.fp.write(values.tobytes())
+        self.offset += len(values) * 8
+
+
+def _read_array(buf, offset, count):
+    view = memoryview(buf)[offset:offset + count * 8]
+    if sys.byteorder != 'little':
+        values = array.array('Q', view.tobytes())
+        values.byteswap()
+        return values
+    return view.cast('Q')
+
+
+class TraceIndex:
+    '''Random access reader for files written by TraceIndexWriter.
+
+    Objects of this class can be handed to parse.TraceParser (and therefore
+    to every trace tool) instead of an XML stream.'''
+
+    def __init__(self, filename):
+        self.filename = filename
+        with open(filename, 'rb') as fp:
+            self.buf = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+
+        (magic, version, self.num_calls, num_strings, num_blobs, num_nos,
+         self.blobs_offset, strings_offset,
+         blob_index_offset, call_index_offset,
+         no_index_offset) = _header.unpack_from(self.buf, 0)
+        if magic != MAGIC:
+            raise ValueError(f'{filename}: not an indexed trace')
+        if version != VERSION:
+            raise ValueError(f'{filename}: unsupported indexed trace version {version}')
+
+        self.strings = []
+        pos = strings_offset
+        for i in range(num_strings):
+            size, pos = _read_uint(self.buf, pos)
+            self.strings.append(str(self.buf[pos:pos + size], 'utf-8'))
+            pos += size
+
+        self.blob_index = _read_array(self.buf, blob_index_offset, num_blobs * 2)
+        self.call_index = _read_array(self.buf, call_index_offset, self.num_calls * 2)
+        self.no_index = _read_array(self.buf, no_index_offset, num_nos * 2)
+        self.first_no = self.call_index[0] if self.num_calls else 0
+
+    def __len__(self):
+        return self.num_calls
+
+    def seek(self, pos):
+        # Indexed traces have no read position; this only lets them stand in
+        # for a rewindable stream (see parse.name_pointers()).
+        assert pos == 0
+
+    def call_no(self, pos):
+        return self.call_index[2*pos]
+
+    def find(self, no):
+        '''Return the position of the first call numbered no or higher.
+
+        Calls are normally numbered contiguously, in which case this is a
+        single lookup, otherwise it falls back to a bisection of the call
+        index, or of the number index when calls are out of order.'''
+        if self.no_index:
+            lo, hi = 0, len(self.no_index) // 2
+            while lo < hi:
+                mid = (lo + hi) // 2
+                if self.no_index[2*mid] < no:
+                    lo = mid + 1
+                else:
+                    hi = mid
+            return self.no_index[2*lo + 1] if lo < len(self.no_index) // 2 else self.num_calls
+
+        pos = no - self.first_no
+        if pos <= 0:
+            return 0
+        if pos < self.num_calls and self.call_no(pos) == no:
+            return pos
+        lo, hi = 0, self.num_calls
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.call_no(mid) < no:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def calls(self, state, start=None, end=None):
+        '''Yield the calls numbered from start to end, both inclusive, in
+        trace order and up to the first one numbered past end, like
+        TraceParser.parse_calls() does for XML traces.'''
+        pos = 0 if start is None else self.find(start)
+        while pos < self.num_calls:
+            no = self.call_no(pos)
+            if end is not None and no > end:
+                break
+            if start is None or no >= start:
+                yield self.read_call(pos, state)
+            pos += 1
+
+    def read_call(self, pos, state):
+        buf = self.buf
+        strings = self.strings
+        offset = self.call_index[2*pos + 1]
+
+        no, offset = _read_uint(buf, offset)
+        klass, offset = _read_uint(buf, offset)
+        method, offset = _read_uint(buf, offset)
+        nargs, offset = _read_uint(buf, offset)
+        args = []
+        for i in range(nargs):
+            name, offset = _read_uint(buf, offset)
+            name = strings[name]
+            value, offset = self._read_value(offset, state, name)
+            args.append((name, value))
+
+        ret = time = None
+        if buf[offset]:
+            ret, offset = self._read_value(offset + 1, state, 'ret')
+        else:
+            offset += 1
+        if buf[offset]:
+            time, offset = self._read_value(offset + 1, state, 'time')
+
+        return Call(no, strings[klass], strings[method], args, ret, time)
+
+    def _read_value(self, offset, state, pname):
+        # pname mirrors the names TraceParser passes down when building
+        # Pointer nodes, so that symbolic pointer names come out the same.
+        buf = self.buf
+        tag = buf[offset]
+        offset += 1
+        if tag == TAG_NULL:
+            return Literal(None), offset
+        if tag == TAG_INT:
+            value, offset = _read_int(buf, offset)
+            return Literal(value), offset
+        if tag == TAG_FLOAT:
+            return Literal(_float.unpack_from(buf, offset)[0]), offset + _float.size
+        if tag == TAG_STRING:
+            value, offset = _read_uint(buf, offset)
+            return Literal(self.strings[value]), offset
+        if tag == TAG_ENUM:
+            value, offset = _read_uint(buf, offset)
+            return NamedConstant(self.strings[value]), offset
+        if tag == TAG_BYTES:
+            blob, offset = _read_uint(buf, offset)
+            start = self.blobs_offset + self.blob_index[2*blob]
+            return Blob(buf[start:start + self.blob_index[2*blob + 1]]), offset
+        if tag == TAG_ARRAY:
+            count, offset = _read_uint(buf, offset)
+            elems = []
+            for i in range(count):
+                elem, offset = self._read_value(offset, state, 'elem')
+                elems.append(elem)
+            return Array(elems), offset
+        if tag == TAG_STRUCT:
+            name, offset = _read_uint(buf, offset)
+            count, offset = _read_uint(buf, offset)
+            members = []
+            for i in range(count):
+                mname, offset = _read_uint(buf, offset)
+                mname = self.strings[mname]
+                value, offset = self._read_value(offset, state, mname)
+                members.append((mname, value))
+            return Struct(self.strings[name], members), offset
+        if tag == TAG_PTR:
+            address, offset = _read_uint(buf, offset)
+            return Pointer(state, self.strings[address], pname), offset
+        raise ValueError(f'{self.filename}: corrupt value tag {tag} at offset {offset - 1}')
+
+
+def is_trace_index(filename):
+    try:
+        with open(filename, 'rb') as fp:
+            return fp.read(len(MAGIC)) == MAGIC
+    except OSError:
+        return False
+
+
+def main():
+    import parse
+
+    optparser = argparse.ArgumentParser(
+        description="Convert a Gallium trace into an indexed binary trace")
+
+    optparser.add_argument("filename",
+        type=str, metavar="filename", help="Gallium trace filename (plain or .gz, .bz2)")
+
+    optparser.add_argument("-o", "--output",
+        type=str, required=True, metavar="filename",
+        dest="output", help="indexed trace output filename")
+
+    args = optparser.parse_args()
+    options = parse.ParseOptions(args)
+
+    try:
+        stream = parse.open_trace(args.filename)
+    except Exception as e:
+        print("ERROR: {}".format(str(e)))
+        sys.exit(1)
+
+    with open(args.output, 'wb') as fp:
+        writer = TraceIndexWriter(fp)
+        parser = parse.TraceParser(stream, options, TraceStateData())
+        for call in parser.parse_calls():
+            writer.write_call(call)
+        writer.close()
+
+
+if __name__ == '__main__':
+    main()
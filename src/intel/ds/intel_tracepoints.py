@@ -149,20 +149,23 @@ def define_tracepoints(args):
 
 def generate_code(args):
     from u_trace import utrace_generate
+    from u_trace import utrace_generate_decoder
     from u_trace import utrace_generate_perfetto_utils
 
     utrace_generate(cpath=args.utrace_src, hpath=args.utrace_hdr,
                     ctx_param='struct intel_ds_device *dev',
                     need_cs_param=False)
     utrace_generate_perfetto_utils(hpath=args.perfetto_hdr)
+    utrace_generate_decoder(pypath=args.decoder)
 
 
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument('-p', '--import-path', required=True)
-    parser.add_argument('--utrace-src', required=True)
-    parser.add_argument('--utrace-hdr', required=True)
-    parser.add_argument('--perfetto-hdr', required=True)
+    parser.add_argument('--utrace-src')
+    parser.add_argument('--utrace-hdr')
+    parser.add_argument('--perfetto-hdr')
+    parser.add_argument('--decoder')
     args = parser.parse_args()
     sys.path.insert(0, args.import_path)
     define_tracepoints(args)
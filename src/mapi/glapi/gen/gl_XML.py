@@ -27,17 +27,122 @@
 from collections import OrderedDict
 from decimal import Decimal
 import xml.etree.ElementTree as ET
+import gc, pickle
 import re, sys
 import os.path
 import typeexpr
 import static_data
 
 
+# A GL API snapshot file starts with API_SNAPSHOT_MAGIC, followed by a
+# pickled dict with these keys:
+#
+#   version: API_SNAPSHOT_VERSION, to be bumped on any layout change
+#   xml:     the absolute path of the XML file the snapshot was made from
+#   apis:    for each factory_key(), a dict with the pickled gl_api created
+#            by that factory under "api", and the mtime and size of every
+#            file it depends on under "files"
+#
+# parse_GL_API can be given a snapshot instead of an XML file.  The snapshot
+# is only used when it has the API of the factory and none of the files has
+# changed since, otherwise the XML file is parsed.
+API_SNAPSHOT_MAGIC = b'MESA_GL_API_SNAPSHOT\n'
+API_SNAPSHOT_VERSION = 2
+
+
+def factory_key(factory):
+    cls = type(factory)
+    return '%s.%s' % (cls.__module__, cls.__name__)
+
+
+def file_stamp(file_name):
+    st = os.stat(file_name)
+    return (st.st_mtime_ns, st.st_size)
+
+
+def api_source_files(api, factory):
+    """Return the files the gl_api parsed by factory depends on: the XML
+    files, and the modules of the classes which created it."""
+    files = list(api.xml_files)
+    for module in ['gl_XML', 'typeexpr', 'static_data'] + \
+                  [cls.__module__ for cls in type(factory).__mro__]:
+        file_name = getattr(sys.modules.get(module), '__file__', None)
+        if file_name:
+            files.append(os.path.abspath(file_name))
+    return files
+
+
+def read_api_snapshot(file_name):
+    """Return the contents of the snapshot file_name, or None if it is not
+    a GL API snapshot."""
+    with open(file_name, 'rb') as f:
+        if f.read(len(API_SNAPSHOT_MAGIC)) != API_SNAPSHOT_MAGIC:
+            return None
+        return pickle.load(f)
+
+
+def write_api_snapshot(file_name, xml_file_name, factories):
+    """Parse xml_file_name with each of the factories and save the results
+    to the snapshot file_name."""
+    apis = {}
+    for factory in factories:
+        api = parse_GL_API(xml_file_name, factory)
+        apis[factory_key(factory)] = {
+            'api': pickle.dumps(api, pickle.HIGHEST_PROTOCOL),
+            'files': dict((f, file_stamp(f)) for f in api_source_files(api, factory)),
+        }
+
+    snapshot = {
+        'version': API_SNAPSHOT_VERSION,
+        'xml': os.path.abspath(xml_file_name),
+        'apis': apis,
+    }
+    with open(file_name, 'wb') as f:
+        f.write(API_SNAPSHOT_MAGIC)
+        pickle.dump(snapshot, f, pickle.HIGHEST_PROTOCOL)
+
+
+def load_api_snapshot(snapshot, factory):
+    """Return the gl_api of factory saved in snapshot, or None if it is
+    missing or out of date."""
+    if snapshot['version'] != API_SNAPSHOT_VERSION:
+        return None
+
+    entry = snapshot['apis'].get(factory_key(factory))
+    if entry is None:
+        return None
+    for f, stamp in entry['files'].items():
+        try:
+            if file_stamp(f) != stamp:
+                return None
+        except OSError:
+            return None
+
+    # The collector only slows down creating the many objects of the API,
+    # none of which are garbage.
+    gc.disable()
+    try:
+        api = pickle.loads(entry['api'])
+    finally:
+        gc.enable()
+
+    # gl_api.__init__ isn't called by pickle.
+    typeexpr.create_initial_types()
+    return api
+
+
 def parse_GL_API( file_name, factory = None ):
 
     if not factory:
         factory = gl_item_factory()
 
+    snapshot = read_api_snapshot( file_name )
+    if snapshot is not None:
+        api = load_api_snapshot( snapshot, factory )
+        if api is not None:
+            return api
+        file_name = snapshot['xml']
+
     api = factory.create_api()
     api.parse_file( file_name )
 
@@ -51,6 +156,7 @@ def parse_GL_API( file_name, factory = None ):
             func.offset = api.next_offset;
             api.next_offset += 1
 
+    api.invalidate_indexes()
     return api
 
 
@@ -865,10 +971,30 @@ class gl_api(object):
 
         self.next_offset = 0
 
+        # Every XML file parsed, for the GL API snapshots
+        self.xml_files = []
+
+        self.invalidate_indexes()
+
         typeexpr.create_initial_types()
         return
 
+
+    def invalidate_indexes(self):
+        """Drop the indexes used by the iterators.
+
+        The indexes are built the first time they are needed, and have to
+        be invalidated whenever functions, enums or categories are added,
+        or the offset of a function is changed.
+        """
+        self.functions_by_category = None
+        self.functions_by_offset = None
+        self.enums_sorted = None
+        self.categories_sorted = None
+        return
+
     def parse_file(self, file_name):
+        self.xml_files.append(os.path.abspath(file_name))
         doc = ET.parse( file_name )
         self.process_element(file_name, doc)
 
@@ -926,6 +1052,7 @@ class gl_api(object):
                 t = self.factory.create_type( child, self, cat_name )
                 self.types_by_name[ "GL" + t.name ] = t
 
+        self.invalidate_indexes()
         return
 
 
@@ -937,12 +1064,11 @@ class gl_api(object):
         Within a category, functions are sorted by name.  If cat is
         not None, then only functions in that category are iterated.
         """
-        lists = [{}, {}, {}, {}]
+        if self.functions_by_category is None:
+            lists = [{}, {}, {}, {}]
 
-        for func in self.functionIterateAll():
-            [cat_name, cat_number] = self.category_dict[func.name]
-
-            if (cat == None) or (cat == cat_name):
+            for func in self.functionIterateAll():
+                [cat_name, cat_number] = self.category_dict[func.name]
                 [func_cat_type, key] = classify_category(cat_name, cat_number)
 
                 if key not in lists[func_cat_type]:
@@ -951,38 +1077,42 @@ class gl_api(object):
                 lists[func_cat_type][key][func.name] = func
 
 
-        functions = []
-        for func_cat_type in range(0,4):
-            keys = sorted(lists[func_cat_type].keys())
+            # All functions under None, and the functions of each
+            # category under its name, in the same order.
+            self.functions_by_category = {None: []}
+            for func_cat_type in range(0,4):
+                keys = sorted(lists[func_cat_type].keys())
+
+                for key in keys:
+                    names = sorted(lists[func_cat_type][key].keys())
 
-            for key in keys:
-                names = sorted(lists[func_cat_type][key].keys())
+                    for name in names:
+                        func = lists[func_cat_type][key][name]
+                        [cat_name, cat_number] = self.category_dict[func.name]
 
-                for name in names:
-                    functions.append(lists[func_cat_type][key][name])
+                        self.functions_by_category[None].append(func)
+                        self.functions_by_category.setdefault(cat_name, []).append(func)
 
-        return iter(functions)
+        return iter(self.functions_by_category.get(cat, []))
 
 
     def functionIterateByOffset(self):
-        max_offset = -1
-        for func in self.functions_by_name.values():
-            if func.offset > max_offset:
-                max_offset = func.offset
+        if self.functions_by_offset is None:
+            max_offset = -1
+            for func in self.functions_by_name.values():
+                if func.offset > max_offset:
+                    max_offset = func.offset
 
 
-        temp = [None for i in range(0, max_offset + 1)]
-        for func in self.functions_by_name.values():
-            if func.offset != -1:
-                temp[ func.offset ] = func
+            temp = [None for i in range(0, max_offset + 1)]
+            for func in self.functions_by_name.values():
+                if func.offset != -1:
+                    temp[ func.offset ] = func
 
 
-        list = []
-        for i in range(0, max_offset + 1):
-            if temp[i]:
-                list.append(temp[i])
+            self.functions_by_offset = [func for func in temp if func]
 
-        return iter(list);
+        return iter(self.functions_by_offset)
 
 
     def functionIterateAll(self):
@@ -990,13 +1120,11 @@ class gl_api(object):
 
 
     def enumIterateByName(self):
-        keys = sorted(self.enums_by_name.keys())
-
-        list = []
-        for enum in keys:
-            list.append( self.enums_by_name[ enum ] )
+        if self.enums_sorted is None:
+            keys = sorted(self.enums_by_name.keys())
+            self.enums_sorted = [self.enums_by_name[enum] for enum in keys]
 
-        return iter(list)
+        return iter(self.enums_sorted)
 
 
     def categoryIterate(self):
@@ -1007,14 +1135,15 @@ class gl_api(object):
         name and number (which may be None) of the category.
         """
 
-        list = []
-        for cat_type in range(0,4):
-            keys = sorted(self.categories[cat_type].keys())
+        if self.categories_sorted is None:
+            self.categories_sorted = []
+            for cat_type in range(0,4):
+                keys = sorted(self.categories[cat_type].keys())
 
-            for key in keys:
-                list.append(self.categories[cat_type][key])
+                for key in keys:
+                    self.categories_sorted.append(self.categories[cat_type][key])
 
-        return iter(list)
+        return iter(self.categories_sorted)
 
 
     def get_category_for_name( self, name ):
@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+# SPDX-License-Identifier: MIT
+
+"""Save the parsed GL API of an XML file to a snapshot.
+
+The generators in this directory all parse the same XML files, which takes a
+lot longer than loading the resulting objects back.  Giving them a snapshot
+instead of the XML file lets the build parse each XML file once.  See
+parse_GL_API in gl_XML.py.
+"""
+
+import argparse
+
+import gl_XML
+import glX_XML
+import glX_proto_common
+import marshal_XML
+
+
+# The factories the generators parse the API with
+FACTORIES = [
+    gl_XML.gl_item_factory,
+    glX_XML.glx_item_factory,
+    glX_proto_common.glx_proto_item_factory,
+    marshal_XML.marshal_item_factory,
+]
+
+
+def _parser():
+    """Parse arguments and return a namespace."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-f', '--filename',
+                        default='gl_API.xml',
+                        metavar="input_file_name",
+                        dest='file_name',
+                        help="Path to an XML description of OpenGL API.")
+    parser.add_argument('-o', '--output',
+                        required=True,
+                        help="Path of the snapshot to write.")
+    return parser.parse_args()
+
+
+def main():
+    """Main function."""
+    args = _parser()
+    gl_XML.write_api_snapshot(args.output, args.file_name,
+                              [factory() for factory in FACTORIES])
+
+
+if __name__ == '__main__':
+    main()
@@ -25,6 +25,7 @@ import getopt
 import gl_XML
 import license
 import marshal_XML
+import re
 import sys
 import collections
 import apiexec
@@ -47,6 +48,15 @@ UNUSED static inline int safe_mul(int a, int b)
 """
 
 
+# Enums which don't fit in 16 bits and aren't bitmasks, with the functions
+# accepting them.  In compact mode, the GLenum parameters of these functions
+# aren't narrowed to 16 bits.
+WIDE_ENUMS = {
+    'INVALID_INDEX': [], # only returned by queries
+    'RASTER_POSITION_UNCLIPPED_IBM': ['Enable', 'Disable'],
+}
+
+
 file_index = 0
 file_count = 1
 current_indent = 0
@@ -67,20 +77,57 @@ def indent(delta = 3):
     current_indent -= delta
 
 
+def check_wide_enums(api):
+    """Check that WIDE_ENUMS lists every enum a GLenum16 can't hold.
+
+    The value 0xffff is included, since compact mode clamps the enums to it.
+    """
+    for enum in api.enumIterateByName():
+        if (enum.value >= 0xffff and not re.search('_BITS?(_|$)', enum.name) and
+            enum.name not in WIDE_ENUMS):
+            raise RuntimeError('Enum "%s" doesn\'t fit in 16 bits, '
+                               'add it to WIDE_ENUMS in gl_marshal.py.' % enum.name)
+
+
 class PrintCode(gl_XML.gl_print_base):
-    def __init__(self):
+    def __init__(self, compact = False, stats = False):
         super(PrintCode, self).__init__()
 
         self.name = 'gl_marshal.py'
         self.license = license.bsd_license_template % (
             'Copyright (C) 2012 Intel Corporation', 'INTEL CORPORATION')
 
+        # Whether to narrow the fields of the marshal_cmd_* structs to the
+        # range of their values, see get_field_type.
+        self.compact = compact
+        self.wide_enum_functions = set()
+        for functions in WIDE_ENUMS.values():
+            self.wide_enum_functions.update(functions)
+
+        # Whether to count the synchronous executions of every command in
+        # ctx->GLThread.cmd_stats, and generate the functions reporting them.
+        # The commands written to batches are counted by
+        # _mesa_glthread_allocate_command.
+        self.stats = stats
+
     def printRealHeader(self):
         print(header)
 
     def printRealFooter(self):
         pass
 
+    def get_cmd_id(self, func):
+        if func.marshal_flavor() == 'sync':
+            return 'SYNC_CMD_{0}'.format(func.name)
+        return 'DISPATCH_CMD_{0}'.format(func.name)
+
+    def print_finish_before(self, func):
+        if self.stats:
+            cmd_id = self.get_cmd_id(func)
+            out('ctx->GLThread.cmd_stats[{0}].count++;'.format(cmd_id))
+            out('ctx->GLThread.cmd_stats[{0}].syncs++;'.format(cmd_id))
+        out('_mesa_glthread_finish_before(ctx, "{0}");'.format(func.name))
+
     def print_sync_call(self, func, unmarshal = 0):
         call = 'CALL_{0}(ctx->CurrentServerDispatch, ({1}))'.format(
             func.name, func.get_called_parameter_string())
@@ -101,7 +148,7 @@ class PrintCode(gl_XML.gl_print_base):
             out('GET_CURRENT_CONTEXT(ctx);')
             if func.marshal_call_before:
                 out(func.marshal_call_before);
-            out('_mesa_glthread_finish_before(ctx, "{0}");'.format(func.name))
+            self.print_finish_before(func)
             self.print_sync_call(func)
         out('}')
         out('')
@@ -123,10 +170,14 @@ class PrintCode(gl_XML.gl_print_base):
             fixed_params = func.fixed_params
             variable_params = func.variable_params
 
+        field_types = dict((p.name, type) for p, type, _ in
+                           self.get_fields(func, self.compact))
         for p in fixed_params:
             if p.count:
                 out('memcpy(cmd->{0}, {0}, {1});'.format(
                         p.name, p.size_string()))
+            elif field_types[p.name] == 'GLenum16':
+                out('cmd->{0} = MIN2({0}, 0xffff); /* clamped to 0xffff (invalid enum) */'.format(p.name))
             else:
                 out('cmd->{0} = {0};'.format(p.name))
         if variable_params:
@@ -168,6 +219,9 @@ class PrintCode(gl_XML.gl_print_base):
             'GLushort': 2,
             'GLhalfNV': 2,
             'GLenum': 4,
+            'GLenum16': 2,
+            'uint16_t': 2,
+            'bool': 1,
             'GLint': 4,
             'GLuint': 4,
             'GLbitfield': 4,
@@ -193,12 +247,106 @@ class PrintCode(gl_XML.gl_print_base):
             print('Unhandled type in gl_marshal.py.get_type_size: ' + str, file=sys.stderr)
         return val
 
-    def print_async_struct(self, func):
+    def get_bounded_counters(self, func):
+        """Return the names of the parameters counting the elements of a
+        variable-length parameter.
+
+        Their values are at most MARSHAL_MAX_CMD_SIZE, because larger
+        commands are executed synchronously, see validate_count_or_fallback.
+        """
+        counters = set()
+        if not func.marshal_sync:
+            for p in func.variable_params:
+                if p.counter and not p.marshal_count and not p.count_parameter_list:
+                    counters.add(p.counter)
+        return counters
+
+    def get_field_type(self, func, p, compact):
+        """Return the type and the bit width, or 0, of the field storing the
+        fixed parameter p in the marshal_cmd_* struct of func.
+
+        In compact mode, enums are stored in 16 bits, booleans in 1 bit and
+        the counts of variable-length parameters in 16 bits.  Enums that
+        don't fit are clamped to 0xffff, which isn't a valid enum either,
+        and booleans other than GL_FALSE become GL_TRUE.  The unmarshal
+        function widens the fields back to the parameter types.
+        """
+        if p.count:
+            return p.get_base_type_string(), 0
+
+        type = p.type_string()
+        if compact:
+            if type == 'GLenum' and func.name not in self.wide_enum_functions:
+                return 'GLenum16', 0
+            if type == 'GLboolean':
+                return 'bool', 1
+            if p.name in self.get_bounded_counters(func):
+                return 'uint16_t', 0
+        return type, 0
+
+    def get_struct_size(self, fields):
+        """Return the size of a marshal_cmd_* struct with fields, as laid out
+        on 64-bit platforms."""
+        offset = 4 # struct marshal_cmd_base
+        align = 2
+        bits = 0 # used in the last byte of a bitfield
+        for p, type, width in fields:
+            if width:
+                if bits == 0 or bits + width > 8:
+                    offset += 1
+                    bits = 0
+                bits += width
+                continue
+
+            bits = 0
+            size = self.get_type_size(type)
+            offset = (offset + size - 1) // size * size + size * (p.count or 1)
+            align = max(align, size)
+        return (offset + align - 1) // align * align
+
+    def get_variable_data_alignment(self, func):
+        """Return the alignment the variable-length parameters of func need."""
+        align = 1
+        if not func.marshal_sync:
+            for p in func.variable_params:
+                type = p.get_base_type_string()
+                if type not in ('GLvoid', 'GLchar'):
+                    align = max(align, min(self.get_type_size(type), 8))
+        return align
+
+    def get_fields(self, func, compact):
+        """Return the fixed parameters of func with the type and bit width of
+        the fields storing them, in the order of the marshal_cmd_* struct."""
         if func.marshal_sync:
             fixed_params = func.fixed_params + func.variable_params
-            variable_params = []
         else:
             fixed_params = func.fixed_params
+
+        fields = [(p,) + self.get_field_type(func, p, compact) for p in fixed_params]
+
+        # Sort the parameters according to their size to pack the structure optimally
+        def field_size(field):
+            p, type, width = field
+            if width:
+                return 0
+            return self.get_type_size(p.type_string() if p.count else type)
+        fields.sort(key=field_size)
+
+        # The variable-length parameters follow the struct, so don't let
+        # compact mode misalign them more than the full-width struct does.
+        if compact:
+            align = self.get_variable_data_alignment(func)
+            size = self.get_struct_size(fields)
+            wide_size = self.get_struct_size(self.get_fields(func, False))
+            if size & -size < min(wide_size & -wide_size, align):
+                return self.get_fields(func, False)
+
+        return fields
+
+    def print_async_struct(self, func):
+        if func.marshal_sync:
+            variable_params = []
+        else:
             variable_params = func.variable_params
 
         out('struct marshal_cmd_{0}'.format(func.name))
@@ -206,13 +354,13 @@ class PrintCode(gl_XML.gl_print_base):
         with indent():
             out('struct marshal_cmd_base cmd_base;')
 
-            # Sort the parameters according to their size to pack the structure optimally
-            for p in sorted(fixed_params, key=lambda p: self.get_type_size(p.type_string())):
+            for p, type, width in self.get_fields(func, self.compact):
                 if p.count:
-                    out('{0} {1}[{2}];'.format(
-                            p.get_base_type_string(), p.name, p.count))
+                    out('{0} {1}[{2}];'.format(type, p.name, p.count))
+                elif width:
+                    out('{0} {1}:{2};'.format(type, p.name, width))
                 else:
-                    out('{0} {1};'.format(p.type_string(), p.name))
+                    out('{0} {1};'.format(type, p.name))
 
             for p in variable_params:
                 if p.img_null_flag:
@@ -309,7 +457,7 @@ class PrintCode(gl_XML.gl_print_base):
 
         out('if (unlikely({0})) {{'.format(' || '.join(list)))
         with indent():
-            out('_mesa_glthread_finish_before(ctx, "{0}");'.format(func.name))
+            self.print_finish_before(func)
             self.print_sync_call(func)
             out('return;')
         out('}')
@@ -342,7 +490,7 @@ class PrintCode(gl_XML.gl_print_base):
             if func.marshal_sync:
                 out('if ({0}) {{'.format(func.marshal_sync))
                 with indent():
-                    out('_mesa_glthread_finish_before(ctx, "{0}");'.format(func.name))
+                    self.print_finish_before(func)
                     self.print_sync_call(func)
                     out('return;')
                 out('}')
@@ -422,10 +570,67 @@ class PrintCode(gl_XML.gl_print_base):
         out('   return true;')
         out('}')
 
+    def print_size_report(self, api):
+        """Print the size of the marshal_cmd_* struct of every asynchronous
+        command, and the space taken by it in a batch, before and after
+        narrowing its fields."""
+        print('%-40s %14s %14s' % ('', 'struct size', 'batch size'))
+        print('%-40s %6s %7s %6s %7s' % ('command', 'full', 'compact', 'full', 'compact'))
+
+        totals = [0, 0, 0, 0]
+        num_commands = 0
+        num_smaller = 0
+        for func in api.functionIterateAll():
+            if func.marshal_flavor() != 'async':
+                continue
+
+            sizes = [self.get_struct_size(self.get_fields(func, False)),
+                     self.get_struct_size(self.get_fields(func, True))]
+            sizes += [(size + 7) // 8 * 8 for size in sizes]
+            print('%-40s %6d %7d %6d %7d' % ((func.name,) + tuple(sizes)))
+
+            totals = [total + size for total, size in zip(totals, sizes)]
+            num_commands += 1
+            if sizes[3] < sizes[2]:
+                num_smaller += 1
+
+        print('%-40s %6d %7d %6d %7d' % (('total',) + tuple(totals)))
+        print('%d of %d commands take less space in a batch in compact mode.' %
+              (num_smaller, num_commands))
+
+    def print_cmd_stats(self, api):
+        out('const char *const _mesa_marshal_cmd_names[NUM_MARSHAL_CMD] = {')
+        with indent():
+            for func in api.functionIterateAll():
+                if func.marshal_flavor() == 'skip':
+                    continue
+                out('[{0}] = "{1}",'.format(self.get_cmd_id(func), func.name))
+        out('};')
+        out('')
+        out('void')
+        out('_mesa_marshal_dump_cmd_stats(const struct glthread_cmd_stats *stats, FILE *f)')
+        out('{')
+        with indent():
+            out('fprintf(f, "# glthread command statistics: command count bytes syncs\\n");')
+            out('for (unsigned i = 0; i < NUM_MARSHAL_CMD; i++) {')
+            with indent():
+                out('if (stats[i].count) {')
+                with indent():
+                    out('fprintf(f, "%s %" PRIu64 " %" PRIu64 " %" PRIu64 "\\n",')
+                    out('        _mesa_marshal_cmd_names[i], stats[i].count,')
+                    out('        stats[i].bytes, stats[i].syncs);')
+                out('}')
+            out('}')
+        out('}')
+        out('')
+        out('')
+
     def printBody(self, api):
         # The first file only contains the dispatch tables
         if file_index == 0:
             self.print_unmarshal_dispatch_cmd(api)
+            if self.stats:
+                self.print_cmd_stats(api)
             self.print_create_marshal_table(api)
             return
 
@@ -447,15 +652,21 @@ class PrintCode(gl_XML.gl_print_base):
 
 
 def show_usage():
-    print('Usage: %s [-f input_file_name]' % sys.argv[0])
+    print('Usage: %s [-f input_file_name] [-i file_index] [-n file_count] [-c] [-r] [-s]' % sys.argv[0])
+    print('    -c  Narrow the fields of the commands to the range of their values.')
+    print('    -r  Print the size of the commands with and without -c.')
+    print('    -s  Count how many times every command is executed synchronously.')
     sys.exit(1)
 
 
 if __name__ == '__main__':
     file_name = 'gl_API.xml'
+    compact = False
+    report = False
+    stats = False
 
     try:
-        (args, trail) = getopt.getopt(sys.argv[1:], 'm:f:i:n:')
+        (args, trail) = getopt.getopt(sys.argv[1:], 'm:f:i:n:crs')
     except Exception:
         show_usage()
 
@@ -466,9 +677,21 @@ if __name__ == '__main__':
             file_index = int(val)
         elif arg == '-n':
             file_count = int(val)
+        elif arg == '-c':
+            compact = True
+        elif arg == '-r':
+            report = True
+        elif arg == '-s':
+            stats = True
 
     assert file_index < file_count
-    printer = PrintCode()
+    printer = PrintCode(compact, stats)
 
     api = gl_XML.parse_GL_API(file_name, marshal_XML.marshal_item_factory())
-    printer.Print(api)
+    if compact or report:
+        check_wide_enums(api)
+
+    if report:
+        printer.print_size_report(api)
+    else:
+        printer.Print(api)
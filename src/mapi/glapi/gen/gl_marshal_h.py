@@ -38,13 +38,16 @@ footer = """
 
 
 class PrintCode(gl_XML.gl_print_base):
-    def __init__(self):
+    def __init__(self, stats = False):
         super(PrintCode, self).__init__()
 
         self.name = 'gl_marshal_h.py'
         self.license = license.bsd_license_template % (
             'Copyright (C) 2012 Intel Corporation', 'INTEL CORPORATION')
 
+        # Whether to declare the ids of the per-command statistics
+        self.stats = stats
+
     def printRealHeader(self):
         print(header)
 
@@ -65,6 +68,24 @@ class PrintCode(gl_XML.gl_print_base):
         print('};')
         print('')
 
+        if self.stats:
+            # The synchronous commands only have ids for the statistics,
+            # numbered after the asynchronous ones.
+            print('enum marshal_sync_cmd_id')
+            print('{')
+            first = True
+            for func in api.functionIterateAll():
+                if func.marshal_flavor() != 'sync':
+                    continue
+                if first:
+                    print('   SYNC_CMD_{0} = NUM_DISPATCH_CMD,'.format(func.name))
+                    first = False
+                else:
+                    print('   SYNC_CMD_{0},'.format(func.name))
+            print('   NUM_MARSHAL_CMD,')
+            print('};')
+            print('')
+
         for func in api.functionIterateAll():
             flavor = func.marshal_flavor()
             if flavor in ('custom', 'async'):
@@ -77,23 +98,27 @@ class PrintCode(gl_XML.gl_print_base):
 
 
 def show_usage():
-    print('Usage: %s [-f input_file_name]' % sys.argv[0])
+    print('Usage: %s [-f input_file_name] [-s]' % sys.argv[0])
+    print('    -s  Declare the ids of the per-command statistics.')
     sys.exit(1)
 
 
 if __name__ == '__main__':
     file_name = 'gl_API.xml'
+    stats = False
 
     try:
-        (args, trail) = getopt.getopt(sys.argv[1:], 'm:f:')
+        (args, trail) = getopt.getopt(sys.argv[1:], 'm:f:s')
     except Exception:
         show_usage()
 
     for (arg,val) in args:
         if arg == '-f':
             file_name = val
+        elif arg == '-s':
+            stats = True
 
-    printer = PrintCode()
+    printer = PrintCode(stats)
 
     api = gl_XML.parse_GL_API(file_name, marshal_XML.marshal_item_factory())
     printer.Print(api)
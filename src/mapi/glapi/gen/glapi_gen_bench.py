@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+# SPDX-License-Identifier: MIT
+
+"""Measure how long each of the glapi generators takes to run.
+
+Runs every generator the build runs in this directory, with the same
+arguments, and reports the best wall time of a few runs.  With --snapshot, the
+generators are given GL API snapshots like in the build, and the time taken to
+write the snapshots is reported too.  With -b, the generators of another git
+revision are measured as well, and their output compared, e.g.
+
+  ./glapi_gen_bench.py -b HEAD~1
+"""
+
+import argparse
+import io
+import os
+import subprocess
+import sys
+import tarfile
+import tempfile
+import time
+
+GEN_DIR = os.path.dirname(os.path.abspath(__file__))
+REGISTRY_XML = os.path.join(GEN_DIR, '..', 'registry', 'gl.xml')
+
+# The generators as run by meson.build, with @ES@ and @GL@ standing for
+# gl_and_es_API.xml and gl_API.xml, or the snapshots of those.
+GENERATORS = [
+    ['gl_procs.py', '-c', '-f', '@ES@'],
+    ['gl_apitemp.py', '-f', '@ES@'],
+    ['gl_table.py', '-f', '@ES@'],
+    ['gl_table.py', '-f', '@ES@', '-m', 'remap_table'],
+    ['gl_gentable.py', '-f', '@ES@'],
+    ['gl_enums.py', '-f', REGISTRY_XML],
+    ['api_exec_init.py', '-f', '@ES@'],
+    ['api_exec_decl_h.py', '-f', '@ES@'],
+    ['api_save_init_h.py', '-f', '@ES@'],
+    ['api_save_h.py', '-f', '@ES@'],
+    ['api_vtxfmt_init_h.py', '-f', '@ES@'],
+    ['api_hw_select_init_h.py', '-f', '@GL@'],
+    ['gl_marshal.py', '-f', '@ES@', '-i', '0', '-n', '8'],
+    ['gl_marshal_h.py', '-f', '@ES@'],
+    ['remap_helper.py', '-f', '@ES@'],
+    ['glX_proto_send.py', '-f', '@GL@', '-m', 'proto'],
+    ['glX_proto_send.py', '-f', '@GL@', '-m', 'init_h'],
+    ['glX_proto_send.py', '-f', '@GL@', '-m', 'init_c'],
+    ['glX_proto_size.py', '-f', '@GL@', '--only-set', '-m', 'size_h',
+     '--header-tag', '_INDIRECT_SIZE_H_'],
+    ['glX_proto_size.py', '-f', '@GL@', '--only-set', '-m', 'size_c'],
+    ['gl_x86_asm.py', '-f', '@ES@'],
+    ['gl_x86-64_asm.py', '-f', '@ES@'],
+    ['gl_SPARC_asm.py', '-f', '@ES@'],
+]
+
+
+def run(directory, command, repeat):
+    """Return the best wall time of running command in directory, and its
+    output."""
+    env = dict(os.environ, PYTHONDONTWRITEBYTECODE='1')
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = subprocess.run([sys.executable] + command, cwd=directory, env=env,
+                                stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        elapsed = time.perf_counter() - start
+        if result.returncode != 0:
+            sys.exit('%s failed in %s:\n%s' % (' '.join(command), directory,
+                                               result.stderr.decode()))
+        if best is None or elapsed < best:
+            best = elapsed
+    return best, result.stdout
+
+
+def checkout(rev, directory):
+    """Extract this directory at git revision rev into directory."""
+    top, prefix = subprocess.check_output(
+        ['git', 'rev-parse', '--show-toplevel', '--show-prefix'],
+        cwd=GEN_DIR).decode().splitlines()
+    archive = subprocess.check_output(['git', 'archive', rev + ':' + prefix],
+                                      cwd=top)
+    with tarfile.open(fileobj=io.BytesIO(archive)) as tar:
+        tar.extractall(directory)
+
+
+def measure(directory, snapshot_dir, repeat):
+    """Return the time and output of every generator run in directory.
+
+    If snapshot_dir is not None, the snapshots are written there and given
+    to the generators instead of the XML files.
+    """
+    results = {}
+    inputs = {'@ES@': 'gl_and_es_API.xml', '@GL@': 'gl_API.xml'}
+    if snapshot_dir is not None:
+        if not os.path.exists(os.path.join(directory, 'gl_api_snapshot.py')):
+            sys.exit('%s has no gl_api_snapshot.py' % directory)
+        os.makedirs(snapshot_dir)
+        for key, xml in list(inputs.items()):
+            snapshot = os.path.join(snapshot_dir,
+                                    os.path.splitext(xml)[0] + '.pickle')
+            results['gl_api_snapshot.py -f ' + xml] = run(
+                directory, ['gl_api_snapshot.py', '-f', xml, '-o', snapshot], 1)
+            inputs[key] = snapshot
+
+    for generator in GENERATORS:
+        command = [inputs.get(arg, arg) for arg in generator]
+        name = ' '.join(generator).replace('@ES@', 'gl_and_es_API.xml') \
+                                  .replace('@GL@', 'gl_API.xml') \
+                                  .replace(REGISTRY_XML, 'gl.xml')
+        results[name] = run(directory, command, repeat)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-r', '--repeat', type=int, default=3,
+                        help='number of runs of each generator (default: %(default)s)')
+    parser.add_argument('-s', '--snapshot', action='store_true',
+                        help='give the generators GL API snapshots')
+    parser.add_argument('-b', '--baseline', metavar='REV',
+                        help='also measure the generators at git revision REV')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix='glapi_gen_bench') as tmp:
+        implementations = [('current', GEN_DIR)]
+        if args.baseline:
+            path = os.path.join(tmp, 'baseline')
+            checkout(args.baseline, path)
+            implementations.append((args.baseline, path))
+
+        results = []
+        for i, (_, path) in enumerate(implementations):
+            snapshot_dir = os.path.join(tmp, 'snapshots%d' % i) if args.snapshot else None
+            results.append(measure(path, snapshot_dir, args.repeat))
+
+    width = max(len(name) for name in results[0])
+    print('%-*s' % (width, 'generator') +
+          ''.join(' %12s' % name[:12] for name, _ in implementations))
+    differ = False
+    for name, (elapsed, output) in results[0].items():
+        row = '%-*s %12.3f' % (width, name, elapsed)
+        for other in results[1:]:
+            if name not in other:
+                row += ' %12s' % '-'
+                continue
+            row += ' %12.3f' % other[name][0]
+            if other[name][1] != output and not name.startswith('gl_api_snapshot.py'):
+                row += ' (output differs)'
+                differ = True
+        print(row)
+    print('%-*s' % (width, 'total') +
+          ''.join(' %12.3f' % sum(elapsed for elapsed, _ in r.values())
+                  for r in results))
+    return 1 if differ else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -110,7 +110,20 @@ _mesa_glthread_init(struct gl_context *ctx)
    _mesa_glthread_reset_vao(&glthread->DefaultVAO);
    glthread->CurrentVAO = &glthread->DefaultVAO;
 
+#ifdef HAVE_GLTHREAD_STATS
+   glthread->cmd_stats = calloc(NUM_MARSHAL_CMD, sizeof(*glthread->cmd_stats));
+   if (!glthread->cmd_stats) {
+      _mesa_DeleteHashTable(glthread->VAOs);
+      util_queue_destroy(&glthread->queue);
+      return;
+   }
+#endif
+
    if (!_mesa_create_marshal_tables(ctx)) {
+#ifdef HAVE_GLTHREAD_STATS
+      free(glthread->cmd_stats);
+      glthread->cmd_stats = NULL;
+#endif
       _mesa_DeleteHashTable(glthread->VAOs);
       util_queue_destroy(&glthread->queue);
       return;
@@ -156,6 +169,26 @@ free_vao(void *data, UNUSED void *userData)
    free(data);
 }
 
+#ifdef HAVE_GLTHREAD_STATS
+/* Append the command statistics to the file named by MESA_GLTHREAD_STATS,
+ * or print them to stderr. bin/glthread_stats.py makes reports out of them.
+ */
+static void
+glthread_dump_cmd_stats(struct gl_context *ctx)
+{
+   const char *path = getenv("MESA_GLTHREAD_STATS");
+   FILE *f = path ? fopen(path, "a") : stderr;
+
+   if (!f)
+      return;
+
+   _mesa_marshal_dump_cmd_stats(ctx->GLThread.cmd_stats, f);
+
+   if (f != stderr)
+      fclose(f);
+}
+#endif
+
 void
 _mesa_glthread_destroy(struct gl_context *ctx, const char *reason)
 {
@@ -170,6 +203,12 @@ _mesa_glthread_destroy(struct gl_context *ctx, const char *reason)
    _mesa_glthread_finish(ctx);
    util_queue_destroy(&glthread->queue);
 
+#ifdef HAVE_GLTHREAD_STATS
+   glthread_dump_cmd_stats(ctx);
+   free(glthread->cmd_stats);
+   glthread->cmd_stats = NULL;
+#endif
+
    for (unsigned i = 0; i < MARSHAL_MAX_BATCHES; i++)
       util_queue_fence_destroy(&glthread->batches[i].fence);
 
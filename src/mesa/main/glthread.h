@@ -131,6 +131,23 @@ struct glthread_attrib_node {
    GLenum MatrixMode;
 };
 
+#ifdef HAVE_GLTHREAD_STATS
+/* Statistics of one command, for finding which commands are worth making
+ * smaller or asynchronous. They are dumped when glthread is destroyed, see
+ * _mesa_marshal_dump_cmd_stats.
+ */
+struct glthread_cmd_stats {
+   /** Number of calls. */
+   uint64_t count;
+
+   /** Number of bytes written to batches. */
+   uint64_t bytes;
+
+   /** Number of calls executed synchronously. */
+   uint64_t syncs;
+};
+#endif
+
 typedef enum {
    M_MODELVIEW,
    M_PROJECTION,
@@ -161,6 +178,11 @@ struct glthread_state
    /** For L3 cache pinning. */
    unsigned pin_thread_counter;
 
+#ifdef HAVE_GLTHREAD_STATS
+   /** Statistics indexed by DISPATCH_CMD_* and SYNC_CMD_*. */
+   struct glthread_cmd_stats *cmd_stats;
+#endif
+
    /** The ring of batches in memory. */
    struct glthread_batch batches[MARSHAL_MAX_BATCHES];
 
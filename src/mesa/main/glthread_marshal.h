@@ -51,6 +51,11 @@ struct marshal_cmd_base
 typedef uint32_t (*_mesa_unmarshal_func)(struct gl_context *ctx, const void *cmd, const uint64_t *last);
 extern const _mesa_unmarshal_func _mesa_unmarshal_dispatch[NUM_DISPATCH_CMD];
 
+#ifdef HAVE_GLTHREAD_STATS
+extern const char *const _mesa_marshal_cmd_names[NUM_MARSHAL_CMD];
+void _mesa_marshal_dump_cmd_stats(const struct glthread_cmd_stats *stats, FILE *f);
+#endif
+
 static inline void *
 _mesa_glthread_allocate_command(struct gl_context *ctx,
                                 uint16_t cmd_id,
@@ -70,6 +75,11 @@ _mesa_glthread_allocate_command(struct gl_context *ctx,
    glthread->used += num_elements;
    cmd_base->cmd_id = cmd_id;
    cmd_base->cmd_size = num_elements;
+
+#ifdef HAVE_GLTHREAD_STATS
+   glthread->cmd_stats[cmd_id].count++;
+   glthread->cmd_stats[cmd_id].bytes += num_elements * 8;
+#endif
    return cmd_base;
 }
 
@@ -22,6 +22,7 @@
 # IN THE SOFTWARE.
 
 import argparse
+import io
 import sys
 import struct
 from valhall import instructions, enums, immediates, typesize
@@ -90,36 +91,6 @@ def parse_int(s, minimum, maximum):
 
     return number
 
-def encode_source(op, fau):
-    if op[0] == '^':
-        die_if(op[1] != 'r', f"Expected register after discard {op}")
-        return parse_int(op[2:], 0, 63) | 0x40
-    elif op[0] == 'r':
-        return parse_int(op[1:], 0, 63)
-    elif op[0] == 'u':
-        val = parse_int(op[1:], 0, 127)
-        fau.set_page(val >> 6)
-        return (val & 0x3F) | 0x80
-    elif op[0] == 'i':
-        return int(op[3:]) | 0xC0
-    elif op.startswith('0x'):
-        try:
-            val = int(op, base=0)
-        except ValueError:
-            die('Expected value')
-
-        die_if(val not in immediates, 'Unexpected immediate value')
-        return immediates.index(val) | 0xC0
-    else:
-        for i in [0, 1, 3]:
-            if op in enums[f'fau_special_page_{i}'].bare_values:
-                idx = 32 + (enums[f'fau_special_page_{i}'].bare_values.index(op) << 1)
-                fau.set_page(i)
-                return idx | 0xC0
-
-        die('Invalid operand')
-
-
 def encode_dest(op):
     die_if(op[0] != 'r', f"Expected register destination {op}")
 
@@ -138,236 +109,362 @@ def encode_dest(op):
 
     return parse_int(reg[1:], 0, 63) | (wrmask << 6)
 
-def parse_asm(line):
-    global LINE
-    LINE = line # For better errors
-    encoded = 0
-
-    # Figure out mnemonic
-    head = line.split(" ")[0]
-    opts = [ins for ins in instructions if head.startswith(ins.name)]
-    opts = sorted(opts, key=lambda x: len(x.name), reverse=True)
-
-    if len(opts) == 0:
-        die(f"No known mnemonic for {head}")
-
-    if len(opts) > 1 and len(opts[0].name) == len(opts[1].name):
-        print(f"Ambiguous mnemonic for {head}")
-        print(f"Options:")
-        for ins in opts:
-            print(f"  {ins}")
-        sys.exit(1)
+def enum_index(values):
+    # Same as values.index(), which finds the first of duplicate values
+    index = {}
+    for i, value in enumerate(values):
+        index.setdefault(value, i)
+    return index
+
+class Assembler:
+    """
+    Valhall assembler. The lookup tables needed to encode instructions are
+    built once from valhall.py when the assembler is created: mnemonics are
+    looked up in a table of instruction names by length instead of being
+    compared with every instruction, and modifiers and enum values are
+    looked up in dictionaries instead of being searched for in lists.
+    """
+
+    PACK = struct.Struct('<Q').pack
+
+    # Number of instructions buffered by assemble_lines between writes
+    BATCH_SIZE = 1024
+
+    def __init__(self):
+        self.instructions = {}
+        for ins in instructions:
+            self.instructions.setdefault(ins.name, []).append(ins)
+        self.name_lengths = sorted(set(len(name) for name in self.instructions),
+                                   reverse=True)
+
+        self.enums = {name: enum_index(enum.bare_values)
+                      for name, enum in enums.items()}
+
+        self.fau_special = {}
+        for i in [0, 1, 3]:
+            for op, idx in self.enums[f'fau_special_page_{i}'].items():
+                self.fau_special.setdefault(op, (i, idx))
 
-    ins = opts[0]
+        self.immediates = enum_index(immediates)
 
-    # Split off modifiers
-    if len(head) > len(ins.name) and head[len(ins.name)] != '.':
-        die(f"Expected . after instruction in {head}")
+        # Per instruction modifier tables, built when first used
+        self.modifiers = {}
 
-    mods = head[len(ins.name) + 1:].split(".")
-    modifier_map = {}
+    def lookup_mnemonic(self, head):
+        """
+        Return the instruction with the longest name that head starts with.
+        """
+        for length in self.name_lengths:
+            if length > len(head):
+                continue
 
-    tail = line[(len(head) + 1):]
-    operands = [x.strip() for x in tail.split(",") if len(x.strip()) > 0]
-    expected_op_count = len(ins.srcs) + len(ins.dests) + len(ins.immediates) + len(ins.staging)
-    if len(operands) != expected_op_count:
-        die(f"Wrong number of operands in {line}, expected {expected_op_count}, got {len(operands)} {operands}")
+            opts = self.instructions.get(head[:length])
+            if opts is None:
+                continue
 
-    # Encode each operand
-    for i, (op, sr) in enumerate(zip(operands, ins.staging)):
-        die_if(op[0] != '@', f'Expected staging register, got {op}')
-        parts = op[1:].split(':')
+            if len(opts) > 1:
+                print(f"Ambiguous mnemonic for {head}")
+                print(f"Options:")
+                for ins in opts:
+                    print(f"  {ins}")
+                sys.exit(1)
 
-        if op == '@':
-            parts = []
+            return opts[0]
 
-        die_if(any([x[0] != 'r' for x in parts]), f'Expected registers, got {op}')
-        regs = [parse_int(x[1:], 0, 63) for x in parts]
+        die(f"No known mnemonic for {head}")
 
-        extended_write = "staging_register_write_count" in [x.name for x in ins.modifiers] and sr.write
-        max_sr_count = 8 if extended_write else 7
+    def lookup_modifiers(self, ins):
+        """
+        Return a dictionary from the modifier values of the instruction to
+        their (modifier, value index), or None for values of several
+        modifiers, and the set of its modifier names.
+        """
+        tables = self.modifiers.get(ins.name)
+        if tables is None:
+            values = {}
+            for mod in ins.modifiers:
+                for value, idx in enum_index(mod.bare_values).items():
+                    values[value] = None if value in values else (mod, idx)
+            names = set(x.name for x in ins.modifiers)
+            tables = self.modifiers[ins.name] = (values, names)
+        return tables
+
+    def encode_source(self, op, fau):
+        if op[0] == '^':
+            die_if(op[1] != 'r', f"Expected register after discard {op}")
+            return parse_int(op[2:], 0, 63) | 0x40
+        elif op[0] == 'r':
+            return parse_int(op[1:], 0, 63)
+        elif op[0] == 'u':
+            val = parse_int(op[1:], 0, 127)
+            fau.set_page(val >> 6)
+            return (val & 0x3F) | 0x80
+        elif op[0] == 'i':
+            return int(op[3:]) | 0xC0
+        elif op.startswith('0x'):
+            try:
+                val = int(op, base=0)
+            except ValueError:
+                die('Expected value')
+
+            die_if(val not in self.immediates, 'Unexpected immediate value')
+            return self.immediates[val] | 0xC0
+        else:
+            special = self.fau_special.get(op)
+            if special is not None:
+                page, idx = special
+                fau.set_page(page)
+                return (32 + (idx << 1)) | 0xC0
+
+            die('Invalid operand')
+
+    def parse(self, line):
+        global LINE
+        LINE = line # For better errors
+        encoded = 0
+
+        # Figure out mnemonic
+        head = line.split(" ")[0]
+        ins = self.lookup_mnemonic(head)
+
+        # Split off modifiers
+        if len(head) > len(ins.name) and head[len(ins.name)] != '.':
+            die(f"Expected . after instruction in {head}")
+
+        mods = head[len(ins.name) + 1:].split(".")
+        modifier_map = {}
+        modifier_values, modifier_names = self.lookup_modifiers(ins)
+
+        tail = line[(len(head) + 1):]
+        operands = [x.strip() for x in tail.split(",") if len(x.strip()) > 0]
+        expected_op_count = len(ins.srcs) + len(ins.dests) + len(ins.immediates) + len(ins.staging)
+        if len(operands) != expected_op_count:
+            die(f"Wrong number of operands in {line}, expected {expected_op_count}, got {len(operands)} {operands}")
+
+        # Encode each operand
+        for i, (op, sr) in enumerate(zip(operands, ins.staging)):
+            die_if(op[0] != '@', f'Expected staging register, got {op}')
+            parts = op[1:].split(':')
+
+            if op == '@':
+                parts = []
+
+            die_if(any([x[0] != 'r' for x in parts]), f'Expected registers, got {op}')
+            regs = [parse_int(x[1:], 0, 63) for x in parts]
+
+            extended_write = "staging_register_write_count" in modifier_names and sr.write
+            max_sr_count = 8 if extended_write else 7
+
+            sr_count = len(regs)
+            die_if(sr_count > max_sr_count, f'Too many staging registers {sr_count}')
+
+            base = regs[0] if len(regs) > 0 else 0
+            die_if(any([reg != (base + i) for i, reg in enumerate(regs)]),
+                    'Expected consecutive staging registers, got {op}')
+            die_if(sr_count > 1 and (base % 2) != 0,
+                    'Consecutive staging registers must be aligned to a register pair')
+
+            if sr.count == 0:
+                if "staging_register_write_count" in modifier_names and sr.write:
+                    modifier_map["staging_register_write_count"] = sr_count - 1
+                else:
+                    assert "staging_register_count" in modifier_names
+                    modifier_map["staging_register_count"] = sr_count
+            else:
+                die_if(sr_count != sr.count, f"Expected {sr.count} staging registers, got {sr_count}")
+
+            encoded |= ((sr.encoded_flags | base) << sr.start)
+        operands = operands[len(ins.staging):]
+
+        for op, dest in zip(operands, ins.dests):
+            encoded |= encode_dest(op) << 40
+        operands = operands[len(ins.dests):]
+
+        if len(ins.dests) == 0 and len(ins.staging) == 0:
+            # Set a placeholder writemask to prevent encoding faults
+            encoded |= (0xC0 << 40)
+
+        fau = FAUState(message = ins.message)
+        enum = self.enums
+
+        for i, (op, src) in enumerate(zip(operands, ins.srcs)):
+            parts = op.split('.')
+            encoded_src = self.encode_source(parts[0], fau)
+
+            # Require a word selection for special FAU values
+            needs_word_select = ((encoded_src >> 5) == 0b111)
+
+            # Has a swizzle been applied yet?
+            swizzled = False
+
+            for mod in parts[1:]:
+                # Encode the modifier
+                if mod in src.offset and src.bits[mod] == 1:
+                    encoded |= (1 << src.offset[mod])
+                elif src.halfswizzle and mod in enum[f'half_swizzles_{src.size}_bit']:
+                    die_if(swizzled, "Multiple swizzles specified")
+                    swizzled = True
+                    val = enum[f'half_swizzles_{src.size}_bit'][mod]
+                    encoded |= (val << src.offset['widen'])
+                elif mod in enum[f'swizzles_{src.size}_bit'] and (src.widen or src.lanes):
+                    die_if(swizzled, "Multiple swizzles specified")
+                    swizzled = True
+                    val = enum[f'swizzles_{src.size}_bit'][mod]
+                    encoded |= (val << src.offset['widen'])
+                elif src.lane and mod in enum[f'lane_{src.size}_bit']:
+                    die_if(swizzled, "Multiple swizzles specified")
+                    swizzled = True
+                    val = enum[f'lane_{src.size}_bit'][mod]
+                    encoded |= (val << src.offset['lane'])
+                elif src.combine and mod in enum['combine']:
+                    die_if(swizzled, "Multiple swizzles specified")
+                    swizzled = True
+                    val = enum['combine'][mod]
+                    encoded |= (val << src.offset['combine'])
+                elif src.size == 32 and mod in enum['widen']:
+                    die_if(not src.swizzle, "Instruction doesn't take widens")
+                    die_if(swizzled, "Multiple swizzles specified")
+                    swizzled = True
+                    val = enum['widen'][mod]
+                    encoded |= (val << src.offset['swizzle'])
+                elif src.size == 16 and mod in enum['swizzles_16_bit']:
+                    die_if(not src.swizzle, "Instruction doesn't take swizzles")
+                    die_if(swizzled, "Multiple swizzles specified")
+                    swizzled = True
+                    val = enum['swizzles_16_bit'][mod]
+                    encoded |= (val << src.offset['swizzle'])
+                elif mod in enum['lane_8_bit']:
+                    die_if(not src.lane, "Instruction doesn't take a lane")
+                    die_if(swizzled, "Multiple swizzles specified")
+                    swizzled = True
+                    val = enum['lane_8_bit'][mod]
+                    encoded |= (val << src.lane)
+                elif mod in enum['lanes_8_bit']:
+                    die_if(not src.lanes, "Instruction doesn't take a lane")
+                    die_if(swizzled, "Multiple swizzles specified")
+                    swizzled = True
+                    val = enum['lanes_8_bit'][mod]
+                    encoded |= (val << src.offset['widen'])
+                elif mod in ['w0', 'w1']:
+                    # Chck for special
+                    die_if(not needs_word_select, 'Unexpected word select')
+
+                    if mod == 'w1':
+                        encoded_src |= 0x1
+
+                    needs_word_select = False
+                else:
+                    die(f"Unknown modifier {mod}")
+
+            # Encode the identity if a swizzle is required but not specified
+            if src.swizzle and not swizzled and src.size == 16:
+                mod = enums['swizzles_16_bit'].default
+                val = enum['swizzles_16_bit'][mod]
+                encoded |= (val << src.offset['swizzle'])
+            elif src.widen and not swizzled and src.size == 16:
+                die_if(swizzled, "Multiple swizzles specified")
+                mod = enums['swizzles_16_bit'].default
+                val = enum['swizzles_16_bit'][mod]
+                encoded |= (val << src.offset['widen'])
 
-        sr_count = len(regs)
-        die_if(sr_count > max_sr_count, f'Too many staging registers {sr_count}')
+            encoded |= encoded_src << src.start
+            fau.push(encoded_src)
 
-        base = regs[0] if len(regs) > 0 else 0
-        die_if(any([reg != (base + i) for i, reg in enumerate(regs)]),
-                'Expected consecutive staging registers, got {op}')
-        die_if(sr_count > 1 and (base % 2) != 0,
-                'Consecutive staging registers must be aligned to a register pair')
+        operands = operands[len(ins.srcs):]
 
-        if sr.count == 0:
-            if "staging_register_write_count" in [x.name for x in ins.modifiers] and sr.write:
-                modifier_map["staging_register_write_count"] = sr_count - 1
+        for i, (op, imm) in enumerate(zip(operands, ins.immediates)):
+            if op[0] == '#':
+                die_if(imm.name != 'constant', "Wrong syntax for immediate")
+                parts = [imm.name, op[1:]]
             else:
-                assert "staging_register_count" in [x.name for x in ins.modifiers]
-                modifier_map["staging_register_count"] = sr_count
-        else:
-            die_if(sr_count != sr.count, f"Expected {sr.count} staging registers, got {sr_count}")
-
-        encoded |= ((sr.encoded_flags | base) << sr.start)
-    operands = operands[len(ins.staging):]
+                parts = op.split(':')
+                die_if(len(parts) != 2, f"Wrong syntax for immediate, wrong number of colons in {op}")
+                die_if(parts[0] != imm.name, f"Wrong immediate, expected {imm.name}, got {parts[0]}")
 
-    for op, dest in zip(operands, ins.dests):
-        encoded |= encode_dest(op) << 40
-    operands = operands[len(ins.dests):]
+            if imm.signed:
+                minimum = -(1 << (imm.size - 1))
+                maximum = +(1 << (imm.size - 1)) - 1
+            else:
+                minimum = 0
+                maximum = (1 << imm.size) - 1
 
-    if len(ins.dests) == 0 and len(ins.staging) == 0:
-        # Set a placeholder writemask to prevent encoding faults
-        encoded |= (0xC0 << 40)
+            val = parse_int(parts[1], minimum, maximum)
 
-    fau = FAUState(message = ins.message)
+            if val < 0:
+                # Sign extends
+                val = (1 << imm.size) + val
 
-    for i, (op, src) in enumerate(zip(operands, ins.srcs)):
-        parts = op.split('.')
-        encoded_src = encode_source(parts[0], fau)
+            encoded |= (val << imm.start)
 
-        # Require a word selection for special FAU values
-        needs_word_select = ((encoded_src >> 5) == 0b111)
+        operands = operands[len(ins.immediates):]
 
-        # Has a swizzle been applied yet?
-        swizzled = False
+        # Encode the operation itself
+        encoded |= (ins.opcode << 48)
+        encoded |= (ins.opcode2 << ins.secondary_shift)
 
-        for mod in parts[1:]:
-            # Encode the modifier
-            if mod in src.offset and src.bits[mod] == 1:
-                encoded |= (1 << src.offset[mod])
-            elif src.halfswizzle and mod in enums[f'half_swizzles_{src.size}_bit'].bare_values:
-                die_if(swizzled, "Multiple swizzles specified")
-                swizzled = True
-                val = enums[f'half_swizzles_{src.size}_bit'].bare_values.index(mod)
-                encoded |= (val << src.offset['widen'])
-            elif mod in enums[f'swizzles_{src.size}_bit'].bare_values and (src.widen or src.lanes):
-                die_if(swizzled, "Multiple swizzles specified")
-                swizzled = True
-                val = enums[f'swizzles_{src.size}_bit'].bare_values.index(mod)
-                encoded |= (val << src.offset['widen'])
-            elif src.lane and mod in enums[f'lane_{src.size}_bit'].bare_values:
-                die_if(swizzled, "Multiple swizzles specified")
-                swizzled = True
-                val = enums[f'lane_{src.size}_bit'].bare_values.index(mod)
-                encoded |= (val << src.offset['lane'])
-            elif src.combine and mod in enums['combine'].bare_values:
-                die_if(swizzled, "Multiple swizzles specified")
-                swizzled = True
-                val = enums['combine'].bare_values.index(mod)
-                encoded |= (val << src.offset['combine'])
-            elif src.size == 32 and mod in enums['widen'].bare_values:
-                die_if(not src.swizzle, "Instruction doesn't take widens")
-                die_if(swizzled, "Multiple swizzles specified")
-                swizzled = True
-                val = enums['widen'].bare_values.index(mod)
-                encoded |= (val << src.offset['swizzle'])
-            elif src.size == 16 and mod in enums['swizzles_16_bit'].bare_values:
-                die_if(not src.swizzle, "Instruction doesn't take swizzles")
-                die_if(swizzled, "Multiple swizzles specified")
-                swizzled = True
-                val = enums['swizzles_16_bit'].bare_values.index(mod)
-                encoded |= (val << src.offset['swizzle'])
-            elif mod in enums['lane_8_bit'].bare_values:
-                die_if(not src.lane, "Instruction doesn't take a lane")
-                die_if(swizzled, "Multiple swizzles specified")
-                swizzled = True
-                val = enums['lane_8_bit'].bare_values.index(mod)
-                encoded |= (val << src.lane)
-            elif mod in enums['lanes_8_bit'].bare_values:
-                die_if(not src.lanes, "Instruction doesn't take a lane")
-                die_if(swizzled, "Multiple swizzles specified")
-                swizzled = True
-                val = enums['lanes_8_bit'].bare_values.index(mod)
-                encoded |= (val << src.offset['widen'])
-            elif mod in ['w0', 'w1']:
-                # Chck for special
-                die_if(not needs_word_select, 'Unexpected word select')
+        # Encode FAU page
+        if fau.page:
+            encoded |= (fau.page << 57)
 
-                if mod == 'w1':
-                    encoded_src |= 0x1
+        # Encode modifiers
+        has_flow = False
+        for mod in mods:
+            if len(mod) == 0:
+                continue
 
-                needs_word_select = False
+            if mod in enum['flow']:
+                die_if(has_flow, "Multiple flow control modifiers specified")
+                has_flow = True
+                encoded |= (enum['flow'][mod] << 59)
             else:
-                die(f"Unknown modifier {mod}")
-
-        # Encode the identity if a swizzle is required but not specified
-        if src.swizzle and not swizzled and src.size == 16:
-            mod = enums['swizzles_16_bit'].default
-            val = enums['swizzles_16_bit'].bare_values.index(mod)
-            encoded |= (val << src.offset['swizzle'])
-        elif src.widen and not swizzled and src.size == 16:
-            die_if(swizzled, "Multiple swizzles specified")
-            mod = enums['swizzles_16_bit'].default
-            val = enums['swizzles_16_bit'].bare_values.index(mod)
-            encoded |= (val << src.offset['widen'])
-
-        encoded |= encoded_src << src.start
-        fau.push(encoded_src)
-
-    operands = operands[len(ins.srcs):]
-
-    for i, (op, imm) in enumerate(zip(operands, ins.immediates)):
-        if op[0] == '#':
-            die_if(imm.name != 'constant', "Wrong syntax for immediate")
-            parts = [imm.name, op[1:]]
-        else:
-            parts = op.split(':')
-            die_if(len(parts) != 2, f"Wrong syntax for immediate, wrong number of colons in {op}")
-            die_if(parts[0] != imm.name, f"Wrong immediate, expected {imm.name}, got {parts[0]}")
-
-        if imm.signed:
-            minimum = -(1 << (imm.size - 1))
-            maximum = +(1 << (imm.size - 1)) - 1
-        else:
-            minimum = 0
-            maximum = (1 << imm.size) - 1
-
-        val = parse_int(parts[1], minimum, maximum)
+                die_if(mod not in modifier_values, f"Invalid modifier {mod} used")
+                candidate = modifier_values[mod]
+                assert(candidate is not None) # No ambiguous modifiers
+                opts, value = candidate
 
-        if val < 0:
-            # Sign extends
-            val = (1 << imm.size) + val
+                die_if(opts.name in modifier_map, f"{opts.name} specified twice")
+                modifier_map[opts.name] = value
 
-        encoded |= (val << imm.start)
+        for mod in ins.modifiers:
+            value = modifier_map.get(mod.name, mod.default)
+            die_if(value is None, f"Missing required modifier {mod.name}")
 
-    operands = operands[len(ins.immediates):]
+            assert(value < (1 << mod.size))
+            encoded |= (value << mod.start)
 
-    # Encode the operation itself
-    encoded |= (ins.opcode << 48)
-    encoded |= (ins.opcode2 << ins.secondary_shift)
+        return encoded
 
-    # Encode FAU page
-    if fau.page:
-        encoded |= (fau.page << 57)
+    def assemble_lines(self, lines, out = None):
+        """
+        Assemble an iterable of lines, skipping empty lines and comments, and
+        write the little-endian encoded instructions to the binary stream out
+        as they are assembled. Returns out, which defaults to a new
+        io.BytesIO.
+        """
+        if out is None:
+            out = io.BytesIO()
 
-    # Encode modifiers
-    has_flow = False
-    for mod in mods:
-        if len(mod) == 0:
-            continue
+        batch = []
+        for line in lines:
+            line = line.rstrip('\r\n')
+            if len(line.strip()) == 0 or line[0] == '#':
+                continue
 
-        if mod in enums['flow'].bare_values:
-            die_if(has_flow, "Multiple flow control modifiers specified")
-            has_flow = True
-            encoded |= (enums['flow'].bare_values.index(mod) << 59)
-        else:
-            candidates = [c for c in ins.modifiers if mod in c.bare_values]
+            batch.append(self.PACK(self.parse(line)))
+            if len(batch) >= self.BATCH_SIZE:
+                out.write(b''.join(batch))
+                batch = []
 
-            die_if(len(candidates) == 0, f"Invalid modifier {mod} used")
-            assert(len(candidates) == 1) # No ambiguous modifiers
-            opts = candidates[0]
+        out.write(b''.join(batch))
+        return out
 
-            value = opts.bare_values.index(mod)
-            assert(value is not None)
+_assembler = None
 
-            die_if(opts.name in modifier_map, f"{opts.name} specified twice")
-            modifier_map[opts.name] = value
-
-    for mod in ins.modifiers:
-        value = modifier_map.get(mod.name, mod.default)
-        die_if(value is None, f"Missing required modifier {mod.name}")
-
-        assert(value < (1 << mod.size))
-        encoded |= (value << mod.start)
-
-    return encoded
+def parse_asm(line):
+    global _assembler
+    if _assembler is None:
+        _assembler = Assembler()
+    return _assembler.parse(line)
 
 if __name__ == "__main__":
     # Provide commandline interface
@@ -377,8 +474,4 @@ if __name__ == "__main__":
     parser.add_argument('outfile', type=argparse.FileType('wb'))
     args = parser.parse_args()
 
-    lines = args.infile.read().strip().split('\n')
-    lines = [l for l in lines if len(l) > 0 and l[0] != '#']
-
-    packed = b''.join([struct.pack('<Q', parse_asm(ln)) for ln in lines])
-    args.outfile.write(packed)
+    Assembler().assemble_lines(args.infile, args.outfile)
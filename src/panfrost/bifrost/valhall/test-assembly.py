@@ -21,9 +21,12 @@
 # FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
 # IN THE SOFTWARE.
 
-from asm import parse_asm, ParseError
+from asm import Assembler, ParseError
 import sys
 import struct
+import time
+
+assembler = Assembler()
 
 def parse_hex_8(s):
     b = [int(x, base=16) for x in s.split(' ')]
@@ -38,7 +41,7 @@ def hex_8(u64):
 def positive_test(machine, assembly):
     try:
         expected = parse_hex_8(machine)
-        val = parse_asm(assembly)
+        val = assembler.parse(assembly)
         if val != expected:
             return f"{hex_8(val)}    Incorrect assembly"
     except ParseError as exc:
@@ -47,7 +50,7 @@ def positive_test(machine, assembly):
 # These should throw exceptions
 def negative_test(assembly):
     try:
-        parse_asm(assembly)
+        assembler.parse(assembly)
         return "Expected exception"
     except Exception:
         return None
@@ -73,6 +76,24 @@ with open(sys.argv[1], "r") as f:
         (machine, assembly) = case.split('    ')
         record_case(case, positive_test(machine, assembly))
 
+    # Assemble all the positive cases at once, which should give the same
+    # result, and measure the throughput while at it.
+    machine = [parse_hex_8(case.split('    ')[0]) for case in cases]
+    assembly = [case.split('    ')[1] for case in cases]
+    expected = b''.join([struct.pack('<Q', x) for x in machine])
+    try:
+        start = time.perf_counter()
+        packed = assembler.assemble_lines(assembly).getvalue()
+        elapsed = time.perf_counter() - start
+        if packed != expected:
+            record_case("assemble_lines", "Incorrect assembly")
+        else:
+            record_case("assemble_lines", None)
+            print("Assembled {} lines in {:.3f} ms, {:.0f} lines/sec".format(
+                len(assembly), elapsed * 1000, len(assembly) / elapsed))
+    except ParseError as exc:
+        record_case("assemble_lines", f"Unexpected exception: {exc}")
+
 with open(sys.argv[2], "r") as f:
     cases = f.read().split('\n')
     cases = [x for x in cases if len(x) > 0]
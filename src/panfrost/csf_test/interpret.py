@@ -1,5 +1,6 @@
 #!/usr/bin/env python3
 
+import copy
 import os
 import re
 import struct
@@ -917,10 +918,15 @@ b.ne w10, 1b
 def get_cmds(cmd):
     return cmds.replace("{cmd}", str(cmd))
 
+# Assembled shaders, by source text
+assembled = {}
+
 def assemble_shader(text):
-    lines = text.strip().split("\n")
-    lines = [l for l in lines if len(l) > 0 and l[0] not in "#@"]
-    return [asm.parse_asm(ln) for ln in lines]
+    if text not in assembled:
+        lines = text.strip().split("\n")
+        lines = [l for l in lines if len(l) > 0 and l[0] not in "#@"]
+        assembled[text] = tuple(asm.parse_asm(ln) for ln in lines)
+    return list(assembled[text])
 
 class Buffer:
     id = 0
@@ -1011,6 +1017,36 @@ class Context:
 
         self.is_call = False
 
+        # Allocations which a csf_test session already has
+        self.resident = set()
+
+        # Allocations shared with the context this is a copy of, and their
+        # text, which only needs formatting once
+        self.shared = {}
+
+    def copy(self):
+        """Return a context to interpret another command stream in, which
+        starts out with the buffers and relocations of this one."""
+        assert(not self.levels and not self.exe)
+
+        c = copy.copy(self)
+        c.levels = []
+        c.exe = []
+        c.allocs = dict(self.allocs)
+        c.completed = list(self.completed)
+        c.reloc = list(self.reloc)
+        c.reloc_split = list(self.reloc_split)
+        c.resident = set(self.resident)
+
+        if len(self.shared) != len(self.allocs):
+            self.shared = {x: (a, str(a)) for x, a in self.allocs.items()}
+        c.shared = self.shared
+
+        # Every copy gets the same buffer IDs, rather than IDs growing with
+        # the number of command streams
+        Buffer.id = self.next_id
+        return c
+
     def set_l(self):
         if len(self.levels):
             self.l = self.levels[-1]
@@ -1072,6 +1108,10 @@ class Context:
             a.buffer = qwords
             self.allocs[sh] = a
 
+    def add_resident(self, allocs):
+        self.allocs.update(allocs)
+        self.resident.update(allocs)
+
     def add_memory(self, memory):
         for m in memory:
             f = memory[m]
@@ -1619,23 +1659,61 @@ class Context:
         self.pop_until(self.levels[0].indent)
         self.flush_exe()
 
+    def fmt_alloc(self, name):
+        a = self.allocs[name]
+        if name in self.shared and self.shared[name][0] is a:
+            return self.shared[name][1]
+        return str(a)
+
     def __repr__(self):
         r = []
-        r += [str(self.allocs[x]) for x in self.allocs]
+        r += [self.fmt_alloc(x) for x in self.allocs
+              if x not in self.resident]
         r += [str(x) for x in self.completed]
         r += [fmt_reloc(x) for x in self.reloc]
         r += [fmt_reloc(x, name="relsplit") for x in self.reloc_split]
         r += [fmt_exe(x) for x in self.exe]
         return "\n".join(r)
 
+# The last context returned by base_context(), and what it was built from
+base = None
+base_key = None
+
+def base_context():
+    """Return a context with the shaders, memory and descriptors set up,
+    which command streams are interpreted in copies of."""
+    global base, base_key
+
+    key = repr((shaders, memory, descriptors))
+    if key != base_key:
+        base = Context()
+        base.add_shaders(shaders)
+        base.add_memory(memory)
+        base.add_descriptors(descriptors)
+        base.next_id = Buffer.id
+        base_key = key
+    return base
+
 def interpret(text):
-    c = Context()
-    c.add_shaders(shaders)
-    c.add_memory(memory)
-    c.add_descriptors(descriptors)
+    c = base_context().copy()
     c.interpret(text)
     return str(c)
 
+def interpret_variants(values, template=None, placeholder="{cmd}"):
+    """Interpret one command stream for each value, with the placeholder in
+    the template (the cmds stream by default) replaced by the value, e.g.
+    for parameter sweeps or fuzzing."""
+    if template is None:
+        template = cmds
+
+    start = base_context()
+    streams = []
+    for value in values:
+        c = start.copy()
+        c.interpret(template.replace(placeholder, str(value)))
+        streams.append(str(c))
+    return streams
+
 def run(text, capture=False):
     if capture:
         cap = {"stdout": subprocess.PIPE, "stderr": subprocess.STDOUT}
@@ -1652,6 +1730,92 @@ def run(text, capture=False):
         ret.stdout = ""
     return ret.stderr + ret.stdout
 
+class Session:
+    """Run many command streams with a single csf_test process.
+
+    "csf_test --session" keeps the device open and reads scripts from stdin,
+    each sent as a "script <length>" line followed by the script. Every
+    script is answered on stdout with a "result <length> <ok|exit>" line
+    followed by its output, where "exit" means that the process is about to
+    exit and a new one has to be started for the following scripts.
+
+    The buffers are set up from the shaders, memory and descriptors once,
+    when the session is created. The shaders are then uploaded once per
+    process into buffers marked with "keep", which the following scripts
+    relocate to.
+    """
+
+    def __init__(self, command=None, mock=False, shaders=shaders):
+        if command is None:
+            if mock:
+                command = [sys.executable, os.path.join(
+                    os.path.dirname(os.path.realpath(__file__)),
+                    "mock_csf_test.py")]
+            else:
+                command = ["csf_test"]
+        self.command = command + ["--session"]
+        self.proc = None
+
+        c = Context()
+        c.add_shaders(shaders)
+        self.shaders = c.allocs
+        for i, a in enumerate(self.shaders.values()):
+            a.id = i
+
+        Buffer.id = len(self.shaders)
+        self.base = Context()
+        self.base.add_resident(self.shaders)
+        self.base.add_memory(memory)
+        self.base.add_descriptors(descriptors)
+        self.base.next_id = Buffer.id
+
+    def start(self):
+        self.proc = subprocess.Popen(self.command, stdin=subprocess.PIPE,
+                                     stdout=subprocess.PIPE)
+        self.uploaded = False
+
+    def close(self):
+        if self.proc is not None:
+            self.proc.stdin.close()
+            self.proc.wait()
+            self.proc = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def interpret(self, text):
+        c = self.base.copy()
+        c.interpret(text)
+        return str(c)
+
+    def run(self, text):
+        script = self.interpret(text)
+        if self.proc is None:
+            self.start()
+        if not self.uploaded:
+            upload = [str(a) for a in self.shaders.values()]
+            upload += [f"keep {a.id}" for a in self.shaders.values()]
+            script = "\n".join(upload) + "\n" + script
+            self.uploaded = True
+
+        data = script.encode()
+        self.proc.stdin.write(b"script %d\n" % len(data) + data)
+        self.proc.stdin.flush()
+
+        header = self.proc.stdout.readline().split()
+        if len(header) != 3 or header[0] != b"result":
+            self.proc.kill()
+            self.close()
+            raise RuntimeError("csf_test session died")
+
+        ret = self.proc.stdout.read(int(header[1])).decode()
+        if header[2] == b"exit":
+            self.close()
+        return ret
+
 def rebuild():
     try:
         p = subprocess.run(["rebuild-mesa"])
@@ -1672,9 +1836,10 @@ def go(text):
     #subprocess.run("ls /tmp/fdump.????? | tail -n2 | xargs diff -U3 -s",
     #               shell=True)
 
-os.environ["CSF_QUIET"] = "1"
+if __name__ == "__main__":
+    os.environ["CSF_QUIET"] = "1"
 
-go(get_cmds(""))
+    go(get_cmds(""))
 
 #for c in range(1, 64):
 #    val = c
@@ -1682,11 +1847,10 @@ go(get_cmds(""))
 #    print(str(val) + '\t' + [x for x in ret.split("\n") if x.startswith("0FFF10")][0])
 
 #rebuild()
-#for c in range(256):
-#    print(c, end=":")
-#    sys.stdout.flush()
-#    cmd = f"UNK 00 {hex(c)[2:]} 0x00000000"
-#    run(get_cmds(cmd))
+#with Session() as s:
+#    for c in range(256):
+#        cmd = f"UNK 00 {hex(c)[2:]} 0x00000000"
+#        print(c, s.run(get_cmds(cmd)), sep=":")
 
 #interpret(cmds)
 #go(cmds)
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+# SPDX-License-Identifier: MIT
+
+"""Measure how many command streams per second interpret.py produces.
+
+Interprets variants of the cmds stream, like a parameter sweep does, both
+the way interpret.py used to (assembling the shaders and setting up the
+memory and descriptors again for every stream) and from the prepared base
+context. With --mock, the streams are also run through a session with
+mock_csf_test.py.
+"""
+
+import argparse
+import time
+
+import interpret
+
+
+def uncached(values):
+    """Interpret every stream in a fresh context, with nothing memoized."""
+    streams = []
+    for value in values:
+        interpret.assembled.clear()
+        c = interpret.Context()
+        c.add_shaders(interpret.shaders)
+        c.add_memory(interpret.memory)
+        c.add_descriptors(interpret.descriptors)
+        c.interpret(interpret.get_cmds(value))
+        streams.append(str(c))
+    return streams
+
+
+def session(values):
+    with interpret.Session(mock=True) as s:
+        return [s.run(interpret.get_cmds(value)) for value in values]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("-n", "--streams", type=int, default=200,
+                        help="number of streams (default: %(default)s)")
+    parser.add_argument("--mock", action="store_true",
+                        help="also run the streams in a mock session")
+    args = parser.parse_args()
+
+    values = [f"UNK 00 {c & 0xff:x} 0x00000000" for c in range(args.streams)]
+    modes = [("uncached", uncached),
+             ("variants", interpret.interpret_variants)]
+    if args.mock:
+        modes.append(("mock session", session))
+
+    print(f"{'mode':<16} {'streams/s':>10}")
+    for name, fn in modes:
+        start = time.perf_counter()
+        fn(values)
+        elapsed = time.perf_counter() - start
+        print(f"{name:<16} {args.streams / elapsed:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
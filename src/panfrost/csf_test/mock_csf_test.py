@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+# SPDX-License-Identifier: MIT
+
+"""A stand-in for csf_test which needs no GPU.
+
+It understands the same scripts and session protocol as csf_test, but
+allocates buffers in host memory at made-up GPU addresses and does not
+execute anything: "dump" commands print the buffers back after the
+relocations are applied. This is enough to test interpret.py and its
+sessions, e.g.
+
+  ./mock_csf_test.py script.txt
+  ./mock_csf_test.py --session < frames
+"""
+
+import re
+import struct
+import sys
+
+PAGE_SIZE = 4096
+BASE_VA = 0x7f0000000000
+
+
+def hexdump(out, data, with_strings):
+    """Print data like pan_hexdump() does."""
+    i = 0
+    while i < len(data):
+        if (i & 0xf) == 0:
+            out.append(f"{i:06X}  ")
+
+        if data[i] == 0 and (i & 0xf) == 0:
+            # Abbreviate aligned runs of at least 32 zero bytes
+            end = i
+            while end < len(data) and data[end] == 0:
+                end += 1
+            if end - i >= 32:
+                out.append("*\n")
+                i += (end - i) & ~0xf
+                continue
+
+        out.append(f"{data[i]:02X} ")
+        if (i & 0xf) == 0xf:
+            if with_strings:
+                out.append(" | " + "".join(chr(c) if 32 <= c <= 126 else "."
+                                           for c in data[i & ~0xf:i + 1]))
+            out.append("\n")
+        i += 1
+
+    out.append("\n")
+
+
+def dump_delta(out, data):
+    old = 0
+    zero = False
+    ellipsis = False
+    for val, in struct.iter_unpack("<Q", data[:len(data) & ~7]):
+        delta = (val - old + (1 << 63)) % (1 << 64) - (1 << 63)
+        if not zero or delta:
+            out.append(f"{delta}\n")
+            ellipsis = False
+        elif not ellipsis:
+            out.append("...\n")
+            ellipsis = True
+        old = val
+        zero = delta == 0
+
+
+def dump_heatmap(out, data, gran, length, stride):
+    size = len(data)
+    while size and not data[size - 1]:
+        size -= 1
+
+    total = gr = st = ll = 0
+    i = 0
+    while i < size:
+        total += data[i]
+
+        gr += 1
+        if gr == gran:
+            out.append(f" {total & 0xff:02x}")
+            gr = 0
+            total = 0
+
+        ll += 1
+        st += 1
+        if ll == length:
+            i += stride - length
+            out.append("\n")
+            st = 0
+            ll = 0
+        elif st == stride:
+            out.append("\n")
+            st = 0
+        i += 1
+    out.append(f" {total:02x}\n")
+
+
+class Backend:
+    def __init__(self):
+        self.buffers = {}
+        self.keep = set()
+        self.next_va = BASE_VA
+
+    def alloc(self, id, size):
+        size = max((size + PAGE_SIZE - 1) & ~(PAGE_SIZE - 1), PAGE_SIZE)
+        self.buffers[id] = (self.next_va, bytearray(size))
+        # Leave a redzone page between buffers, like csf_test
+        self.next_va += size + PAGE_SIZE
+        self.keep.discard(id)
+
+    def free_scratch(self):
+        for id in list(self.buffers):
+            if id not in self.keep:
+                del self.buffers[id]
+
+    def run(self, script):
+        """Run a script, and return its dumps and error messages."""
+        out = []
+        for line in script.split("\n"):
+            words = line.split()
+            if not words:
+                continue
+            cmd = words[0]
+
+            if cmd in ("reloc", "relsplit"):
+                dst, offset = map(int, words[1].split("+"))
+                src, src_offset = map(int, words[2].split("+"))
+                if src not in self.buffers or dst not in self.buffers:
+                    out.append("relocating to buffer that doesn't exist!\n")
+                    continue
+                value = self.buffers[src][0] + src_offset
+                buf = self.buffers[dst][1]
+                if cmd == "relsplit":
+                    lo, hi = struct.unpack_from("<II", buf, offset)
+                    struct.pack_into("<II", buf, offset,
+                                     lo | (value & 0xffffffff),
+                                     hi | (value >> 32))
+                else:
+                    old, = struct.unpack_from("<Q", buf, offset)
+                    struct.pack_into("<Q", buf, offset, old | value)
+
+            elif cmd == "buffer":
+                id, size = int(words[1]), int(words[2])
+                self.alloc(id, size)
+                values = [int(x, 16) for x in words[4:4 + size // 8]]
+                struct.pack_into(f"<{len(values)}Q", self.buffers[id][1], 0,
+                                 *values)
+
+            elif cmd == "exe":
+                # Nothing to execute on, but check the buffers exist
+                for i in range(1, len(words) - 2, 3):
+                    if int(words[i]) > 3:
+                        out.append("execute on out-of-bounds iterator\n")
+
+            elif cmd == "dump":
+                id, offset, size = map(int, words[1:4])
+                mode = words[4]
+                if id not in self.buffers:
+                    out.append("dumping buffer that doesn't exist!\n")
+                    continue
+                data = self.buffers[id][1][offset:offset + size]
+                if mode == "hex":
+                    hexdump(out, data, True)
+                elif mode == "delta":
+                    dump_delta(out, data)
+                else:
+                    out.append(f"dump mode '{mode}' is not mocked\n")
+
+            elif cmd == "heatmap":
+                id, offset, size, gran, length, stride = map(int, words[1:7])
+                if id not in self.buffers:
+                    out.append("dumping buffer that doesn't exist!\n")
+                    continue
+                data = self.buffers[id][1][offset:offset + size]
+                dump_heatmap(out, data, gran, length, stride)
+
+            elif cmd == "keep":
+                self.keep.add(int(words[1]))
+
+            elif cmd == "free":
+                self.buffers.pop(int(words[1]), None)
+
+            else:
+                out.append(f"unknown command '{line}'\n")
+
+        return "".join(out)
+
+
+def session(backend, inp, out):
+    while True:
+        header = inp.readline()
+        if not header:
+            break
+        m = re.fullmatch(rb"script (\d+)\n", header)
+        if m is None:
+            print(f"bad session frame {header!r}", file=sys.stderr)
+            break
+
+        script = inp.read(int(m.group(1))).decode()
+        reply = backend.run(script).encode()
+        backend.free_scratch()
+
+        out.write(b"result %d ok\n" % len(reply) + reply)
+        out.flush()
+
+
+def main():
+    if len(sys.argv) < 2:
+        return
+
+    backend = Backend()
+    if sys.argv[1] == "--session":
+        session(backend, sys.stdin.buffer, sys.stdout.buffer)
+    else:
+        with open(sys.argv[1]) as f:
+            sys.stdout.write(backend.run(f.read()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+# SPDX-License-Identifier: MIT
+
+"""Tests for the session protocol of csf_test.
+
+These run against mock_csf_test.py, and against the real csf_test when there
+is a Mali GPU. The binary is found in the build directory named by
+MESON_BUILD_ROOT or build/, or can be given with the CSF_TEST environment
+variable, e.g.
+
+  CSF_TEST=build/src/panfrost/csf_test/csf_test pytest session_test.py
+"""
+
+import os
+import subprocess
+import sys
+
+import pytest
+
+FLAGS = 0x280f
+
+CSF_TEST_DIR = os.path.dirname(os.path.realpath(__file__))
+SOURCE_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(CSF_TEST_DIR)))
+
+
+def csf_test_command():
+    if "CSF_TEST" in os.environ:
+        path = os.environ["CSF_TEST"]
+    else:
+        build_root = os.environ.get("MESON_BUILD_ROOT",
+                                    os.path.join(SOURCE_ROOT, "build"))
+        path = os.path.join(build_root, "src", "panfrost", "csf_test",
+                            "csf_test")
+    if not os.access(path, os.X_OK):
+        pytest.skip(f"csf_test binary not found at {path}")
+    if not os.path.exists("/dev/mali0"):
+        pytest.skip("csf_test needs a Mali GPU (/dev/mali0)")
+    return [path]
+
+
+@pytest.fixture(params=["mock", "csf_test"])
+def session(request):
+    if request.param == "csf_test":
+        command = csf_test_command()
+    else:
+        command = [sys.executable, os.path.join(CSF_TEST_DIR,
+                                                "mock_csf_test.py")]
+
+    proc = subprocess.Popen(command + ["--session"], stdin=subprocess.PIPE,
+                            stdout=subprocess.PIPE)
+
+    def run(script):
+        data = script.encode()
+        proc.stdin.write(b"script %d\n" % len(data) + data)
+        proc.stdin.flush()
+
+        header = proc.stdout.readline().split()
+        assert len(header) == 3 and header[0] == b"result", header
+        out = proc.stdout.read(int(header[1]))
+        assert len(out) == int(header[1])
+        return out.decode(), header[2].decode()
+
+    yield run
+
+    proc.stdin.close()
+    assert proc.wait() == 0
+
+
+def test_empty_script(session):
+    assert session("") == ("", "ok")
+
+
+def test_keep(session):
+    out, status = session(f"buffer 0 4096 {FLAGS:x} 1122334455667788\n"
+                          "keep 0\n")
+    assert (out, status) == ("", "ok")
+
+    out, status = session("dump 0 0 16 hex\n")
+    assert status == "ok"
+    assert "88 77 66 55 44 33 22 11" in out
+
+
+def test_scratch_freed(session):
+    session(f"buffer 0 4096 {FLAGS:x} 0\n"
+            "keep 0\n"
+            f"buffer 1 4096 {FLAGS:x} 0\n")
+
+    out, status = session("reloc 0+0 1+0\n")
+    assert status == "ok"
+    assert "relocating to buffer that doesn't exist!" in out
+
+
+def test_reuse_ids(session):
+    # Scratch buffers get the same ids in every script, so they have to be
+    # freed completely, including their redzones, for the next script to be
+    # able to allocate them again.
+    for i in range(64):
+        out, status = session(f"buffer 0 {4096 * (i % 4 + 1)} {FLAGS:x} {i:x}\n"
+                              "dump 0 0 8 hex\n")
+        assert status == "ok"
+        assert out.startswith(f"000000  {i:02X} ")
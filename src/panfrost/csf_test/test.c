@@ -158,6 +158,9 @@ struct state {
 
         unsigned shader_alloc_offset;
         mali_ptr compute_shader;
+
+        /* Replies to the client in session mode, see cs_session() */
+        FILE *session;
 };
 
 struct test {
@@ -722,16 +725,31 @@ alloc_mem(struct state *s, uint64_t size, uint64_t flags)
         return alloc_ioctl(s, &a);
 }
 
+/* Map inaccessible pages around an allocation. The pages which could be
+ * mapped are returned in redzones, the others are NULL. */
 static void
-alloc_redzone(struct state *s, struct panfrost_ptr p, uint64_t alloc_size)
+alloc_redzone(struct state *s, struct panfrost_ptr p, uint64_t alloc_size,
+              void *redzones[2])
 {
-        mmap(p.cpu - s->page_size, 1,
-             PROT_NONE, MAP_PRIVATE | MAP_ANONYMOUS | MAP_FIXED_NOREPLACE,
-             -1, 0);
+        void *addrs[2] = { p.cpu - s->page_size, p.cpu + alloc_size };
+
+        for (unsigned i = 0; i < 2; ++i) {
+                redzones[i] = mmap(addrs[i], 1, PROT_NONE,
+                                   MAP_PRIVATE | MAP_ANONYMOUS |
+                                   MAP_FIXED_NOREPLACE, -1, 0);
 
-        mmap(p.cpu + alloc_size, 1,
-             PROT_NONE, MAP_PRIVATE | MAP_ANONYMOUS | MAP_FIXED_NOREPLACE,
-             -1, 0);
+                if (redzones[i] == MAP_FAILED)
+                        redzones[i] = NULL;
+        }
+}
+
+static void
+free_redzone(struct state *s, void *redzones[2])
+{
+        for (unsigned i = 0; i < 2; ++i) {
+                if (redzones[i])
+                        munmap(redzones[i], s->page_size);
+        }
 }
 
 static bool
@@ -1085,21 +1103,6 @@ cs_init(struct state *s, struct test *t)
         return true;
 }
 
-static struct panfrost_ptr *
-buffers_elem(struct util_dynarray *buffers, unsigned index)
-{
-        unsigned size = util_dynarray_num_elements(buffers,
-                                                   struct panfrost_ptr);
-
-        if (index >= size) {
-                unsigned grow = index + 1 - size;
-
-                memset(util_dynarray_grow(buffers, struct panfrost_ptr, grow),
-                       0, grow * sizeof(struct panfrost_ptr));
-        }
-
-        return util_dynarray_element(buffers, struct panfrost_ptr, index);
-}
 
 static void
 dump_delta(FILE *fp, uint64_t *values, unsigned size)
@@ -1193,42 +1196,80 @@ dump_heatmap(FILE *fp, uint8_t *values, unsigned size,
         fprintf(fp, " %02x\n", sum);
 }
 
-static bool
-cs_test(struct state *s, struct test *t)
+/* A buffer allocated by a command stream script */
+struct cs_buffer {
+        struct panfrost_ptr ptr;
+        uint64_t size;
+
+        /* See alloc_redzone() */
+        void *redzones[2];
+
+        /* In session mode, whether the buffer outlives the script */
+        bool keep;
+};
+
+static struct cs_buffer *
+buffers_elem(struct util_dynarray *buffers, unsigned index)
 {
-        if (s->argc < 2)
-                return true;
+        unsigned size = util_dynarray_num_elements(buffers,
+                                                   struct cs_buffer);
 
-        FILE *f = fopen(s->argv[1], "r");
+        if (index >= size) {
+                unsigned grow = index + 1 - size;
 
-        struct util_dynarray buffers;
-        util_dynarray_init(&buffers, NULL);
+                memset(util_dynarray_grow(buffers, struct cs_buffer, grow),
+                       0, grow * sizeof(struct cs_buffer));
+        }
 
-        for (;;) {
-                char *line = NULL;
-                size_t sz = 0;
-                if (getline(&line, &sz, f) == -1)
-                        break;
+        return util_dynarray_element(buffers, struct cs_buffer, index);
+}
+
+static void
+free_buffer(struct state *s, struct cs_buffer *b)
+{
+        if (!b->ptr.cpu)
+                return;
+
+        pandecode_inject_free(b->ptr.gpu, b->size);
+        munmap(b->ptr.cpu, b->size);
+        free_redzone(s, b->redzones);
+
+        struct kbase_ioctl_mem_free f = { .gpu_addr = b->ptr.gpu };
+        if (ioctl(s->mali_fd, KBASE_IOCTL_MEM_FREE, &f) == -1)
+                perror("ioctl(KBASE_IOCTL_MEM_FREE)");
+
+        memset(b, 0, sizeof(*b));
+}
+
+static void
+cs_run_script(struct state *s, FILE *f, FILE *out, FILE *err,
+              struct util_dynarray *buffers)
+{
+        char *line = NULL;
+        size_t sz = 0;
+
+        while (getline(&line, &sz, f) != -1) {
+                char *cur = line;
 
                 unsigned long src, dst, offset, src_offset, size, iter, flags;
                 unsigned long gran, stride, length;
                 int read;
                 char *mode;
 
-                if (sscanf(line, "rel%ms %lu+%lu %lu+%lu",
+                if (sscanf(cur, "rel%ms %lu+%lu %lu+%lu",
                            &mode, &dst, &offset, &src, &src_offset) == 5) {
 
                         if (strcmp(mode, "oc") && strcmp(mode, "split")) {
-                                fprintf(stderr, "Unknown relocation mode 'rel%s'\n", mode);
+                                fprintf(err, "Unknown relocation mode 'rel%s'\n", mode);
                         }
                         bool split = (mode[0] == 's');
                         free(mode);
 
-                        struct panfrost_ptr *s = buffers_elem(&buffers, src);
-                        struct panfrost_ptr *d = buffers_elem(&buffers, dst);
+                        struct panfrost_ptr *s = &buffers_elem(buffers, src)->ptr;
+                        struct panfrost_ptr *d = &buffers_elem(buffers, dst)->ptr;
 
                         if (!s->gpu || !d->gpu) {
-                                fprintf(stderr, "relocating to buffer that doesn't exist!\n");
+                                fprintf(err, "relocating to buffer that doesn't exist!\n");
                         }
 
                         uint64_t *dest = d->cpu + offset;
@@ -1240,53 +1281,53 @@ cs_test(struct state *s, struct test *t)
                                 *dest |= value;
                         }
 
-                } else if (sscanf(line, "buffer %lu %lu %lx %n",
+                } else if (sscanf(cur, "buffer %lu %lu %lx %n",
                                   &dst, &size, &flags, &read) == 3) {
-                        line += read;
+                        cur += read;
 
-                        struct panfrost_ptr buffer =
-                                alloc_mem(s, ALIGN_POT(size, s->page_size),
-                                          flags);
+                        struct cs_buffer *b = buffers_elem(buffers, dst);
+                        free_buffer(s, b);
 
-                        alloc_redzone(s, buffer, ALIGN_POT(size, s->page_size));
+                        b->size = ALIGN_POT(size, s->page_size);
+                        b->ptr = alloc_mem(s, b->size, flags);
 
-                        *buffers_elem(&buffers, dst) = buffer;
+                        alloc_redzone(s, b->ptr, b->size, b->redzones);
 
-                        uint64_t *fill = buffer.cpu;
+                        uint64_t *fill = b->ptr.cpu;
 
                         for (unsigned i = 0; i < size / 8; ++i) {
                                 read = 0;
                                 unsigned long long val = 0;
-                                if (sscanf(line, "%Lx %n", &val, &read) != 1)
+                                if (sscanf(cur, "%Lx %n", &val, &read) != 1)
                                         break;
-                                line += read;
+                                cur += read;
                                 fill[i] = val;
                         }
 
-                        cache_clean_range(buffer.cpu, size);
+                        cache_clean_range(b->ptr.cpu, size);
 
-                } else if (sscanf(line, "exe %n %lu %lu %lu",
+                } else if (sscanf(cur, "exe %n %lu %lu %lu",
                                   &read, &iter, &dst, &size) == 3) {
-                        line += read;
+                        cur += read;
 
                         unsigned iter_mask = 0;
 
                         for (;;) {
                                 read = 0;
-                                if (sscanf(line, "%lu %lu %lu %n",
+                                if (sscanf(cur, "%lu %lu %lu %n",
                                            &iter, &dst, &size, &read) != 3)
                                         break;
-                                line += read;
+                                cur += read;
 
                                 struct panfrost_ptr *d =
-                                        buffers_elem(&buffers, dst);
+                                        &buffers_elem(buffers, dst)->ptr;
 
                                 /* TODO: Check 'size' against buffer size */
 
                                 pandecode_cs(d->gpu, size, s->gpu_id);
 
                                 if (iter > 3) {
-                                        fprintf(stderr,
+                                        fprintf(err,
                                                 "execute on out-of-bounds "
                                                 "iterator\n");
                                         continue;
@@ -1307,42 +1348,146 @@ cs_test(struct state *s, struct test *t)
                         u_foreach_bit(i, iter_mask)
                                 wait_cs(s, i);
 
-                } else if (sscanf(line, "dump %lu %lu %lu %ms",
+                } else if (sscanf(cur, "dump %lu %lu %lu %ms",
                                   &src, &offset, &size, &mode) == 4) {
 
-                        struct panfrost_ptr *s = buffers_elem(&buffers, src);
+                        struct panfrost_ptr *s = &buffers_elem(buffers, src)->ptr;
 
                         if (!s->gpu)
-                                fprintf(stderr, "dumping buffer that doesn't exist!\n");
+                                fprintf(err, "dumping buffer that doesn't exist!\n");
 
                         if (!strcmp(mode, "hex"))
-                                pan_hexdump(stdout, s->cpu + offset, size, true);
+                                pan_hexdump(out, s->cpu + offset, size, true);
                         else if (!strcmp(mode, "delta"))
-                                dump_delta(stdout, s->cpu + offset, size);
+                                dump_delta(out, s->cpu + offset, size);
                         else if (!strcmp(mode, "tiler"))
-                                dump_tiler(stdout, s->cpu + offset, size);
+                                dump_tiler(out, s->cpu + offset, size);
                         else if (!strcmp(mode, "filehex"))
                                 dump_filehex(s->cpu + offset, size);
 
                         free(mode);
 
-                } else if (sscanf(line, "heatmap %lu %lu %lu %lu %lu %lu",
+                } else if (sscanf(cur, "heatmap %lu %lu %lu %lu %lu %lu",
                                   &src, &offset, &size,
                                   &gran, &length, &stride) == 6) {
 
-                        struct panfrost_ptr *s = buffers_elem(&buffers, src);
+                        struct panfrost_ptr *s = &buffers_elem(buffers, src)->ptr;
 
                         if (!s->gpu)
-                                fprintf(stderr, "dumping buffer that doesn't exist!\n");
+                                fprintf(err, "dumping buffer that doesn't exist!\n");
 
-                        dump_heatmap(stdout, s->cpu + offset, size,
+                        dump_heatmap(out, s->cpu + offset, size,
                                      gran, length, stride);
 
+                } else if (sscanf(cur, "keep %lu", &src) == 1) {
+                        buffers_elem(buffers, src)->keep = true;
+
+                } else if (sscanf(cur, "free %lu", &src) == 1) {
+                        free_buffer(s, buffers_elem(buffers, src));
+
                 } else {
-                        fprintf(stderr, "unknown command '%s'\n", line);
+                        fprintf(err, "unknown command '%s'\n", cur);
                 }
         }
 
+        free(line);
+}
+
+/* Session mode: instead of running a single script and exiting, keep the
+ * device open and run every script written to stdin. Each script is sent as
+ *
+ *   script <length>\n<length bytes of script>
+ *
+ * and answered on stdout with
+ *
+ *   result <length> <ok|exit>\n<length bytes of output>
+ *
+ * where the output contains both the dumps and the error messages of the
+ * script. "exit" means that the queues are running out of space and the
+ * session is ending, so the client needs to start a new one. Buffers marked
+ * with "keep" are not freed at the end of a script, so that e.g. shaders only
+ * need to be uploaded once per session. */
+static bool
+cs_session(struct state *s)
+{
+        struct util_dynarray buffers;
+        util_dynarray_init(&buffers, NULL);
+
+        char *line = NULL;
+        size_t sz = 0;
+        bool more = true;
+
+        while (more && getline(&line, &sz, stdin) != -1) {
+                unsigned long length;
+                if (sscanf(line, "script %lu", &length) != 1) {
+                        fprintf(stderr, "bad session frame '%s'\n", line);
+                        break;
+                }
+
+                /* fmemopen doesn't like zero-length buffers */
+                char *script = malloc(length + 1);
+                if (fread(script, 1, length, stdin) != length) {
+                        free(script);
+                        break;
+                }
+                script[length] = '\n';
+
+                char *reply;
+                size_t reply_size;
+                FILE *in = fmemopen(script, length + 1, "r");
+                FILE *out = open_memstream(&reply, &reply_size);
+
+                cs_run_script(s, in, out, out, &buffers);
+
+                fclose(in);
+                fclose(out);
+                free(script);
+
+                util_dynarray_foreach(&buffers, struct cs_buffer, b) {
+                        if (!b->keep)
+                                free_buffer(s, b);
+                }
+
+                /* Wraparound of the queues isn't handled, so stop while
+                 * there is still space for another script. */
+                for (unsigned i = 0; i < CS_QUEUE_COUNT; ++i) {
+                        if (s->cs_last_submit[i] > CS_QUEUE_SIZE / 2)
+                                more = false;
+                }
+
+                fprintf(s->session, "result %zu %s\n", reply_size,
+                        more ? "ok" : "exit");
+                fwrite(reply, 1, reply_size, s->session);
+                fflush(s->session);
+                free(reply);
+        }
+
+        free(line);
+
+        util_dynarray_foreach(&buffers, struct cs_buffer, b)
+                free_buffer(s, b);
+        util_dynarray_fini(&buffers);
+
+        /* Skip following tests */
+        return false;
+}
+
+static bool
+cs_test(struct state *s, struct test *t)
+{
+        if (s->session)
+                return cs_session(s);
+
+        if (s->argc < 2)
+                return true;
+
+        FILE *f = fopen(s->argv[1], "r");
+
+        struct util_dynarray buffers;
+        util_dynarray_init(&buffers, NULL);
+
+        cs_run_script(s, f, stdout, stderr, &buffers);
+
         /* Skip following tests */
         return false;
 }
@@ -1819,6 +1964,13 @@ main(int argc, char *argv[])
         if (getenv("CSF_QUIET"))
                 pr = false;
 
+        if (argc > 1 && !strcmp(argv[1], "--session")) {
+                /* Keep stdout for the replies, and send anything else which
+                 * would be printed there to stderr instead. */
+                s.session = fdopen(dup(STDOUT_FILENO), "w");
+                dup2(STDERR_FILENO, STDOUT_FILENO);
+        }
+
         if (!strcmp(getenv("TERM"), "dumb"))
                 colour_term = false;
 
@@ -23,7 +23,10 @@
 
 #include <inttypes.h>
 
+#include "util/hash_table.h"
 #include "util/list.h"
+#include "util/ralloc.h"
+#include "util/simple_mtx.h"
 #include "util/u_debug.h"
 #include "util/u_inlines.h"
 #include "util/u_fifo.h"
@@ -241,6 +244,206 @@ static struct u_trace_printer json_printer = {
    .event = &print_json_event,
 };
 
+/*
+ * The binary format is a header followed by records, each made of a
+ * u_trace_binary_record and its data padded to 8 bytes, in host byte
+ * order.  The first event of every tracepoint is preceded by a DEFINE
+ * record, whose data is the string "<name> <payload_sz>" followed by
+ * " <field>:<type>:<offset>:<size>" for every payload field, and whose
+ * tp_id is used by the EVENT records of that tracepoint.  The data of
+ * EVENT records is the raw payload followed by the strings its string
+ * fields point to, so nothing is formatted until the trace is decoded
+ * offline, see utrace_generate_decoder() in u_trace.py.
+ */
+#define U_TRACE_BINARY_MAGIC   "MESAUTRC"
+#define U_TRACE_BINARY_VERSION 1
+
+enum u_trace_binary_record_type {
+   U_TRACE_BINARY_DEFINE,
+   U_TRACE_BINARY_EVENT,
+   U_TRACE_BINARY_END_OF_BATCH,
+   U_TRACE_BINARY_END_OF_FRAME,
+};
+
+struct u_trace_binary_record {
+   uint16_t type;
+   uint16_t tp_id;
+   uint32_t size;
+   uint64_t value;   /* timestamp, batch duration or frame number */
+};
+
+/* All contexts share the trace file, so the tracepoint ids are global: */
+static simple_mtx_t binary_lock = _SIMPLE_MTX_INITIALIZER_NP;
+static struct hash_table *binary_tp_ids;
+
+static void
+print_binary_record(struct u_trace_context *utctx, uint16_t type,
+                    uint16_t tp_id, uint64_t value,
+                    const void *data, uint32_t size)
+{
+   struct u_trace_binary_record record = {
+      .type = type,
+      .tp_id = tp_id,
+      .size = ALIGN_POT(size, 8),
+      .value = value,
+   };
+   uint8_t stack_buf[sizeof(record) + PAYLOAD_BUFFER_SIZE];
+   uint8_t *buf = stack_buf;
+
+   if (record.size > PAYLOAD_BUFFER_SIZE)
+      buf = malloc(sizeof(record) + record.size);
+
+   /* Write every record with a single fwrite(), so that the records of
+    * contexts sharing the trace file don't interleave.
+    */
+   memcpy(buf, &record, sizeof(record));
+   if (size > 0)
+      memcpy(buf + sizeof(record), data, size);
+   memset(buf + sizeof(record) + size, 0, record.size - size);
+   fwrite(buf, sizeof(record) + record.size, 1, utctx->out);
+
+   if (buf != stack_buf)
+      free(buf);
+}
+
+static uint16_t
+binary_tp_id(struct u_trace_context *utctx, const struct u_tracepoint *tp)
+{
+   simple_mtx_lock(&binary_lock);
+
+   struct hash_entry *entry = _mesa_hash_table_search(binary_tp_ids, tp);
+   uint16_t tp_id;
+   if (entry) {
+      tp_id = (uintptr_t)entry->data;
+   } else {
+      tp_id = binary_tp_ids->entries;
+
+      char *desc = ralloc_asprintf(NULL, "%s %u", tp->name, tp->payload_sz);
+      for (unsigned i = 0; i < tp->num_fields; i++) {
+         const struct u_tracepoint_field *field = &tp->fields[i];
+         ralloc_asprintf_append(&desc, " %s:%c:%u:%u", field->name,
+                                field->type, field->offset, field->size);
+      }
+      print_binary_record(utctx, U_TRACE_BINARY_DEFINE, tp_id, 0,
+                          desc, strlen(desc) + 1);
+      ralloc_free(desc);
+
+      _mesa_hash_table_insert(binary_tp_ids, tp, (void *)(uintptr_t)tp_id);
+   }
+
+   simple_mtx_unlock(&binary_lock);
+
+   return tp_id;
+}
+
+static void
+print_binary_start(struct u_trace_context *utctx)
+{
+   simple_mtx_lock(&binary_lock);
+   if (!binary_tp_ids) {
+      struct {
+         char magic[8];
+         uint32_t version;
+         uint32_t byte_order;
+      } header = {
+         .magic = U_TRACE_BINARY_MAGIC,
+         .version = U_TRACE_BINARY_VERSION,
+         .byte_order = 0x01020304,
+      };
+      fwrite(&header, sizeof(header), 1, utctx->out);
+      binary_tp_ids = _mesa_pointer_hash_table_create(NULL);
+   }
+   simple_mtx_unlock(&binary_lock);
+}
+
+static void
+print_binary_end_of_frame(struct u_trace_context *utctx)
+{
+   print_binary_record(utctx, U_TRACE_BINARY_END_OF_FRAME, 0,
+                       utctx->frame_nr, NULL, 0);
+   fflush(utctx->out);
+}
+
+static void
+print_binary_end_of_batch(struct u_trace_context *utctx)
+{
+   uint64_t elapsed = utctx->last_time_ns - utctx->first_time_ns;
+   print_binary_record(utctx, U_TRACE_BINARY_END_OF_BATCH, 0,
+                       elapsed, NULL, 0);
+}
+
+static const char *
+binary_string_field(const void *payload, const struct u_tracepoint_field *field)
+{
+   const char *str;
+   memcpy(&str, (const uint8_t *)payload + field->offset, sizeof(str));
+   return str;
+}
+
+static void
+print_binary_event(struct u_trace_context *utctx,
+                   struct u_trace_chunk *chunk,
+                   const struct u_trace_event *evt,
+                   uint64_t ns, int32_t delta)
+{
+   const struct u_tracepoint *tp = evt->tp;
+   uint16_t tp_id = binary_tp_id(utctx, tp);
+   uint32_t size = tp->payload_sz;
+
+   for (unsigned i = 0; i < tp->num_fields; i++) {
+      if (tp->fields[i].type == 's') {
+         const char *str = binary_string_field(evt->payload, &tp->fields[i]);
+         size += sizeof(uint32_t) + (str ? strlen(str) : 0);
+      }
+   }
+
+   if (size == tp->payload_sz) {
+      print_binary_record(utctx, U_TRACE_BINARY_EVENT, tp_id, ns,
+                          evt->payload, size);
+      return;
+   }
+
+   /* The strings are only pointers in the payload, so append them to it,
+    * each as a uint32_t length (UINT32_MAX for NULL) and its characters.
+    */
+   uint8_t stack_buf[PAYLOAD_BUFFER_SIZE];
+   uint8_t *buf = stack_buf;
+
+   if (size > PAYLOAD_BUFFER_SIZE)
+      buf = malloc(size);
+
+   memcpy(buf, evt->payload, tp->payload_sz);
+   uint8_t *cur = buf + tp->payload_sz;
+   for (unsigned i = 0; i < tp->num_fields; i++) {
+      if (tp->fields[i].type != 's')
+         continue;
+
+      const char *str = binary_string_field(evt->payload, &tp->fields[i]);
+      uint32_t len = str ? strlen(str) : UINT32_MAX;
+      memcpy(cur, &len, sizeof(len));
+      cur += sizeof(len);
+      if (str) {
+         memcpy(cur, str, len);
+         cur += len;
+      }
+   }
+
+   print_binary_record(utctx, U_TRACE_BINARY_EVENT, tp_id, ns, buf, size);
+
+   if (buf != stack_buf)
+      free(buf);
+}
+
+static struct u_trace_printer binary_printer = {
+   .start = &print_binary_start,
+   .end = &print_txt_start,
+   .start_of_frame = &print_txt_start,
+   .end_of_frame = &print_binary_end_of_frame,
+   .start_of_batch = &print_txt_start,
+   .end_of_batch = &print_binary_end_of_batch,
+   .event = &print_binary_event,
+};
+
 static struct u_trace_payload_buf *
 u_trace_payload_buf_create(void)
 {
@@ -422,6 +625,8 @@ u_trace_context_init(struct u_trace_context *utctx,
    const char *trace_format = debug_get_option_trace_format();
    if (strcmp(trace_format, "json") == 0) {
       utctx->out_printer = &json_printer;
+   } else if (strcmp(trace_format, "binary") == 0) {
+      utctx->out_printer = &binary_printer;
    } else {
       utctx->out_printer = &txt_printer;
    }
@@ -25,6 +25,7 @@ from mako.template import Template
 from collections import namedtuple
 from enum import IntEnum
 import os
+import re
 
 TRACEPOINTS = {}
 TRACEPOINTS_TOGGLES = {}
@@ -67,6 +68,40 @@ class Tracepoint(object):
     def can_generate_print(self):
         return self.args is not None and len(self.args) > 0
 
+    def py_print(self):
+        """tp_print for decoded binary traces, as a Python format and the
+        names of the payload fields it prints, or None if some of its
+        arguments are more than a payload field or a function of one.
+        Fields given to a function are printed as their raw value, and
+        %p fields as 0x... or (nil), like glibc's printf() does.
+        """
+        if self.tp_print is None:
+            return None
+
+        names = [arg.name for arg in self.tp_struct]
+        args = []
+        for expr in self.tp_print[1:]:
+            m = re.fullmatch(r'__entry->(\w+)|'
+                             r'\w+\(__entry->(\w+)(,[^()]*)?\)(->\w+)?',
+                             expr.strip())
+            if m is None or (m.group(1) or m.group(2)) not in names:
+                return None
+            args.append(m.group(1) or m.group(2))
+
+        convs = []
+        def conv(m):
+            if m.group(2) == '%':
+                return '%%'
+            convs.append(m.group(2))
+            if m.group(2) == 'p':
+                return '%s'
+            return m.group(1) + m.group(2)
+        fmt = re.sub(r'(%[-+ #0]*\d*(?:\.\d+)?)(?:hh|h|ll|l|z|j|t)?'
+                     r'([diouxXcsp%])', conv, self.tp_print[0])
+        if len(convs) != len(args):
+            return None
+        return fmt, [(arg, conv == 'p') for arg, conv in zip(args, convs)]
+
     def enabled_expr(self, trace_toggle_name):
         if trace_toggle_name is None:
             return "true"
@@ -116,6 +151,37 @@ class TracepointArg(object):
         self.name = name
         self.to_prim_type = to_prim_type
 
+    def field_type(self):
+        """Type of the field in binary traces, see u_tracepoint_field."""
+        if re.fullmatch(r'(const )?char ?\*', self.type):
+            return 's'
+        if self.type.endswith('*'):
+            return 'p'
+        if self.type.startswith('enum ') or self.type.startswith('Vk'):
+            return 'e'
+        return FIELD_TYPES.get(self.type, 'x')
+
+    def py_format(self):
+        """Python format of the field for decoded binary traces, which
+        have the raw value rather than what to_prim_type makes of it.
+        """
+        field_type = self.field_type()
+        if field_type == 'p':
+            return '0x%x'
+        if field_type in ('s', 'x'):
+            return '%s'
+        c_format = re.sub(r'%(hh|h|ll|l|z|j)', '%', self.c_format)
+        if self.to_prim_type is not None or '%s' in c_format:
+            return '%d'
+        return c_format
+
+FIELD_TYPES = {
+    'bool': 'b',
+    'int': 'i', 'int8_t': 'i', 'int16_t': 'i', 'int32_t': 'i', 'int64_t': 'i',
+    'unsigned': 'u', 'uint8_t': 'u', 'uint16_t': 'u', 'uint32_t': 'u',
+    'uint64_t': 'u',
+}
+
 
 HEADERS = []
 
@@ -405,12 +471,25 @@ static void __print_json_${trace_name}(FILE *out, const void *arg) {
 #define __print_${trace_name} NULL
 #define __print_json_${trace_name} NULL
  % endif
+ % if len(trace.tp_struct) > 0:
+static const struct u_tracepoint_field __fields_${trace_name}[] = {
+  % for arg in trace.tp_struct:
+   { "${arg.name}", '${arg.field_type()}',
+     sizeof(((struct trace_${trace_name} *)0)->${arg.name}),
+     offsetof(struct trace_${trace_name}, ${arg.name}) },
+  % endfor
+};
+ % else:
+#define __fields_${trace_name} NULL
+ % endif
 static const struct u_tracepoint __tp_${trace_name} = {
     ALIGN_POT(sizeof(struct trace_${trace_name}), 8),   /* keep size 64b aligned */
     "${trace_name}",
     ${"true" if trace.end_of_pipe else "false"},
     __print_${trace_name},
     __print_json_${trace_name},
+    ${len(trace.tp_struct)},
+    __fields_${trace_name},
  % if trace.tp_perfetto is not None:
 #ifdef HAVE_PERFETTO
     (void (*)(void *pctx, uint64_t, const void *, const void *))${trace.tp_perfetto},
@@ -550,3 +629,279 @@ def utrace_generate_perfetto_utils(hpath):
             f.write(Template(perfetto_utils_hdr_template, output_encoding='utf-8').render(
                 hdrname=hdr.rstrip('.h').upper(),
                 TRACEPOINTS=TRACEPOINTS))
+
+
+decoder_template = """\
+#!/usr/bin/env python3
+#
+# Generated by u_trace.py, do not edit.
+#
+# SPDX-License-Identifier: MIT
+
+\"\"\"Decode binary u_trace traces into NumPy structured arrays.
+
+With GPU_TRACE_FORMAT=binary, u_trace writes the raw tracepoint payloads
+to GPU_TRACEFILE instead of formatting them.  As the trace describes the
+payload layout of its tracepoints, this decodes the tracepoints of any
+driver.  The ones this was generated for are printed like the txt format
+does, with their tp_print in PRINTS or else the formats of their fields in
+FORMATS, e.g.
+
+  ./${modname}.py trace.bin
+  ./${modname}.py trace.bin --npz trace.npz
+\"\"\"
+
+import argparse
+import struct
+import sys
+
+import numpy as np
+
+MAGIC = b'MESAUTRC'
+VERSION = 1
+DEFINE, EVENT, END_OF_BATCH, END_OF_FRAME = range(4)
+
+FORMATS = {
+% for trace_name, trace in TRACEPOINTS.items():
+    '${trace_name}': {
+%    for arg in trace.tp_struct:
+        '${arg.name}': '${arg.py_format()}',
+%    endfor
+    },
+% endfor
+}
+
+# tp_print of the tracepoints, see Tracepoint.py_print()
+PRINTS = {
+% for trace_name, trace in TRACEPOINTS.items():
+%    if trace.py_print() is not None:
+    '${trace_name}': (${repr(trace.py_print()[0])},
+        ${repr(trace.py_print()[1])}),
+%    endif
+% endfor
+}
+
+DEFAULT_FORMATS = {'u': '%u', 'i': '%d', 'b': '%u', 'e': '%d', 'p': '0x%x',
+                   's': '%s', 'x': '%s'}
+
+
+class Tracepoint:
+    \"\"\"Payload layout of a tracepoint, from its DEFINE record.\"\"\"
+
+    def __init__(self, desc, byte_order):
+        name, payload_sz, *fields = desc.split(' ')
+        self.name = name
+        self.payload_sz = int(payload_sz)
+        self.fields = []
+        for field in fields:
+            field_name, field_type, offset, size = field.split(':')
+            self.fields.append((field_name, field_type, int(offset), int(size)))
+
+        # Strings are appended to the payload, see strings()
+        self.string_fields = [field[0] for field in self.fields
+                              if field[1] == 's']
+        self.byte_order = byte_order
+
+        formats = []
+        for _, field_type, _, size in self.fields:
+            if field_type == 'b':
+                formats.append('?')
+            elif field_type in ('s', 'x'):
+                formats.append('V%d' % size)
+            else:
+                kind = 'i' if field_type == 'i' else 'u'
+                formats.append('%s%s%d' % (byte_order, kind, size))
+        self.dtype = np.dtype({
+            'names': [field[0] for field in self.fields],
+            'formats': formats,
+            'offsets': [field[2] for field in self.fields],
+            'itemsize': self.payload_sz,
+        })
+
+        known = FORMATS.get(name, {})
+        self.format = ''.join(
+            '%s=%s, ' % (field_name,
+                         known.get(field_name, DEFAULT_FORMATS[field_type]))
+            for field_name, field_type, _, _ in self.fields)
+
+        # Unless the fields of the trace don't match the ones of PRINTS
+        self.print = PRINTS.get(name)
+        if self.print is not None and \
+           not {arg for arg, _ in self.print[1]} <= set(self.dtype.names):
+            self.print = None
+
+    def strings(self, payload):
+        \"\"\"Return the strings of an event, which follow its payload as
+        uint32_t lengths (0xffffffff for NULL) and characters, in a dict.
+        \"\"\"
+        strings = {}
+        offset = self.payload_sz
+        for name in self.string_fields:
+            length, = struct.unpack_from(self.byte_order + 'I', payload, offset)
+            offset += 4
+            if length == 0xffffffff:
+                strings[name] = None
+            else:
+                strings[name] = payload[offset:offset + length].decode(
+                    errors='replace')
+                offset += length
+        return strings
+
+    def values(self, payload):
+        entry = np.frombuffer(payload[:self.payload_sz], self.dtype, count=1)[0]
+        strings = self.strings(payload)
+        values = []
+        for value, (name, field_type, _, _) in zip(entry, self.fields):
+            if field_type == 's':
+                value = strings[name]
+                # Like glibc's printf()
+                value = '(null)' if value is None else value
+            elif field_type == 'x':
+                value = bytes(value).hex()
+            values.append(value)
+        return tuple(values)
+
+    def text(self, payload):
+        \"\"\"Format the payload of an event like the txt format does.\"\"\"
+        values = self.values(payload)
+        if self.print is None:
+            return self.format % values
+
+        fmt, args = self.print
+        values = dict(zip((field[0] for field in self.fields), values))
+        return fmt % tuple(
+            ('0x%x' % values[arg] if values[arg] else '(nil)') if pointer
+            else values[arg] for arg, pointer in args)
+
+
+def records(data):
+    \"\"\"Yield the records of a binary trace, as (type, tracepoint,
+    value, data) tuples, where tracepoint is the Tracepoint of EVENT
+    records.
+    \"\"\"
+    byte_order = '='
+    if struct.unpack_from('=I', data, 12)[0] != 0x01020304:
+        byte_order = '>' if sys.byteorder == 'little' else '<'
+    magic, version = struct.unpack_from(byte_order + '8sI', data)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError('not a version %d u_trace binary trace' % VERSION)
+    record = struct.Struct(byte_order + 'HHIQ')
+
+    tracepoints = {}
+    offset = 16
+    while offset + record.size <= len(data):
+        type, tp_id, size, value = record.unpack_from(data, offset)
+        offset += record.size
+        payload = data[offset:offset + size]
+        offset += size
+
+        if type == DEFINE:
+            desc = payload.split(b'\\0', 1)[0].decode()
+            tracepoints[tp_id] = Tracepoint(desc, byte_order)
+            continue
+        yield type, tracepoints.get(tp_id), value, payload
+
+
+def decode(data):
+    \"\"\"Decode a binary trace into a dict of structured arrays, one per
+    tracepoint, with the payload fields of every event.  The frame and
+    batch numbers and the timestamp of the events are in the _frame,
+    _batch and _time_ns fields, so that they can't clash with payload
+    fields.
+    \"\"\"
+    events = {}
+    frame = batch = 0
+    for type, tp, value, payload in records(data):
+        if type == EVENT:
+            tp_events = events.setdefault(tp.name, (tp, [], [], []))
+            tp_events[1].append((frame, batch, value))
+            tp_events[2].append(payload[:tp.payload_sz])
+            if tp.string_fields:
+                tp_events[3].append(tp.strings(payload))
+        elif type == END_OF_BATCH:
+            batch += 1
+        elif type == END_OF_FRAME:
+            frame += 1
+            batch = 0
+
+    arrays = {}
+    for name, (tp, times, payloads, strings) in events.items():
+        times = np.array(times, [('_frame', 'u4'), ('_batch', 'u4'),
+                                 ('_time_ns', 'u8')])
+        # NULL strings become empty ones
+        strings = {field: np.array([s[field] or '' for s in strings], 'U')
+                   for field in tp.string_fields}
+        array = np.empty(len(times), times.dtype.descr +
+                         [(field, strings[field].dtype if field in strings
+                                  else tp.dtype[field])
+                          for field in tp.dtype.names])
+        for field in times.dtype.names:
+            array[field] = times[field]
+        if tp.fields:
+            payload = np.frombuffer(b''.join(payloads), tp.dtype)
+            for field in tp.dtype.names:
+                array[field] = strings[field] if field in strings \
+                    else payload[field]
+        arrays[name] = array
+    return arrays
+
+
+def print_txt(data, out):
+    \"\"\"Print a binary trace like GPU_TRACE_FORMAT=txt does.\"\"\"
+    in_batch = False
+    last_ns = 0
+    for type, tp, value, payload in records(data):
+        if not in_batch and type in (EVENT, END_OF_BATCH):
+            out.write('+----- NS -----+ +-- \\u0394 --+  +----- MSG -----\\n')
+            in_batch = True
+            last_ns = 0
+
+        if type == EVENT:
+            delta = value - last_ns if last_ns else 0
+            last_ns = value
+            if tp.fields:
+                out.write('%016u %+9d: %s: %s\\n' % (
+                    value, delta, tp.name, tp.text(payload)))
+            else:
+                out.write('%016u %+9d: %s\\n' % (value, delta, tp.name))
+        elif type == END_OF_BATCH:
+            out.write('ELAPSED: %u ns\\n' % value)
+            in_batch = False
+        elif type == END_OF_FRAME:
+            out.write('END OF FRAME %u\\n' % value)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('trace', help='binary trace file')
+    parser.add_argument('--npz', metavar='FILE',
+                        help='save the events of every tracepoint as arrays '
+                             'to FILE instead of printing them')
+    args = parser.parse_args()
+
+    with open(args.trace, 'rb') as f:
+        data = f.read()
+
+    if args.npz:
+        np.savez(args.npz, **decode(data))
+    else:
+        print_txt(data, sys.stdout)
+
+
+if __name__ == '__main__':
+    main()
+"""
+
+def utrace_generate_decoder(pypath):
+    """Parameters:
+
+    - pypath: python module to generate, which decodes binary traces
+      (GPU_TRACE_FORMAT=binary) into NumPy arrays offline.
+    """
+    if pypath is not None:
+        modname = os.path.basename(pypath).rsplit('.', 1)[0]
+        with open(pypath, 'wb') as f:
+            f.write(Template(decoder_template, output_encoding='utf-8').render(
+                modname=modname,
+                TRACEPOINTS=TRACEPOINTS))
+        os.chmod(pypath, 0o755)
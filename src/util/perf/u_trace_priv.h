@@ -28,6 +28,7 @@
 #ifndef _U_TRACE_PRIV_H
 #define _U_TRACE_PRIV_H
 
+#include <stddef.h>
 #include <stdio.h>
 
 #include "u_trace.h"
@@ -36,6 +37,20 @@
  * Internal interface used by generated tracepoints
  */
 
+/**
+ * Layout of a tracepoint payload field, written to binary traces so
+ * they can be decoded offline.
+ */
+struct u_tracepoint_field {
+   const char *name;
+   /* 'u', 'i', 'b', 'e', 'p', 's' or 'x' for unsigned, signed, bool,
+    * enum, pointer, string or opaque fields.
+    */
+   char type;
+   uint8_t size;
+   uint16_t offset;
+};
+
 /**
  * Tracepoint descriptor.
  */
@@ -45,6 +60,8 @@ struct u_tracepoint {
    bool end_of_pipe;
    void (*print)(FILE *out, const void *payload);
    void (*print_json)(FILE *out, const void *payload);
+   unsigned num_fields;
+   const struct u_tracepoint_field *fields;
 #ifdef HAVE_PERFETTO
    /**
     * Callback to emit a perfetto event, such as render-stage trace
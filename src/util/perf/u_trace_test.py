@@ -0,0 +1,125 @@
+# SPDX-License-Identifier: MIT
+
+"""Tests for the decoders of binary u_trace traces generated by u_trace.py."""
+
+import importlib.util
+import io
+import os
+import struct
+import subprocess
+import sys
+
+import pytest
+
+PERF_DIR = os.path.dirname(os.path.abspath(__file__))
+SRC_DIR = os.path.dirname(os.path.dirname(PERF_DIR))
+
+TRACEPOINT_SCRIPTS = [
+    'freedreno/vulkan/tu_tracepoints.py',
+    'gallium/auxiliary/util/u_tracepoints.py',
+    'gallium/drivers/freedreno/freedreno_tracepoints.py',
+    'intel/ds/intel_tracepoints.py',
+]
+
+DEFINE, EVENT, END_OF_BATCH, END_OF_FRAME = range(4)
+
+
+def generate_decoder(script, outdir):
+    name = os.path.basename(script).rsplit('.', 1)[0] + '_decode'
+    path = os.path.join(outdir, name + '.py')
+    subprocess.run([sys.executable, os.path.join(SRC_DIR, script),
+                    '-p', PERF_DIR, '--decoder', path], check=True)
+
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def record(type, tp_id=0, value=0, data=b''):
+    size = (len(data) + 7) & ~7
+    return struct.pack('=HHIQ', type, tp_id, size, value) + \
+        data.ljust(size, b'\0')
+
+
+def trace(*records):
+    return struct.pack('=8sII', b'MESAUTRC', 1, 0x01020304) + b''.join(records)
+
+
+@pytest.mark.parametrize('script', TRACEPOINT_SCRIPTS)
+def test_generate(script, tmp_path):
+    decoder = generate_decoder(script, str(tmp_path))
+    assert decoder.FORMATS
+
+
+class TestFreedreno:
+
+    @pytest.fixture
+    def decoder(self, tmp_path):
+        pytest.importorskip('numpy')
+        return generate_decoder(
+            'gallium/drivers/freedreno/freedreno_tracepoints.py',
+            str(tmp_path))
+
+    @pytest.fixture
+    def data(self):
+        desc = b'flush_batch 16 batch:p:0:8 cleared:u:8:2 ' \
+               b'gmem_reason:u:10:2 num_draws:u:12:2\0'
+        payload = struct.pack('=QHHH', 0xdeadbeef00, 0x3, 0x10, 42)
+        return trace(record(DEFINE, 0, 0, desc),
+                     record(EVENT, 0, 1000, payload),
+                     record(END_OF_BATCH, 0, 500),
+                     record(EVENT, 0, 2000, payload),
+                     record(END_OF_FRAME, 0, 0))
+
+    def test_decode(self, decoder, data):
+        # flush_batch has a batch field, besides the batch number of events
+        events = decoder.decode(data)['flush_batch']
+        assert list(events['_batch']) == [0, 1]
+        assert list(events['_time_ns']) == [1000, 2000]
+        assert list(events['batch']) == [0xdeadbeef00] * 2
+        assert list(events['num_draws']) == [42] * 2
+
+    def test_print_txt(self, decoder, data):
+        # Printed with the tp_print of flush_batch, as trace-parser.py wants
+        out = io.StringIO()
+        decoder.print_txt(data, out)
+        lines = out.getvalue().splitlines()
+        assert lines[1] == '0000000000001000        +0: flush_batch: ' \
+                           '0xdeadbeef00: cleared=3, gmem_reason=10, ' \
+                           'num_draws=42'
+        assert lines[2] == 'ELAPSED: 500 ns'
+        assert lines[-1] == 'END OF FRAME 0'
+
+
+class TestStrings:
+
+    @pytest.fixture
+    def decoder(self, tmp_path):
+        pytest.importorskip('numpy')
+        return generate_decoder('gallium/auxiliary/util/u_tracepoints.py',
+                                str(tmp_path))
+
+    @pytest.fixture
+    def data(self):
+        desc = b'surface 16 width:u:0:2 height:u:2:2 nr_samples:u:4:1 ' \
+               b'format:s:8:8\0'
+        payload = struct.pack('=HHBxxxQ', 64, 32, 4, 0x1234)
+        return trace(record(DEFINE, 0, 0, desc),
+                     record(EVENT, 0, 1000,
+                            payload + struct.pack('=I', 6) + b'R8G8B8'),
+                     record(EVENT, 0, 2000,
+                            payload + struct.pack('=I', 0xffffffff)),
+                     record(END_OF_BATCH, 0, 1000))
+
+    def test_decode(self, decoder, data):
+        events = decoder.decode(data)['surface']
+        assert list(events['format']) == ['R8G8B8', '']
+        assert list(events['width']) == [64, 64]
+
+    def test_print_txt(self, decoder, data):
+        out = io.StringIO()
+        decoder.print_txt(data, out)
+        lines = out.getvalue().splitlines()
+        assert lines[1].endswith(': surface: 64x32@4, fmt=R8G8B8')
+        assert lines[2].endswith(': surface: 64x32@4, fmt=(null)')
@@ -40,8 +40,7 @@ vk_cmd_enqueue_CmdDrawMultiEXT(VkCommandBuffer commandBuffer,
    VK_FROM_HANDLE(vk_command_buffer, cmd_buffer, commandBuffer);
 
    struct vk_cmd_queue_entry *cmd =
-      vk_zalloc(cmd_buffer->cmd_queue.alloc, sizeof(*cmd), 8,
-                VK_SYSTEM_ALLOCATION_SCOPE_OBJECT);
+      vk_cmd_queue_zalloc(&cmd_buffer->cmd_queue, sizeof(*cmd));
    if (!cmd)
       return;
 
@@ -52,9 +51,8 @@ vk_cmd_enqueue_CmdDrawMultiEXT(VkCommandBuffer commandBuffer,
    if (pVertexInfo) {
       unsigned i = 0;
       cmd->u.draw_multi_ext.vertex_info =
-         vk_zalloc(cmd_buffer->cmd_queue.alloc,
-                   sizeof(*cmd->u.draw_multi_ext.vertex_info) * drawCount, 8,
-                   VK_SYSTEM_ALLOCATION_SCOPE_OBJECT);
+         vk_cmd_queue_zalloc(&cmd_buffer->cmd_queue,
+                             sizeof(*cmd->u.draw_multi_ext.vertex_info) * drawCount);
 
       vk_foreach_multi_draw(draw, i, pVertexInfo, drawCount, stride) {
          memcpy(&cmd->u.draw_multi_ext.vertex_info[i], draw,
@@ -78,8 +76,7 @@ vk_cmd_enqueue_CmdDrawMultiIndexedEXT(VkCommandBuffer commandBuffer,
    VK_FROM_HANDLE(vk_command_buffer, cmd_buffer, commandBuffer);
 
    struct vk_cmd_queue_entry *cmd =
-      vk_zalloc(cmd_buffer->cmd_queue.alloc, sizeof(*cmd), 8,
-                VK_SYSTEM_ALLOCATION_SCOPE_OBJECT);
+      vk_cmd_queue_zalloc(&cmd_buffer->cmd_queue, sizeof(*cmd));
    if (!cmd)
       return;
 
@@ -91,9 +88,8 @@ vk_cmd_enqueue_CmdDrawMultiIndexedEXT(VkCommandBuffer commandBuffer,
    if (pIndexInfo) {
       unsigned i = 0;
       cmd->u.draw_multi_indexed_ext.index_info =
-         vk_zalloc(cmd_buffer->cmd_queue.alloc,
-                   sizeof(*cmd->u.draw_multi_indexed_ext.index_info) * drawCount, 8,
-                   VK_SYSTEM_ALLOCATION_SCOPE_OBJECT);
+         vk_cmd_queue_zalloc(&cmd_buffer->cmd_queue,
+                             sizeof(*cmd->u.draw_multi_indexed_ext.index_info) * drawCount);
 
       vk_foreach_multi_draw_indexed(draw, i, pIndexInfo, drawCount, stride) {
          cmd->u.draw_multi_indexed_ext.index_info[i].firstIndex = draw->firstIndex;
@@ -109,9 +105,8 @@ vk_cmd_enqueue_CmdDrawMultiIndexedEXT(VkCommandBuffer commandBuffer,
 
    if (pVertexOffset) {
       cmd->u.draw_multi_indexed_ext.vertex_offset =
-         vk_zalloc(cmd_buffer->cmd_queue.alloc,
-                   sizeof(*cmd->u.draw_multi_indexed_ext.vertex_offset), 8,
-                   VK_SYSTEM_ALLOCATION_SCOPE_OBJECT);
+         vk_cmd_queue_zalloc(&cmd_buffer->cmd_queue,
+                             sizeof(*cmd->u.draw_multi_indexed_ext.vertex_offset));
 
       memcpy(cmd->u.draw_multi_indexed_ext.vertex_offset, pVertexOffset,
              sizeof(*cmd->u.draw_multi_indexed_ext.vertex_offset));
@@ -130,8 +125,7 @@ vk_cmd_enqueue_CmdPushDescriptorSetKHR(VkCommandBuffer commandBuffer,
    struct vk_cmd_push_descriptor_set_khr *pds;
 
    struct vk_cmd_queue_entry *cmd =
-      vk_zalloc(cmd_buffer->cmd_queue.alloc, sizeof(*cmd), 8,
-                VK_SYSTEM_ALLOCATION_SCOPE_OBJECT);
+      vk_cmd_queue_zalloc(&cmd_buffer->cmd_queue, sizeof(*cmd));
    if (!cmd)
       return;
 
@@ -147,9 +141,8 @@ vk_cmd_enqueue_CmdPushDescriptorSetKHR(VkCommandBuffer commandBuffer,
 
    if (pDescriptorWrites) {
       pds->descriptor_writes =
-         vk_zalloc(cmd_buffer->cmd_queue.alloc,
-                   sizeof(*pds->descriptor_writes) * descriptorWriteCount, 8,
-                   VK_SYSTEM_ALLOCATION_SCOPE_OBJECT);
+         vk_cmd_queue_zalloc(&cmd_buffer->cmd_queue,
+                             sizeof(*pds->descriptor_writes) * descriptorWriteCount);
       memcpy(pds->descriptor_writes,
              pDescriptorWrites,
              sizeof(*pds->descriptor_writes) * descriptorWriteCount);
@@ -162,9 +155,8 @@ vk_cmd_enqueue_CmdPushDescriptorSetKHR(VkCommandBuffer commandBuffer,
          case VK_DESCRIPTOR_TYPE_STORAGE_IMAGE:
          case VK_DESCRIPTOR_TYPE_INPUT_ATTACHMENT:
             pds->descriptor_writes[i].pImageInfo =
-               vk_zalloc(cmd_buffer->cmd_queue.alloc,
-                         sizeof(VkDescriptorImageInfo) * pds->descriptor_writes[i].descriptorCount, 8,
-                         VK_SYSTEM_ALLOCATION_SCOPE_OBJECT);
+               vk_cmd_queue_zalloc(&cmd_buffer->cmd_queue,
+                                   sizeof(VkDescriptorImageInfo) * pds->descriptor_writes[i].descriptorCount);
             memcpy((VkDescriptorImageInfo *)pds->descriptor_writes[i].pImageInfo,
                    pDescriptorWrites[i].pImageInfo,
                    sizeof(VkDescriptorImageInfo) * pds->descriptor_writes[i].descriptorCount);
@@ -172,9 +164,8 @@ vk_cmd_enqueue_CmdPushDescriptorSetKHR(VkCommandBuffer commandBuffer,
          case VK_DESCRIPTOR_TYPE_UNIFORM_TEXEL_BUFFER:
          case VK_DESCRIPTOR_TYPE_STORAGE_TEXEL_BUFFER:
             pds->descriptor_writes[i].pTexelBufferView =
-               vk_zalloc(cmd_buffer->cmd_queue.alloc,
-                         sizeof(VkBufferView) * pds->descriptor_writes[i].descriptorCount, 8,
-                         VK_SYSTEM_ALLOCATION_SCOPE_OBJECT);
+               vk_cmd_queue_zalloc(&cmd_buffer->cmd_queue,
+                                   sizeof(VkBufferView) * pds->descriptor_writes[i].descriptorCount);
             memcpy((VkBufferView *)pds->descriptor_writes[i].pTexelBufferView,
                    pDescriptorWrites[i].pTexelBufferView,
                    sizeof(VkBufferView) * pds->descriptor_writes[i].descriptorCount);
@@ -185,9 +176,8 @@ vk_cmd_enqueue_CmdPushDescriptorSetKHR(VkCommandBuffer commandBuffer,
          case VK_DESCRIPTOR_TYPE_STORAGE_BUFFER_DYNAMIC:
          default:
             pds->descriptor_writes[i].pBufferInfo =
-               vk_zalloc(cmd_buffer->cmd_queue.alloc,
-                         sizeof(VkDescriptorBufferInfo) * pds->descriptor_writes[i].descriptorCount, 8,
-                         VK_SYSTEM_ALLOCATION_SCOPE_OBJECT);
+               vk_cmd_queue_zalloc(&cmd_buffer->cmd_queue,
+                                   sizeof(VkDescriptorBufferInfo) * pds->descriptor_writes[i].descriptorCount);
             memcpy((VkDescriptorBufferInfo *)pds->descriptor_writes[i].pBufferInfo,
                    pDescriptorWrites[i].pBufferInfo,
                    sizeof(VkDescriptorBufferInfo) * pds->descriptor_writes[i].descriptorCount);
@@ -224,8 +214,7 @@ vk_cmd_enqueue_CmdBindDescriptorSets(VkCommandBuffer commandBuffer,
    VK_FROM_HANDLE(vk_command_buffer, cmd_buffer, commandBuffer);
 
    struct vk_cmd_queue_entry *cmd =
-      vk_zalloc(cmd_buffer->cmd_queue.alloc, sizeof(*cmd), 8,
-                VK_SYSTEM_ALLOCATION_SCOPE_OBJECT);
+      vk_cmd_queue_zalloc(&cmd_buffer->cmd_queue, sizeof(*cmd));
    if (!cmd)
       return;
 
@@ -245,9 +234,8 @@ vk_cmd_enqueue_CmdBindDescriptorSets(VkCommandBuffer commandBuffer,
    cmd->u.bind_descriptor_sets.descriptor_set_count = descriptorSetCount;
    if (pDescriptorSets) {
       cmd->u.bind_descriptor_sets.descriptor_sets =
-         vk_zalloc(cmd_buffer->cmd_queue.alloc,
-                   sizeof(*cmd->u.bind_descriptor_sets.descriptor_sets) * descriptorSetCount, 8,
-                   VK_SYSTEM_ALLOCATION_SCOPE_OBJECT);
+         vk_cmd_queue_zalloc(&cmd_buffer->cmd_queue,
+                             sizeof(*cmd->u.bind_descriptor_sets.descriptor_sets) * descriptorSetCount);
 
       memcpy(cmd->u.bind_descriptor_sets.descriptor_sets, pDescriptorSets,
              sizeof(*cmd->u.bind_descriptor_sets.descriptor_sets) * descriptorSetCount);
@@ -255,9 +243,8 @@ vk_cmd_enqueue_CmdBindDescriptorSets(VkCommandBuffer commandBuffer,
    cmd->u.bind_descriptor_sets.dynamic_offset_count = dynamicOffsetCount;
    if (pDynamicOffsets) {
       cmd->u.bind_descriptor_sets.dynamic_offsets =
-         vk_zalloc(cmd_buffer->cmd_queue.alloc,
-                   sizeof(*cmd->u.bind_descriptor_sets.dynamic_offsets) * dynamicOffsetCount, 8,
-                   VK_SYSTEM_ALLOCATION_SCOPE_OBJECT);
+         vk_cmd_queue_zalloc(&cmd_buffer->cmd_queue,
+                             sizeof(*cmd->u.bind_descriptor_sets.dynamic_offsets) * dynamicOffsetCount);
 
       memcpy(cmd->u.bind_descriptor_sets.dynamic_offsets, pDynamicOffsets,
              sizeof(*cmd->u.bind_descriptor_sets.dynamic_offsets) * dynamicOffsetCount);
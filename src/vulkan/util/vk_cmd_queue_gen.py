@@ -69,16 +69,40 @@ TEMPLATE_H = Template(COPYRIGHT + """\
 #define VK_PROTOTYPES
 #include <vulkan/vulkan.h>
 
+#include "vk_alloc.h"
+
 #ifdef __cplusplus
 extern "C" {
 #endif
 
 struct vk_device_dispatch_table;
 
+% if arena:
+/* The entries and their payloads are bump-allocated from blocks of this
+ * size, or from a block of their own if they're too large.
+ */
+#define VK_CMD_QUEUE_BLOCK_SIZE (16 * 1024)
+
+/* Followed by size bytes of allocations */
+struct vk_cmd_queue_block {
+   struct vk_cmd_queue_block *next;
+   size_t size;
+};
+
+% endif
 struct vk_cmd_queue {
    const VkAllocationCallbacks *alloc;
    struct list_head cmds;
    VkResult error;
+% if arena:
+
+   /* The blocks in use, allocations are bumped from the first one */
+   struct vk_cmd_queue_block *blocks;
+   size_t block_offset;
+
+   /* Blocks kept by vk_cmd_queue_reset() for the next recording */
+   struct vk_cmd_queue_block *free_blocks;
+% endif
 };
 
 enum vk_cmd_type {
@@ -154,12 +178,42 @@ struct vk_cmd_queue_entry {
 
 void vk_free_queue(struct vk_cmd_queue *queue);
 
+% if arena:
+void *vk_cmd_queue_alloc_block(struct vk_cmd_queue *queue, size_t size);
+
+% endif
+/* Allocates zeroed memory for an entry of the queue or its payload, which
+ * is freed by vk_free_queue().
+ */
+static inline void *
+vk_cmd_queue_zalloc(struct vk_cmd_queue *queue, size_t size)
+{
+% if arena:
+   size = ALIGN_POT(size, 8);
+   if (queue->blocks && size <= queue->blocks->size - queue->block_offset) {
+      void *ptr = (char *)(queue->blocks + 1) + queue->block_offset;
+      queue->block_offset += size;
+      memset(ptr, 0, size);
+      return ptr;
+   }
+
+   return vk_cmd_queue_alloc_block(queue, size);
+% else:
+   return vk_zalloc(queue->alloc, size, 8, VK_SYSTEM_ALLOCATION_SCOPE_OBJECT);
+% endif
+}
+
 static inline void
 vk_cmd_queue_init(struct vk_cmd_queue *queue, VkAllocationCallbacks *alloc)
 {
    queue->alloc = alloc;
    list_inithead(&queue->cmds);
    queue->error = VK_SUCCESS;
+% if arena:
+   queue->blocks = NULL;
+   queue->block_offset = 0;
+   queue->free_blocks = NULL;
+% endif
 }
 
 static inline void
@@ -175,6 +229,13 @@ vk_cmd_queue_finish(struct vk_cmd_queue *queue)
 {
    vk_free_queue(queue);
    list_inithead(&queue->cmds);
+% if arena:
+   while (queue->free_blocks) {
+      struct vk_cmd_queue_block *next = queue->free_blocks->next;
+      vk_free(queue->alloc, queue->free_blocks);
+      queue->free_blocks = next;
+   }
+% endif
 }
 
 void vk_cmd_queue_execute(struct vk_cmd_queue *queue,
@@ -225,14 +286,17 @@ struct vk_cmd_queue_entry *cmd)
       cmd->driver_free_cb(queue, cmd);
    else
       vk_free(queue->alloc, cmd->driver_data);
+% if not arena:
 % for p in c.params[1:]:
 % if p.len:
    vk_free(queue->alloc, (${remove_suffix(p.decl.replace("const", ""), p.name)})cmd->u.${to_struct_field_name(c.name)}.${to_field_name(p.name)});
-% elif '*' in p.decl:
+% elif '*' in p.decl and (p.type != "void" or c.name in manual_commands or c.name in no_enqueue_commands):
+## The generated commands store void pointers as-is, unlike the manual ones
    ${get_struct_free(c, p, types)}
 % endif
 % endfor
    vk_free(queue->alloc, cmd);
+% endif
 }
 
 % if c.name not in manual_commands and c.name not in no_enqueue_commands:
@@ -245,9 +309,7 @@ void vk_enqueue_${to_underscore(c.name)}(struct vk_cmd_queue *queue
    if (queue->error)
       return;
 
-   struct vk_cmd_queue_entry *cmd = vk_zalloc(queue->alloc,
-                                              sizeof(*cmd), 8,
-                                              VK_SYSTEM_ALLOCATION_SCOPE_OBJECT);
+   struct vk_cmd_queue_entry *cmd = vk_cmd_queue_zalloc(queue, sizeof(*cmd));
    if (!cmd) goto err;
 
    cmd->type = ${to_enum_name(c.name)};
@@ -303,8 +365,67 @@ vk_free_queue(struct vk_cmd_queue *queue)
 % endfor
       }
    }
+% if arena:
+
+   /* Keep the blocks for the next recording, unless they were sized for a
+    * large allocation.
+    */
+   struct vk_cmd_queue_block *block = queue->blocks;
+   while (block) {
+      struct vk_cmd_queue_block *next = block->next;
+      if (block->size == VK_CMD_QUEUE_BLOCK_SIZE) {
+         block->next = queue->free_blocks;
+         queue->free_blocks = block;
+      } else {
+         vk_free(queue->alloc, block);
+      }
+      block = next;
+   }
+   queue->blocks = NULL;
+   queue->block_offset = 0;
+% endif
+}
+
+% if arena:
+void *
+vk_cmd_queue_alloc_block(struct vk_cmd_queue *queue, size_t size)
+{
+   /* Large allocations get a block of their own, so that the rest of the
+    * current block isn't wasted.  It still comes from the free blocks if it
+    * fits, or the blocks vk_free_queue() keeps would pile up when it does.
+    */
+   const bool dedicated = queue->blocks && size > VK_CMD_QUEUE_BLOCK_SIZE / 4;
+   struct vk_cmd_queue_block *block;
+
+   if (size <= VK_CMD_QUEUE_BLOCK_SIZE && queue->free_blocks) {
+      block = queue->free_blocks;
+      queue->free_blocks = block->next;
+   } else {
+      const size_t block_size = MAX2(size, VK_CMD_QUEUE_BLOCK_SIZE);
+
+      block = vk_alloc(queue->alloc, sizeof(*block) + block_size, 8,
+                       VK_SYSTEM_ALLOCATION_SCOPE_OBJECT);
+      if (!block)
+         return NULL;
+
+      block->size = block_size;
+   }
+
+   if (dedicated) {
+      block->next = queue->blocks->next;
+      queue->blocks->next = block;
+   } else {
+      block->next = queue->blocks;
+      queue->blocks = block;
+      queue->block_offset = size;
+   }
+
+   void *ptr = block + 1;
+   memset(ptr, 0, size);
+   return ptr;
 }
 
+% endif
 void
 vk_cmd_queue_execute(struct vk_cmd_queue *queue,
                      VkCommandBuffer commandBuffer,
@@ -380,6 +501,148 @@ vk_cmd_enqueue_unless_primary_${c.name}(${c.decl_params()})
 % endfor
 """, output_encoding='utf-8')
 
+TEMPLATE_BENCH = Template(COPYRIGHT + """
+/* This file generated from ${filename}, don't edit directly. */
+
+/* Measures how long recording into a vk_cmd_queue takes, and how many
+ * allocations it makes.  Every generated vk_enqueue_*() function is called
+ * once per iteration, with zeroed parameters and arrays of ${bench_count}
+ * elements.  Then vkCmdSetViewport() is called with ${bench_large_count} viewports
+ * until one of them doesn't fit in the rest of the current block, and gets
+ * a block of its own.  The queue is reset after each iteration, like a
+ * command buffer that is recorded again and again.
+ *
+ *   vk_cmd_queue_bench [iterations]
+ */
+
+#include <stdio.h>
+#include <stdlib.h>
+
+#include "${header}"
+
+#include "util/os_time.h"
+
+/* Large enough for ${bench_count} elements of any parameter */
+static uint64_t bench_data[1024];
+
+static_assert(${bench_large_count} * sizeof(VkViewport) <= sizeof(bench_data),
+              "bench_data is too small for the large command");
+
+static uint64_t bench_num_allocs;
+
+static void *VKAPI_PTR
+bench_alloc(void *user_data, size_t size, size_t align,
+            VkSystemAllocationScope scope)
+{
+   const VkAllocationCallbacks *alloc = vk_default_allocator();
+
+   bench_num_allocs++;
+   return alloc->pfnAllocation(alloc->pUserData, size, align, scope);
+}
+
+static void *VKAPI_PTR
+bench_realloc(void *user_data, void *ptr, size_t size, size_t align,
+              VkSystemAllocationScope scope)
+{
+   const VkAllocationCallbacks *alloc = vk_default_allocator();
+
+   bench_num_allocs++;
+   return alloc->pfnReallocation(alloc->pUserData, ptr, size, align, scope);
+}
+
+static void VKAPI_PTR
+bench_free(void *user_data, void *ptr)
+{
+   const VkAllocationCallbacks *alloc = vk_default_allocator();
+
+   alloc->pfnFree(alloc->pUserData, ptr);
+}
+
+static void
+bench_record(struct vk_cmd_queue *queue)
+{
+% for c in commands:
+% if c.name in manual_commands or c.name in no_enqueue_commands:
+<% continue %>
+% endif
+% if c.guard is not None:
+#ifdef ${c.guard}
+% endif
+% if len(c.params) == 1:
+   vk_enqueue_${to_underscore(c.name)}(queue);
+% else:
+   vk_enqueue_${to_underscore(c.name)}(queue,
+      ${', '.join(get_bench_arg(c, p) for p in c.params[1:])});
+% endif
+% if c.guard is not None:
+#endif // ${c.guard}
+% endif
+% endfor
+
+   for (unsigned i = 0; i < 4; i++) {
+      vk_enqueue_cmd_set_viewport(queue, 0, ${bench_large_count},
+                                  (const VkViewport *)bench_data);
+   }
+}
+
+int
+main(int argc, char **argv)
+{
+   const unsigned iterations = argc > 1 ? atoi(argv[1]) : 10000;
+   VkAllocationCallbacks alloc = {
+      .pfnAllocation = bench_alloc,
+      .pfnReallocation = bench_realloc,
+      .pfnFree = bench_free,
+   };
+   struct vk_cmd_queue queue;
+
+   vk_cmd_queue_init(&queue, &alloc);
+
+   bench_record(&queue);
+   const unsigned num_cmds = list_length(&queue.cmds);
+   vk_cmd_queue_reset(&queue);
+
+   bench_num_allocs = 0;
+   int64_t start = os_time_get_nano();
+   for (unsigned i = 0; i < iterations; i++) {
+      bench_record(&queue);
+      if (queue.error != VK_SUCCESS) {
+         fprintf(stderr, "recording failed\\n");
+         return 1;
+      }
+      vk_cmd_queue_reset(&queue);
+   }
+   int64_t elapsed = os_time_get_nano() - start;
+
+#ifdef VK_CMD_QUEUE_BLOCK_SIZE
+   unsigned num_free_blocks = 0;
+   for (struct vk_cmd_queue_block *block = queue.free_blocks; block;
+        block = block->next)
+      num_free_blocks++;
+#endif
+
+   vk_cmd_queue_finish(&queue);
+
+#ifdef VK_CMD_QUEUE_BLOCK_SIZE
+   printf("arena allocation, %u bytes blocks, %u blocks kept\\n",
+          VK_CMD_QUEUE_BLOCK_SIZE, num_free_blocks);
+#else
+   printf("allocation per entry and payload\\n");
+#endif
+   printf("%u commands, %u iterations\\n", num_cmds, iterations);
+   printf("%.1f ns per command, %.2f allocations per command\\n",
+          (double)elapsed / iterations / num_cmds,
+          (double)bench_num_allocs / iterations / num_cmds);
+   return 0;
+}
+""", output_encoding='utf-8')
+
+# The number of elements of the arrays given to the commands in the
+# recording benchmark, and of the viewports of its vkCmdSetViewport() calls,
+# 4 of which can't fit in a single block.
+BENCH_COUNT = 4
+BENCH_LARGE_COUNT = 256
+
 def remove_prefix(text, prefix):
     if text.startswith(prefix):
         return text[len(prefix):]
@@ -422,7 +685,7 @@ def get_array_copy(command, param):
         field_size = "1"
     else:
         field_size = "sizeof(*%s)" % field_name
-    allocation = "%s = vk_zalloc(queue->alloc, %s * %s, 8, VK_SYSTEM_ALLOCATION_SCOPE_OBJECT);\n   if (%s == NULL) goto err;\n" % (field_name, field_size, param.len, field_name)
+    allocation = "%s = vk_cmd_queue_zalloc(queue, %s * %s);\n   if (%s == NULL) goto err;\n" % (field_name, field_size, param.len, field_name)
     const_cast = remove_suffix(param.decl.replace("const", ""), param.name)
     copy = "memcpy((%s)%s, %s, %s * %s);" % (const_cast, field_name, param.name, field_size, param.len)
     return "%s\n   %s" % (allocation, copy)
@@ -433,7 +696,7 @@ def get_array_member_copy(struct, src_name, member):
         field_size = "sizeof(*%s)" % (field_name)
     else:
         field_size = "sizeof(*%s) * %s->%s" % (field_name, struct, member.len)
-    allocation = "%s = vk_zalloc(queue->alloc, %s, 8, VK_SYSTEM_ALLOCATION_SCOPE_OBJECT);\n   if (%s == NULL) goto err;\n" % (field_name, field_size, field_name)
+    allocation = "%s = vk_cmd_queue_zalloc(queue, %s);\n   if (%s == NULL) goto err;\n" % (field_name, field_size, field_name)
     const_cast = remove_suffix(member.decl.replace("const", ""), member.name)
     copy = "memcpy((%s)%s, %s->%s, %s);" % (const_cast, field_name, src_name, member.name, field_size)
     return "if (%s->%s) {\n   %s\n   %s\n}\n" % (src_name, member.name, allocation, copy)
@@ -463,7 +726,7 @@ def get_struct_copy(dst, src_name, src_type, size, types, level=0):
     global tmp_dst_idx
     global tmp_src_idx
 
-    allocation = "%s = vk_zalloc(queue->alloc, %s, 8, VK_SYSTEM_ALLOCATION_SCOPE_OBJECT);\n      if (%s == NULL) goto err;\n" % (dst, size, dst)
+    allocation = "%s = vk_cmd_queue_zalloc(queue, %s);\n      if (%s == NULL) goto err;\n" % (dst, size, dst)
     copy = "memcpy((void*)%s, %s, %s);" % (dst, src_name, size)
 
     level += 1
@@ -495,6 +758,15 @@ def get_struct_free(command, param, types):
                 member_frees += "vk_free(queue->alloc, (%s)%s);\n" % (const_cast, member_name)
     return "%s      %s\n" % (member_frees, struct_free)
 
+def get_bench_arg(command, param):
+    """Return the argument of param in the call to command of the recording
+    benchmark."""
+    if param.len or '*' in param.decl or '[' in param.decl:
+        return "(void *)bench_data"
+    if any(p.len == param.name for p in command.params):
+        return "(%s){%d}" % (param.type, BENCH_COUNT)
+    return "(%s){0}" % param.type
+
 EntrypointType = namedtuple('EntrypointType', 'name enum members extended_by')
 
 def get_types(doc):
@@ -545,12 +817,19 @@ def get_types_from_xml(xml_files):
 
 def main():
     parser = argparse.ArgumentParser()
-    parser.add_argument('--out-c', required=True, help='Output C file.')
-    parser.add_argument('--out-h', required=True, help='Output H file.')
+    parser.add_argument('--out-c', help='Output C file.')
+    parser.add_argument('--out-h', help='Output H file.')
+    parser.add_argument('--out-bench',
+                        help='Output C file of the recording benchmark.')
+    parser.add_argument('--arena', action='store_true',
+                        help='Bump-allocate the entries and their payloads '
+                             'from blocks freed by vk_cmd_queue_reset().')
     parser.add_argument('--xml',
                         help='Vulkan API XML file.',
                         required=True, action='append', dest='xml_files')
     args = parser.parse_args()
+    if args.out_c is None and args.out_h is None and args.out_bench is None:
+        parser.error('no output file given')
 
     commands = []
     for e in get_entrypoints_from_xml(args.xml_files):
@@ -560,10 +839,15 @@ def main():
 
     types = get_types_from_xml(args.xml_files)
 
-    assert os.path.dirname(args.out_c) == os.path.dirname(args.out_h)
+    if args.out_c is not None and args.out_h is not None:
+        assert os.path.dirname(args.out_c) == os.path.dirname(args.out_h)
 
     environment = {
-        'header': os.path.basename(args.out_h),
+        'header': 'vk_cmd_queue.h' if args.out_h is None else os.path.basename(args.out_h),
+        'arena': args.arena,
+        'bench_count': BENCH_COUNT,
+        'bench_large_count': BENCH_LARGE_COUNT,
+        'get_bench_arg': get_bench_arg,
         'commands': commands,
         'filename': os.path.basename(__file__),
         'to_underscore': to_underscore,
@@ -583,11 +867,16 @@ def main():
     }
 
     try:
-        with open(args.out_h, 'wb') as f:
-            guard = os.path.basename(args.out_h).replace('.', '_').upper()
-            f.write(TEMPLATE_H.render(guard=guard, **environment))
-        with open(args.out_c, 'wb') as f:
-            f.write(TEMPLATE_C.render(**environment))
+        if args.out_h is not None:
+            with open(args.out_h, 'wb') as f:
+                guard = os.path.basename(args.out_h).replace('.', '_').upper()
+                f.write(TEMPLATE_H.render(guard=guard, **environment))
+        if args.out_c is not None:
+            with open(args.out_c, 'wb') as f:
+                f.write(TEMPLATE_C.render(**environment))
+        if args.out_bench is not None:
+            with open(args.out_bench, 'wb') as f:
+                f.write(TEMPLATE_BENCH.render(**environment))
     except Exception:
         # In the event there's an error, this imports some helpers from mako
         # to print a useful stack trace and prints it, then exits with